@@ -4,6 +4,7 @@ import os
 from quit.conf import Feature, QuitStoreConfiguration
 from quit.exceptions import InvalidConfigurationError
 import rdflib.plugins.sparql
+import quit.tools.optimizer
 from rdflib.plugins.sparql.algebra import SequencePath
 from rdflib.plugin import register
 from rdflib.serializer import Serializer
@@ -71,6 +72,8 @@ def initialize(args):
     # To disable web access: https://github.com/RDFLib/rdflib/issues/810
     rdflib.plugins.sparql.SPARQL_LOAD_GRAPHS = False
 
+    quit.tools.optimizer.DEBUG = args['debugalgebra']
+
     register(
         'sparql', Processor,
         'quit.tools.processor', 'SPARQLProcessor')
@@ -136,6 +139,20 @@ def initialize(args):
             namespace=args['namespace'],
             oauthclientid=args['oauth_clientid'],
             oauthclientsecret=args['oauth_clientsecret'],
+            cachebudget=args['cachebudget'],
+            groupcommit=args['groupcommit'],
+            groupcommitlimit=args['groupcommitlimit'],
+            wal=args['wal'],
+            detachworktree=args['detachworktree'],
+            asyncprovenance=args['asyncprovenance'],
+            provenancestore=args['provenancestore'],
+            syncworkers=args['syncworkers'],
+            blobcache=args['blobcache'],
+            blobcachebudget=args['blobcachebudget'],
+            backgroundsync=args['backgroundsync'],
+            compactgraphs=args['compactgraphs'],
+            snapshotindex=args['snapshotindex'],
+            hdtsidecar=args['hdtsidecar'],
         )
     except InvalidConfigurationError as e:
         logger.error(e)
@@ -185,7 +202,22 @@ def getDefaults():
         'verbose': 0,
         'flask_debug': False,
         'defaultgraph_union': False,
-        'features': 0
+        'features': 0,
+        'cachebudget': None,
+        'groupcommit': None,
+        'groupcommitlimit': None,
+        'wal': None,
+        'detachworktree': False,
+        'asyncprovenance': False,
+        'provenancestore': None,
+        'syncworkers': None,
+        'blobcache': None,
+        'blobcachebudget': None,
+        'backgroundsync': False,
+        'compactgraphs': False,
+        'snapshotindex': None,
+        'hdtsidecar': None,
+        'debugalgebra': False
     }
 
 
@@ -224,6 +256,52 @@ def parseEnv():
     if 'QUIT_OAUTH_SECRET' in os.environ:
         env['oauth_clientsecret'] = os.environ['QUIT_OAUTH_SECRET']
 
+    if 'QUIT_CACHE_BUDGET' in os.environ:
+        env['cachebudget'] = os.environ['QUIT_CACHE_BUDGET']
+
+    if 'QUIT_GROUP_COMMIT' in os.environ:
+        env['groupcommit'] = os.environ['QUIT_GROUP_COMMIT']
+
+    if 'QUIT_GROUP_COMMIT_LIMIT' in os.environ:
+        env['groupcommitlimit'] = os.environ['QUIT_GROUP_COMMIT_LIMIT']
+
+    if 'QUIT_WAL' in os.environ:
+        env['wal'] = os.environ['QUIT_WAL']
+
+    if 'QUIT_DETACH_WORKTREE' in os.environ:
+        env['detachworktree'] = os.environ['QUIT_DETACH_WORKTREE'].lower() in ('1', 'true', 'yes')
+
+    if 'QUIT_ASYNC_PROVENANCE' in os.environ:
+        env['asyncprovenance'] = os.environ['QUIT_ASYNC_PROVENANCE'].lower() in (
+            '1', 'true', 'yes')
+
+    if 'QUIT_PROVENANCE_STORE' in os.environ:
+        env['provenancestore'] = os.environ['QUIT_PROVENANCE_STORE']
+
+    if 'QUIT_SYNC_WORKERS' in os.environ:
+        env['syncworkers'] = os.environ['QUIT_SYNC_WORKERS']
+
+    if 'QUIT_BLOB_CACHE' in os.environ:
+        env['blobcache'] = os.environ['QUIT_BLOB_CACHE']
+
+    if 'QUIT_BLOB_CACHE_BUDGET' in os.environ:
+        env['blobcachebudget'] = os.environ['QUIT_BLOB_CACHE_BUDGET']
+
+    if 'QUIT_BACKGROUND_SYNC' in os.environ:
+        env['backgroundsync'] = os.environ['QUIT_BACKGROUND_SYNC'].lower() in ('1', 'true', 'yes')
+
+    if 'QUIT_COMPACT_GRAPHS' in os.environ:
+        env['compactgraphs'] = os.environ['QUIT_COMPACT_GRAPHS'].lower() in ('1', 'true', 'yes')
+
+    if 'QUIT_SNAPSHOT_INDEX' in os.environ:
+        env['snapshotindex'] = os.environ['QUIT_SNAPSHOT_INDEX']
+
+    if 'QUIT_HDT_SIDECAR' in os.environ:
+        env['hdtsidecar'] = os.environ['QUIT_HDT_SIDECAR']
+
+    if 'QUIT_DEBUG_ALGEBRA' in os.environ:
+        env['debugalgebra'] = os.environ['QUIT_DEBUG_ALGEBRA'].lower() in ('1', 'true', 'yes')
+
     return env
 
 
@@ -242,6 +320,36 @@ def parseArgs(args):
     targethelp = 'The directory of the local store repository.'
     namespacehelp = """A base namespace that will be applied when dealing with relative URIs in
                     SPARQL UPDATE queries."""
+    cachebudgethelp = """Memory budget for the cache of parsed graphs, e.g. 512M or 2G. Without a
+                    budget at most 50 graphs are cached."""
+    groupcommithelp = """Write updates on the same branch which arrive within the given number of
+                    milliseconds as one commit."""
+    groupcommitlimithelp = """Maximum number of updates written as one commit. Defaults to 100."""
+    walhelp = """Path of a write-ahead log. Updates are acknowledged as soon as they are written to
+                    the log and are committed in the background."""
+    detachworktreehelp = """Do not update the working directory on commits, only write git objects
+                    and move the branch. Use /worktree/sync to update the working directory."""
+    asyncprovenancehelp = """Add the provenance of new commits to the provenance store in the
+                    background instead of before the update returns."""
+    provenancestorehelp = """Directory to keep the provenance and persistence data in. On start up
+                    only commits which are new since the last run are processed."""
+    syncworkershelp = """Number of processes which compute the provenance of commits when the
+                    history is synchronized."""
+    blobcachehelp = """Directory to keep parsed graphs in, so they are not parsed again after a
+                    restart."""
+    blobcachebudgethelp = """Size limit of the blob cache directory, e.g. 512M or 2G. Defaults to
+                    1G."""
+    backgroundsynchelp = """Synchronize the provenance and persistence data of the history in the
+                    background and answer queries on the branches meanwhile. See /ready."""
+    compactgraphshelp = """Keep parsed graphs as arrays of integer term ids, terms are shared by
+                    all graphs. Needs less memory, but adding triples is slower."""
+    snapshotindexhelp = """Directory to keep read-only snapshots of the parsed graphs in, as
+                    memory-mapped NumPy arrays which are shared by all processes. Needs NumPy."""
+    hdtsidecarhelp = """Directory to keep compressed snapshots of the graphs of each revision in.
+                    Queries on graphs which are not cached read the snapshots instead of parsing
+                    the blobs."""
+    debugalgebrahelp = """Print the algebra of each query before and after it is rewritten by the
+                    optimizer."""
 
     parser = argparse.ArgumentParser()
     parser.add_argument('-p', '--port', type=int)
@@ -257,6 +365,34 @@ def parseArgs(args):
     parser.add_argument('-v', '--verbose', action='count', default=0)
     parser.add_argument('--flask-debug', action='store_true')
     parser.add_argument('--defaultgraph-union', action='store_true')
+    parser.add_argument('--cache-budget', type=str, dest='cachebudget', help=cachebudgethelp)
+    parser.add_argument('--group-commit', type=str, dest='groupcommit', metavar='WINDOW',
+                        help=groupcommithelp)
+    parser.add_argument('--group-commit-limit', type=str, dest='groupcommitlimit',
+                        help=groupcommitlimithelp)
+    parser.add_argument('--wal', type=str, help=walhelp)
+    parser.add_argument('--detach-worktree', action='store_true', dest='detachworktree',
+                        default=None, help=detachworktreehelp)
+    parser.add_argument('--async-provenance', action='store_true', dest='asyncprovenance',
+                        default=None, help=asyncprovenancehelp)
+    parser.add_argument('--provenance-store', type=str, dest='provenancestore', metavar='PATH',
+                        help=provenancestorehelp)
+    parser.add_argument('--sync-workers', type=str, dest='syncworkers', metavar='N',
+                        help=syncworkershelp)
+    parser.add_argument('--blob-cache', type=str, dest='blobcache', metavar='PATH',
+                        help=blobcachehelp)
+    parser.add_argument('--blob-cache-budget', type=str, dest='blobcachebudget',
+                        help=blobcachebudgethelp)
+    parser.add_argument('--background-sync', action='store_true', dest='backgroundsync',
+                        default=None, help=backgroundsynchelp)
+    parser.add_argument('--compact-graphs', action='store_true', dest='compactgraphs',
+                        default=None, help=compactgraphshelp)
+    parser.add_argument('--snapshot-index', type=str, dest='snapshotindex', metavar='PATH',
+                        help=snapshotindexhelp)
+    parser.add_argument('--hdt-sidecar', type=str, dest='hdtsidecar', metavar='PATH',
+                        help=hdtsidecarhelp)
+    parser.add_argument('--debug-algebra', action='store_true', dest='debugalgebra',
+                        default=None, help=debugalgebrahelp)
     parser.add_argument('-f', '--features', nargs='*', action=FeaturesAction,
                         default=Feature.Unknown,
                         help=featurehelp)
@@ -1,12 +1,122 @@
-from collections import OrderedDict
-from sortedcontainers import SortedSet
+import logging
+import marshal
+import os
+import threading
+import zlib
+
+from array import array
+from collections import Counter, OrderedDict
+from rdflib import BNode, Graph, Literal, URIRef
+from quit.graphs import SnapshotGraph
+from quit.ntriples import parse_graph
+from quit.persistent import PersistentSortedSet
+from quit.termstore import CompactStore
+
+# Rough number of bytes a parsed triple occupies in an rdflib Memory store (terms plus the
+# spo/pos/osp index entries). Only used to estimate the cost of a cache entry.
+TRIPLE_OVERHEAD = 600
+COMPACT_TRIPLE_OVERHEAD = 40
+SNAPSHOT_TRIPLE_OVERHEAD = 36
+# Rough number of bytes a line of a FileReference occupies besides its characters.
+LINE_OVERHEAD = 100
+
+logger = logging.getLogger('quit.cache')
+
+
+def estimate_size(value):
+    """Estimate the number of bytes a cached value keeps alive.
+
+    The estimate is deliberately cheap: it only looks at lengths which are known without walking
+    the data, e.g. the number of lines of a FileReference or the number of triples of a Graph.
+    """
+    if isinstance(value, (tuple, list, set, frozenset)):
+        return 64 + sum(estimate_size(item) for item in value)
+    if isinstance(value, FileReference):
+        return value.size
+    if isinstance(value, Graph):
+        if isinstance(value, SnapshotGraph):
+            return 1024 + len(value) * SNAPSHOT_TRIPLE_OVERHEAD
+        if isinstance(value.store, CompactStore):
+            return len(value) * COMPACT_TRIPLE_OVERHEAD
+        return len(value) * TRIPLE_OVERHEAD
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    return 1024
+
+
+def encode_term(term):
+    """Convert a term into a tuple of strings which can be marshalled."""
+    if isinstance(term, Literal):
+        return ('l', str(term), term.datatype and str(term.datatype), term.language)
+    if isinstance(term, BNode):
+        return ('b', str(term))
+    return ('u', str(term))
+
+
+def decode_term(entry):
+    """Restore a term converted by encode_term()."""
+    if entry[0] == 'u':
+        return URIRef(entry[1])
+    if entry[0] == 'b':
+        return BNode(entry[1])
+    _, value, datatype, language = entry
+    return Literal(value, lang=language, datatype=URIRef(datatype) if datatype else None)
+
+
+class FrequencySketch:
+    """Keep an approximate access frequency for keys.
+
+    The counters are halved once the number of recorded accesses reaches the sample size, so
+    keys which were popular a long time ago do not stay in the cache forever.
+    """
+
+    def __init__(self, sample_size=500):
+        self.counter = Counter()
+        self.sample_size = sample_size
+        self.additions = 0
+
+    def record(self, key):
+        self.counter[key] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self.reset()
+
+    def frequency(self, key):
+        return self.counter.get(key, 0)
+
+    def reset(self):
+        self.counter = Counter(
+            {key: count // 2 for key, count in self.counter.items() if count > 1}
+        )
+        self.additions = self.additions // 2
 
 
 class Cache:
+    """A LRU cache bounded by the number of entries and optionally by a memory budget.
+
+    The cost of each entry is estimated when it is set. If the capacity or the budget is exceeded,
+    the least recently used entries are evicted. A new entry is only admitted at the expense of
+    other entries if it was requested at least as often as the entry it would evict. The cache is
+    shared by the threads of the requests, all operations hold its lock.
+    """
+
+    def __init__(self, capacity=50, budget=None, sizeof=estimate_size):
+        """Initialize a new cache.
 
-    def __init__(self, capacity=50):
+        Args:
+            capacity: maximal number of entries or None for no limit
+            budget: maximal sum of the estimated entry costs in bytes or None for no limit
+            sizeof: function to estimate the cost of a value in bytes
+        """
         self.stack = OrderedDict()
+        self.costs = {}
+        self.volume = 0
         self.capacity = capacity
+        self.budget = budget
+        self.sizeof = sizeof
+        self.sketch = FrequencySketch(10 * capacity if capacity else 500)
+        self.counters = Counter()
+        self._lock = threading.RLock()
 
     def get(self, key):
         """Get a value from the cache.
@@ -14,29 +124,117 @@ class Cache:
         Raises:
             KeyError if no value was found for the given key
         """
-        value = self.stack.pop(key)
-        self.stack[key] = value
-        return value
+        with self._lock:
+            self.sketch.record(key)
+            try:
+                value = self.stack.pop(key)
+            except KeyError:
+                self.counters['misses'] += 1
+                raise
+            self.counters['hits'] += 1
+            self.stack[key] = value
+            return value
 
-    def set(self, key, value):
-        try:
-            self.stack.pop(key)
-        except KeyError:
-            if len(self.stack) >= self.capacity:
-                self.stack.popitem(last=False)
-        self.stack[key] = value
+    def set(self, key, value, admit=False):
+        """Put a value into the cache.
+
+        Args:
+            key: the key of the value
+            value: the value to cache
+            admit: evict other entries regardless of how frequently they are requested, e.g. for
+                a value which was just created and has not been requested yet
+        Returns:
+            True if the value was admitted, False if it was rejected in favour of entries which
+            are requested more frequently or because it does not fit into the budget at all.
+        """
+        cost = self.sizeof(value)
+        with self._lock:
+            self.remove(key)
+
+            if self.budget is not None and cost > self.budget:
+                self.counters['rejections'] += 1
+                return False
+
+            victims = self._victims(cost)
+            candidate = self.sketch.frequency(key)
+            if not admit and any(self.sketch.frequency(victim) > candidate for victim in victims):
+                self.counters['rejections'] += 1
+                return False
+
+            for victim in victims:
+                self._evict(victim)
+
+            self.stack[key] = value
+            self.costs[key] = cost
+            self.volume += cost
+            return True
 
     def remove(self, key):
-        try:
-            return self.stack.pop(key)
-        except KeyError:
-            return
+        with self._lock:
+            try:
+                value = self.stack.pop(key)
+            except KeyError:
+                return
+            self.volume -= self.costs.pop(key)
+            return value
+
+    def peek(self, key):
+        """Get a value from the cache without counting it as an access.
+
+        Raises:
+            KeyError if no value was found for the given key
+        """
+        with self._lock:
+            return self.stack[key]
+
+    def _victims(self, cost):
+        """Collect the least recently used keys which have to go to make room for cost bytes."""
+        victims = []
+        count = len(self.stack)
+        volume = self.volume
+        for key in self.stack:
+            if not self._exceeds(count + 1, volume + cost):
+                break
+            victims.append(key)
+            count -= 1
+            volume -= self.costs[key]
+        return victims
+
+    def _exceeds(self, count, volume):
+        if self.capacity is not None and count > self.capacity:
+            return True
+        if self.budget is not None and volume > self.budget:
+            return True
+        return False
+
+    def _evict(self, key):
+        value = self.remove(key)
+        self.counters['evictions'] += 1
+        return value
+
+    def statistics(self):
+        """Return the hit, miss and eviction counters of the cache."""
+        with self._lock:
+            return {'hot': self._tier_statistics(self.counters, self.stack, self.volume)}
+
+    @staticmethod
+    def _tier_statistics(counters, entries, volume):
+        return {
+            'hits': counters['hits'],
+            'misses': counters['misses'],
+            'evictions': counters['evictions'],
+            'rejections': counters['rejections'],
+            'entries': len(entries),
+            'bytes': volume
+        }
 
     def __contains__(self, key):
-        return key in self.stack
+        with self._lock:
+            return key in self.stack
 
     def __iter__(self):
-        return (c for c in self.stack)
+        with self._lock:
+            return iter(list(self.stack))
 
     @property
     def size(self):
@@ -46,6 +244,325 @@ class Cache:
         return len(self.stack)
 
 
+class BlobCache(Cache):
+    """A cache for the parsed blobs of the repository organized in three tiers.
+
+    The hot tier keeps (FileReference, Graph) tuples ready to be queried. Entries evicted from the
+    hot tier are demoted to the warm tier which only keeps the zlib compressed, sorted N-Triples
+    lines of the blob. A warm entry is parsed again and promoted to the hot tier when requested.
+    Entries which are neither hot nor warm are in the cold tier and have to be read from git by
+    the caller. A quarter of the budget is reserved for the warm tier.
+    """
+
+    def __init__(self, capacity=50, budget=None, sizeof=estimate_size, graph=Graph):
+        warm_budget = budget // 4 if budget is not None else None
+        super().__init__(
+            capacity=capacity,
+            budget=budget - warm_budget if budget is not None else None,
+            sizeof=sizeof
+        )
+        self.warm = OrderedDict()
+        self.warm_budget = warm_budget
+        self.warm_capacity = 4 * capacity if capacity else None
+        self.warm_volume = 0
+        self.warm_counters = Counter()
+        self.cold_counters = Counter()
+        self.graph = graph
+
+    def get(self, key):
+        """Get a (FileReference, Graph) tuple from the hot or the warm tier.
+
+        A warm entry is parsed without holding the lock of the cache.
+
+        Raises:
+            KeyError if the blob is in the cold tier and has to be read from the repository
+        """
+        with self._lock:
+            try:
+                return super().get(key)
+            except KeyError:
+                pass
+
+            try:
+                entry = self.warm.pop(key)
+            except KeyError:
+                self.warm_counters['misses'] += 1
+                self.cold_counters['hits'] += 1
+                raise
+            self.warm_counters['hits'] += 1
+            self.warm_volume -= len(entry[2])
+
+        value = self._thaw(*entry, graph=self.graph)
+        with self._lock:
+            if not super().set(key, value):
+                self._freeze(key, value)
+        return value
+
+    def set(self, key, value, admit=False):
+        with self._lock:
+            self._remove_warm(key)
+            if super().set(key, value, admit):
+                return True
+            self._freeze(key, value)
+            return False
+
+    def remove(self, key):
+        with self._lock:
+            self._remove_warm(key)
+            return super().remove(key)
+
+    def _remove_warm(self, key):
+        entry = self.warm.pop(key, None)
+        if entry is not None:
+            self.warm_volume -= len(entry[2])
+
+    def _evict(self, key):
+        value = super()._evict(key)
+        self._freeze(key, value)
+        return value
+
+    def _freeze(self, key, value):
+        """Demote a (FileReference, Graph) tuple to the warm tier."""
+        fileReference, graph = value
+        data = zlib.compress(fileReference.content.encode('utf-8'), 1)
+
+        if self.warm_budget is not None and len(data) > self.warm_budget:
+            self.warm_counters['rejections'] += 1
+            return
+
+        self.warm[key] = (fileReference.path, graph.identifier, data)
+        self.warm_volume += len(data)
+
+        while len(self.warm) > 1 and (
+            (self.warm_capacity is not None and len(self.warm) > self.warm_capacity) or
+            (self.warm_budget is not None and self.warm_volume > self.warm_budget)
+        ):
+            _, (_, _, evicted) = self.warm.popitem(last=False)
+            self.warm_volume -= len(evicted)
+            self.warm_counters['evictions'] += 1
+
+    @staticmethod
+    def _thaw(path, identifier, data, graph=Graph):
+        """Restore a (FileReference, Graph) tuple from its warm representation."""
+        data = zlib.decompress(data)
+        context = parse_graph(data, graph=graph(identifier=identifier))
+        content = data.decode('utf-8')
+        return FileReference(path, [line for line in content.splitlines() if line]), context
+
+    def statistics(self):
+        """Return the hit, miss and eviction counters per tier."""
+        with self._lock:
+            statistics = super().statistics()
+            statistics['warm'] = self._tier_statistics(
+                self.warm_counters, self.warm, self.warm_volume)
+            statistics['cold'] = {'hits': self.cold_counters['hits']}
+            return statistics
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self.stack or key in self.warm
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self.stack) + [w for w in self.warm if w not in self.stack])
+
+
+class DiskCache:
+    """A cache for parsed blobs in a directory, which survives restarts of the store.
+
+    Blob oids are content hashes, thus an entry never becomes stale. An entry keeps the triples of
+    a blob as a table of terms and an array of term indexes, which is loaded without running the
+    N-Triples parser. Reading an entry touches its file, if the files exceed the budget the least
+    recently used entries are deleted.
+    """
+
+    MAGIC = b'QUITBLOB1\n'
+
+    def __init__(self, path, budget=None, graph=Graph):
+        """Initialize a cache in the directory path.
+
+        Args:
+            path: the directory of the cache, it is created if it does not exist
+            budget: maximal size of all entries in bytes or None for no limit
+            graph: a callable which creates an empty Graph for an identifier
+        """
+        self.path = path
+        self.budget = budget
+        self.graph = graph
+        self.volume = 0
+        self.counters = Counter()
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+        os.makedirs(path, exist_ok=True)
+        entries = []
+        for directory in os.listdir(path):
+            if not os.path.isdir(os.path.join(path, directory)):
+                continue
+            for name in os.listdir(os.path.join(path, directory)):
+                if name.endswith('.tmp'):
+                    continue
+                stat = os.stat(os.path.join(path, directory, name))
+                entries.append((stat.st_mtime, directory + name, stat.st_size))
+        for _, oid, size in sorted(entries):
+            self._entries[oid] = size
+            self.volume += size
+        self._cleanup()
+
+    def _file(self, oid):
+        return os.path.join(self.path, oid[:2], oid[2:])
+
+    def get(self, oid, identifier):
+        """Load the Graph of a blob.
+
+        Raises:
+            KeyError if the blob is not in the cache
+        """
+        with self._lock:
+            if oid not in self._entries:
+                self.counters['misses'] += 1
+                raise KeyError(oid)
+            self._entries.move_to_end(oid)
+
+        try:
+            with open(self._file(oid), 'rb') as f:
+                data = f.read()
+            os.utime(self._file(oid))
+            graph = self._decode(data, self.graph(identifier=identifier))
+        except (OSError, ValueError, EOFError, TypeError, zlib.error) as e:
+            logger.warning('Dropping damaged entry {} of the blob cache: {}'.format(oid, e))
+            self.remove(oid)
+            self.counters['misses'] += 1
+            raise KeyError(oid)
+
+        self.counters['hits'] += 1
+        return graph
+
+    def set(self, oid, graph):
+        """Store the triples of a blob."""
+        data = self._encode(graph)
+        if self.budget is not None and len(data) > self.budget:
+            self.counters['rejections'] += 1
+            return
+
+        filename = self._file(oid)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        tmp = '{}.{}.tmp'.format(filename, threading.get_ident())
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, filename)
+
+        with self._lock:
+            self.volume -= self._entries.pop(oid, 0)
+            self._entries[oid] = len(data)
+            self.volume += len(data)
+            self._cleanup()
+
+    def remove(self, oid):
+        with self._lock:
+            size = self._entries.pop(oid, None)
+            if size is None:
+                return
+            self.volume -= size
+        try:
+            os.remove(self._file(oid))
+        except FileNotFoundError:
+            pass
+
+    def _cleanup(self):
+        while self.budget is not None and self.volume > self.budget and self._entries:
+            oid, size = self._entries.popitem(last=False)
+            self.volume -= size
+            self.counters['evictions'] += 1
+            try:
+                os.remove(self._file(oid))
+            except FileNotFoundError:
+                pass
+
+    @classmethod
+    def _encode(cls, graph):
+        terms = []
+        index = {}
+        triples = array('I')
+        for triple in graph.triples((None, None, None)):
+            for term in triple:
+                position = index.get(term)
+                if position is None:
+                    position = index[term] = len(terms)
+                    terms.append(encode_term(term))
+                triples.append(position)
+        return cls.MAGIC + zlib.compress(marshal.dumps((terms, triples.tobytes())), 1)
+
+    @classmethod
+    def _decode(cls, data, graph):
+        if not data.startswith(cls.MAGIC):
+            raise ValueError('not an entry of the blob cache')
+        table, indexes = marshal.loads(zlib.decompress(data[len(cls.MAGIC):]))
+
+        terms = [decode_term(entry) for entry in table]
+
+        triples = array('I')
+        triples.frombytes(indexes)
+        graph.addN((terms[triples[i]], terms[triples[i + 1]], terms[triples[i + 2]], graph)
+                   for i in range(0, len(triples), 3))
+        return graph
+
+    def statistics(self):
+        """Return the hit, miss and eviction counters of the cache."""
+        return Cache._tier_statistics(self.counters, self._entries, self.volume)
+
+
+class SingleFlight:
+    """Make sure that a value for a key is only built once at a time.
+
+    If a call for a key is already in flight, further callers for the same key wait for it and
+    get its result (or its exception) instead of building the value again.
+    """
+
+    class _Call:
+        def __init__(self):
+            self.event = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, function):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = SingleFlight._Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+
+def _isCanonical(content):
+    """Check if all lines are separated by single spaces without surrounding whitespace."""
+    return not (
+        '  ' in content or '\t' in content or '\r' in content or ' \n' in content or
+        '\n ' in content or content.startswith(' ') or content.endswith(' ') or
+        any(c in content for c in '\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029')
+    )
+
+
 class FileReference:
     """A class that manages n-triple files.
     This class stores inforamtation about the location of a n-triple file and is
@@ -63,15 +580,26 @@ class FileReference:
         """
 
         if isinstance(content, str):
-            new = []
-            for line in content.splitlines():
-                new.append(' '.join(line.split()))
-            content = new
+            if _isCanonical(content):
+                # content written by the store is already normalized
+                content = [line for line in content.split('\n') if line]
+            else:
+                content = [' '.join(line.split()) for line in content.splitlines()]
 
         self._path = path
-        self._content = SortedSet(content)
+        self._content = PersistentSortedSet(content)
+        self._length = sum(len(line) for line in self._content)
         self._modified = False
 
+    def copy(self):
+        """Return a FileReference which shares the unchanged lines with this one."""
+        result = FileReference.__new__(FileReference)
+        result._path = self._path
+        result._content = self._content
+        result._length = self._length
+        result._modified = self._modified
+        return result
+
     @property
     def path(self):
         return self._path
@@ -80,17 +608,26 @@ class FileReference:
     def content(self):
         return "\n".join(self._content) + "\n"
 
+    @property
+    def size(self):
+        """Estimate the number of bytes held by the file content."""
+        return self._length + len(self._content) * LINE_OVERHEAD
+
     def add(self, data):
         """Add a triple to the file content."""
-        self._content.add(data)
+        content = self._content.add(data)
+        if content is not self._content:
+            self._content = content
+            self._length += len(data)
 
     def extend(self, data):
         """Add triples to the file content."""
-        self._content.extend(data)
+        for line in data:
+            self.add(line)
 
     def remove(self, data):
         """Remove trple from the file content."""
-        try:
-            self._content.remove(data)
-        except KeyError:
-            pass
+        content = self._content.discard(data)
+        if content is not self._content:
+            self._content = content
+            self._length -= len(data)
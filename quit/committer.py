@@ -0,0 +1,336 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from quit.graphs import InMemoryCopyOnEditAggregatedGraph
+from quit.wal import WriteAheadLog, serializeDelta, deserializeDelta
+
+logger = logging.getLogger('quit.committer')
+
+
+class GroupCommitter(object):
+    """Coalesce concurrent updates on the same ref into a single commit.
+
+    The first update which arrives for a ref waits until the window has passed or the limit of
+    updates is reached. Then it applies all updates which arrived in the meantime in the order of
+    their arrival to one instance and writes them as one commit. Every update returns the id of
+    the commit which contains its changes.
+    """
+
+    class _Update:
+        def __init__(self, parsedQuery, query):
+            self.parsedQuery = parsedQuery
+            self.query = query
+            self.oid = None
+            self.error = None
+            self.done = threading.Event()
+
+    def __init__(self, quit, window=0.05, limit=100):
+        self.quit = quit
+        self.window = window
+        self.limit = limit
+        self._condition = threading.Condition()
+        self._groups = {}
+        self._locks = {}
+
+    def applyQueryOnCommit(self, parsedQuery, parent_commit_ref, target_ref, query=None,
+                           default_graph=[], named_graph=[]):
+        """Apply an update query together with concurrent updates on the same ref.
+
+        Returns:
+            The id of the commit containing the changes of the update or None if nothing changed.
+        """
+        key = (parent_commit_ref, target_ref, tuple(default_graph), tuple(named_graph))
+        update = GroupCommitter._Update(parsedQuery, query)
+
+        with self._condition:
+            group = self._groups.get(key)
+            leader = group is None
+            if leader:
+                group = self._groups[key] = []
+            group.append(update)
+            if len(group) >= self.limit:
+                self._condition.notify_all()
+
+        if leader:
+            with self._condition:
+                self._condition.wait_for(lambda: len(group) >= self.limit, timeout=self.window)
+                del self._groups[key]
+            try:
+                with self._lock(target_ref):
+                    self._commit(group, parent_commit_ref, target_ref, default_graph, named_graph)
+            finally:
+                for member in group:
+                    member.done.set()
+        else:
+            update.done.wait()
+
+        if update.error is not None:
+            raise update.error
+        return update.oid
+
+    def _lock(self, target_ref):
+        with self._condition:
+            return self._locks.setdefault(target_ref, threading.Lock())
+
+    def _commit(self, group, parent_commit_ref, target_ref, default_graph, named_graph):
+        pending = list(group)
+
+        while pending:
+            graph, _ = self.quit.instance(parent_commit_ref)
+            applied = []
+            delta = []
+
+            while pending:
+                update = pending.pop(0)
+                try:
+                    resultingChanges, exception = graph.update(update.parsedQuery)
+                except Exception as e:
+                    # The instance might be changed partially, so the updates applied so far are
+                    # committed and the remaining updates are applied to a new instance
+                    update.error = e
+                    update.done.set()
+                    break
+                applied.append(update)
+                delta.extend(resultingChanges)
+                update.error = exception
+
+            if not applied:
+                continue
+
+            try:
+                oid = self.quit.commit(
+                    graph, delta, 'New Commit from QuitStore', parent_commit_ref, target_ref,
+                    query=' ;\n'.join(update.query for update in applied if update.query),
+                    default_graph=default_graph, named_graph=named_graph)
+            except Exception as e:
+                logger.exception(e)
+                oid = None
+                for update in applied:
+                    update.error = e
+
+            logger.debug('Committed {} updates as {}'.format(len(applied), oid))
+            for update in applied:
+                update.oid = oid
+                update.done.set()
+
+    def head(self, reference):
+        """Group commits are written before the updates return, there is no pending head."""
+        return None
+
+    def commitOf(self, sequence, timeout=None):
+        """Group commits return commit ids, there are no sequence numbers to look up."""
+        raise KeyError(sequence)
+
+    def flush(self):
+        """Group commits are written before the updates return, there is nothing to flush."""
+
+
+class AsyncCommitter(object):
+    """Acknowledge updates once they are in a write-ahead log and commit them in the background.
+
+    An update is applied to an in-memory head of its branch and its delta is appended to the
+    write-ahead log. A background worker writes the logged updates as commits in their order.
+    Queries on the branch are answered from the head until all its updates are committed.
+    Updates which are still in the log on start up are committed before the committer is ready.
+
+    If writing a commit fails, the worker keeps the update at the head of the log and retries it
+    with a growing delay, error holds the failure in the meantime. The ids of the recent commits
+    are kept per sequence number, thus a client can look up the commit of its update.
+    """
+
+    # the delay of the first retry of a failed commit in seconds, it doubles up to RETRY_MAX
+    RETRY_DELAY = 1
+    RETRY_MAX = 60
+    # the number of sequence numbers for which the commit id is kept
+    SEQUENCES = 10000
+
+    def __init__(self, quit, path):
+        self.quit = quit
+        self.log = WriteAheadLog(path)
+        self.error = None
+        self._lock = threading.Lock()
+        self._condition = threading.Condition()
+        self._queue = deque()
+        self._heads = {}
+        self._commits = OrderedDict()
+
+        for entry in self.log.entries():
+            logger.info('Replaying update {} of the write-ahead log'.format(entry['sequence']))
+            # the update might be committed already if the process stopped before the checkpoint
+            self._materialize(entry, recover=True)
+
+        self._worker = threading.Thread(target=self._run, name='quit-wal', daemon=True)
+        self._worker.start()
+
+    def applyQueryOnCommit(self, parsedQuery, parent_commit_ref, target_ref, query=None,
+                           default_graph=[], named_graph=[]):
+        """Apply an update query on the head of the target branch and log it.
+
+        Updates which do not continue the target branch, e.g. updates on a certain commit, are
+        committed synchronously after all logged updates are committed.
+
+        Returns:
+            The sequence number of the logged update, the id of the commit if the update was
+            committed synchronously or None if nothing changed.
+        """
+        if self.error is not None:
+            raise self.error
+
+        if parent_commit_ref is None or _ref(parent_commit_ref) != target_ref:
+            self.flush()
+            return self.quit._applyQueryOnCommit(
+                parsedQuery, parent_commit_ref, target_ref, query=query,
+                default_graph=default_graph, named_graph=named_graph)
+
+        with self._lock:
+            head = self.head(target_ref)
+            if head is None:
+                graph, _ = self.quit.instance(parent_commit_ref)
+                graph = graph.store
+            else:
+                graph = InMemoryCopyOnEditAggregatedGraph(
+                    graphs=head.contexts(), identifier='default')
+
+            resultingChanges, exception = graph.update(parsedQuery)
+
+            sequence = None
+            if not self.quit._isDeltaEmpty(resultingChanges):
+                entry = {
+                    'ref': target_ref,
+                    'query': query,
+                    'default_graph': default_graph,
+                    'named_graph': named_graph,
+                    'delta': serializeDelta(resultingChanges)
+                }
+                sequence = self.log.append(entry)
+                entry['sequence'] = sequence
+                with self._condition:
+                    self._heads[target_ref] = (graph, sequence)
+                    self._queue.append(entry)
+                    self._condition.notify_all()
+
+        if exception:
+            raise exception
+        return sequence
+
+    def head(self, reference):
+        """Return the in-memory head of a branch if it has updates which are not committed yet."""
+        with self._condition:
+            head = self._heads.get(_ref(reference))
+        return head[0] if head else None
+
+    @property
+    def pending(self):
+        """The number of logged updates which are not committed yet."""
+        with self._condition:
+            return len(self._queue)
+
+    def commitOf(self, sequence, timeout=None):
+        """Return the id of the commit which contains a logged update.
+
+        Args:
+            sequence: the sequence number returned for the update
+            timeout: the number of seconds to wait for the commit or None to wait until it exists
+        Returns:
+            The id of the commit or None if the update was not committed before the timeout.
+        Raises:
+            KeyError: if the sequence number was not handed out or its commit is forgotten
+        """
+        with self._condition:
+            if sequence < 1 or sequence > self.log.sequence:
+                raise KeyError(sequence)
+            self._condition.wait_for(
+                lambda: sequence in self._commits or sequence <= self.log.checkpointed,
+                timeout=timeout)
+            if sequence in self._commits:
+                return self._commits[sequence]
+            if sequence <= self.log.checkpointed:
+                raise KeyError(sequence)
+            return None
+
+    def flush(self):
+        """Wait until all logged updates are committed."""
+        with self._condition:
+            self._condition.wait_for(lambda: not self._queue or self.error is not None)
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        failures = 0
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queue)
+                entry = self._queue[0]
+
+            try:
+                # a failed attempt might have written the commit before it failed
+                self._materialize(entry, recover=failures > 0)
+            except Exception as e:
+                logger.exception(e)
+                failures += 1
+                with self._condition:
+                    self.error = e
+                    self._condition.notify_all()
+                delay = min(self.RETRY_DELAY * 2 ** (failures - 1), self.RETRY_MAX)
+                logger.warning('Retrying update {} of the write-ahead log in {}s'.format(
+                    entry['sequence'], delay))
+                time.sleep(delay)
+                continue
+
+            failures = 0
+            with self._condition:
+                self.error = None
+                self._queue.popleft()
+                if self._heads.get(entry['ref'], (None, None))[1] == entry['sequence']:
+                    del self._heads[entry['ref']]
+                self._condition.notify_all()
+
+    def _materialize(self, entry, recover=False):
+        """Commit a logged update on the current head of its branch.
+
+        Args:
+            entry: the entry of the write-ahead log
+            recover: True if the update might be committed already, it is only committed if it
+                still changes the head
+        Returns:
+            The id of the commit which contains the update
+        """
+        graph, head = self.quit.instance(entry['ref'])
+        delta = deserializeDelta(entry['delta'])
+
+        if recover and not self.quit._graphChanges(delta, graph.store.get_context):
+            logger.info('Update {} of the write-ahead log is already committed'.format(
+                entry['sequence']))
+            oid = head
+        else:
+            for change in delta:
+                for identifier, changeset in change['delta'].items():
+                    context = graph.store.get_context(identifier)
+                    for (op, triples) in changeset:
+                        if op == 'additions':
+                            context += triples
+                        elif op == 'removals':
+                            context -= triples
+
+            oid = self.quit.commit(
+                graph, delta, 'New Commit from QuitStore', entry['ref'], entry['ref'],
+                query=entry['query'], default_graph=entry['default_graph'],
+                named_graph=entry['named_graph']) or head
+            logger.debug('Committed update {} of the write-ahead log as {}'.format(
+                entry['sequence'], oid))
+
+        with self._condition:
+            self._commits[entry['sequence']] = oid
+            while len(self._commits) > self.SEQUENCES:
+                self._commits.popitem(last=False)
+        self.log.checkpoint(entry['sequence'])
+        with self._condition:
+            self._condition.notify_all()
+        return oid
+
+
+def _ref(reference):
+    if reference.startswith('refs/'):
+        return reference
+    return 'refs/heads/' + reference
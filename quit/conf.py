@@ -4,7 +4,9 @@ from pygit2 import GIT_OBJ_BLOB, GIT_OBJ_TREE
 from os.path import join, isfile
 from quit.exceptions import InvalidConfigurationError
 from quit.exceptions import UnknownConfigurationError
+from quit import snapshot
 from quit.helpers import isAbsoluteUri
+from quit.utils import parse_size
 from rdflib import Graph, Literal, Namespace, URIRef
 from rdflib.plugins.parsers import notation3
 from rdflib.namespace import RDF, NamespaceManager
@@ -38,7 +40,21 @@ class QuitStoreConfiguration():
         targetdir=None,
         namespace=None,
         oauthclientid=None,
-        oauthclientsecret=None
+        oauthclientsecret=None,
+        cachebudget=None,
+        groupcommit=None,
+        groupcommitlimit=None,
+        wal=None,
+        detachworktree=False,
+        asyncprovenance=False,
+        provenancestore=None,
+        syncworkers=None,
+        blobcache=None,
+        blobcachebudget=None,
+        backgroundsync=False,
+        compactgraphs=False,
+        snapshotindex=None,
+        hdtsidecar=None
     ):
         """Initialize store configuration.
 
@@ -56,6 +72,20 @@ class QuitStoreConfiguration():
         self.namespace = None
         self.oauthclientid = oauthclientid
         self.oauthclientsecret = oauthclientsecret
+        self.cachebudget = None
+        self.groupcommitwindow = None
+        self.groupcommitlimit = 100
+        self.wal = wal
+        self.detachworktree = detachworktree
+        self.asyncprovenance = asyncprovenance
+        self.provenancestore = provenancestore
+        self.syncworkers = None
+        self.blobcache = blobcache
+        self.blobcachebudget = 1 << 30
+        self.backgroundsync = backgroundsync
+        self.compactgraphs = compactgraphs
+        self.snapshotindex = snapshotindex
+        self.hdtsidecar = hdtsidecar
 
         self.nsMngrSysconf = NamespaceManager(self.sysconf)
         self.nsMngrSysconf.bind('', self.quit, override=False)
@@ -66,6 +96,53 @@ class QuitStoreConfiguration():
             targetdir=targetdir,
             configfile=configfile)
 
+        if cachebudget:
+            try:
+                self.cachebudget = parse_size(cachebudget)
+            except ValueError:
+                raise InvalidConfigurationError(
+                    "Quit expects a cache budget like 512M or 2G, {} is not valid.".format(
+                        cachebudget))
+
+        if groupcommit is not None:
+            try:
+                self.groupcommitwindow = float(groupcommit) / 1000
+                if groupcommitlimit is not None:
+                    self.groupcommitlimit = int(groupcommitlimit)
+            except ValueError:
+                raise InvalidConfigurationError(
+                    "Quit expects the group commit window in milliseconds and the limit as "
+                    "number of updates, {} and {} are not valid.".format(
+                        groupcommit, groupcommitlimit))
+            if self.groupcommitwindow < 0 or self.groupcommitlimit < 1:
+                raise InvalidConfigurationError(
+                    "The group commit window must not be negative and the limit must be positive.")
+            if wal:
+                raise InvalidConfigurationError(
+                    "Group commit and the write-ahead log can not be used together.")
+
+        if syncworkers is not None:
+            try:
+                self.syncworkers = int(syncworkers)
+            except ValueError:
+                raise InvalidConfigurationError(
+                    "Quit expects the number of sync workers as number, {} is not valid.".format(
+                        syncworkers))
+            if self.syncworkers < 1:
+                raise InvalidConfigurationError("The number of sync workers must be positive.")
+
+        if blobcachebudget:
+            try:
+                self.blobcachebudget = parse_size(blobcachebudget)
+            except ValueError:
+                raise InvalidConfigurationError(
+                    "Quit expects a blob cache budget like 512M or 2G, {} is not valid.".format(
+                        blobcachebudget))
+
+        if snapshotindex and snapshot.numpy is None:
+            raise InvalidConfigurationError(
+                "The snapshot index needs NumPy, install it with pip install numpy.")
+
     def __initstoreconfig(self, namespace, upstream, targetdir, configfile):
         """Initialize store settings."""
         if isAbsoluteUri(namespace):
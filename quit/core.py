@@ -1,23 +1,47 @@
 import pygit2
 
+import json
 import logging
+import multiprocessing
+import os
+import threading
 
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
 from copy import copy
+from itertools import islice
+from functools import partial
 
 from rdflib import Graph, ConjunctiveGraph, BNode, Literal, URIRef
+from rdflib.plugins.serializers.nquads import _nq_row
+from rdflib.plugins.serializers.nt import _nt_row
 import re
 
 from quit.conf import Feature, QuitGraphConfiguration
+from quit.exceptions import RevisionNotFound
+from quit.git import Repository, Revision
 from quit.helpers import applyChangeset
 from quit.namespace import RDFS, FOAF, XSD, PROV, QUIT, is_a
-from quit.graphs import RewriteGraph, InMemoryAggregatedGraph
+from quit.graphs import RewriteGraph, InMemoryAggregatedGraph, InMemoryCopyOnEditAggregatedGraph
+from quit.graphs import LazyGraph, OverlayGraph, SnapshotGraph
 from quit.utils import graphdiff, git_timestamp, iri_to_name
-from quit.cache import Cache, FileReference
+from quit.ntriples import parse_graph, parse_triples
+from quit.snapshot import SnapshotIndex, SnapshotStore
+from quit.hdt import HDTStore
+from quit.statistics import GraphStatistics, StatisticsCatalog, graphStatistics
+from quit.termstore import compact_graph
+from quit.cache import BlobCache, Cache, DiskCache, FileReference, SingleFlight
+from quit.committer import AsyncCommitter, GroupCommitter
+from quit.provenance import ProvenanceIndexer
 
 import subprocess
 
 logger = logging.getLogger('quit.core')
 
+# the versions of a graph are overlays on top of the last parsed version, once they add and remove
+# more triples they are folded into a new graph
+OVERLAY_FOLD_TRIPLES = 10000
+
 
 class Queryable:
     """A class that represents a querable graph-like object."""
@@ -57,9 +81,28 @@ class Store(Queryable):
     def __init__(self, store):
         """Initialize a new Store instance."""
         self.store = store
+        self.refs = {}
+        self.features = None
+        self.consistent = True
 
         return
 
+    def addQuads(self, quads):
+        """Add (s, p, o, context identifier) quads to the store."""
+        self.store.addN((s, p, o, Graph(self.store.store, c)) for s, p, o, c in quads)
+
+    def setSynced(self, refs, features):
+        """Record the last commit synchronized for every ref and the features of the data."""
+        self.refs = dict(refs)
+        self.features = features
+
+    def clear(self):
+        """Remove all data from the store."""
+        self.store.remove((None, None, None, None))
+        self.refs = {}
+        self.features = None
+        self.consistent = True
+
 
 class MemoryStore(Store):
     def __init__(self, additional_bindings=list()):
@@ -72,6 +115,88 @@ class MemoryStore(Store):
         super().__init__(store=store)
 
 
+class PersistentStore(MemoryStore):
+    """A store which keeps its data in a directory to survive restarts.
+
+    The quads of every synchronized commit are appended to an N-Quads journal which is loaded on
+    start up. A state file records the length of the journal, the features the data was built
+    with and the last commit synchronized for every ref. Quads which were written to the journal
+    but are not covered by the state file are discarded, if the journal is shorter than recorded
+    the store is marked as inconsistent.
+    """
+
+    def __init__(self, path, additional_bindings=list()):
+        super().__init__(additional_bindings)
+        self.path = path
+        self._journalPath = os.path.join(path, 'journal.nq')
+        self._statePath = os.path.join(path, 'state.json')
+        os.makedirs(path, exist_ok=True)
+
+        state = self._readState()
+        self.refs = state.get('refs', {})
+        self.features = state.get('features')
+        self.consistent = self._load(state.get('journal', 0))
+        self._journal = open(self._journalPath, 'ab')
+
+    def _readState(self):
+        try:
+            with open(self._statePath, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logger.warning('The state of the provenance store is damaged')
+            return {'journal': -1}
+
+    def _load(self, length):
+        try:
+            size = os.path.getsize(self._journalPath)
+        except FileNotFoundError:
+            size = 0
+        if length < 0 or size < length:
+            return False
+        if size > length:
+            # quads of a commit which was not completely synchronized before a crash
+            with open(self._journalPath, 'r+b') as f:
+                f.truncate(length)
+        if length > 0:
+            with open(self._journalPath, 'rb') as f:
+                self.store.parse(data=f.read().decode('utf-8'), format='nquads',
+                                 publicID=self.store.default_context.identifier)
+        return True
+
+    def _writeState(self):
+        state = {'refs': self.refs, 'features': self.features, 'journal': self._journal.tell()}
+        tmp = self._statePath + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._statePath)
+
+    def addQuads(self, quads):
+        quads = list(quads)
+        default = self.store.default_context.identifier
+        rows = (_nt_row((s, p, o)) if c == default else _nq_row((s, p, o), c)
+                for s, p, o, c in quads)
+        self._journal.write(''.join(rows).encode('utf-8'))
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        # the quads of the commit are only valid once the state covers them
+        self._writeState()
+        super().addQuads(quads)
+
+    def setSynced(self, refs, features):
+        super().setSynced(refs, features)
+        self._writeState()
+
+    def clear(self):
+        super().clear()
+        self._journal.truncate(0)
+        self._journal.seek(0)
+        self._writeState()
+
+
 class VirtualGraph(Queryable):
     def __init__(self, store):
         if not isinstance(store, InMemoryAggregatedGraph):
@@ -94,15 +219,64 @@ class Quit(object):
         self.config = config
         self.repository = repository
         self.store = store
+        budget = config.cachebudget if config else None
         self._commits = Cache()
-        self._blobs = Cache()
+        self._graph = compact_graph if config and config.compactgraphs else Graph
+        if budget:
+            self._blobs = BlobCache(capacity=None, budget=budget, graph=self._graph)
+        else:
+            self._blobs = BlobCache(graph=self._graph)
         self._graphconfigs = Cache()
+        # the cached datasets hand out unloaded graphs, parsed graphs are only kept by _blobs
+        self._instances = Cache(capacity=10, sizeof=len)
+        self._loading = SingleFlight()
+        self.statistics = StatisticsCatalog()
+        self._parsedBlobs = None
+        if config and config.blobcache:
+            self._parsedBlobs = DiskCache(
+                config.blobcache, config.blobcachebudget, graph=self._graph)
+            # the statistics of the blobs are kept next to the cache, they are small and survive
+            # evictions of the parsed blobs
+            self.statistics = StatisticsCatalog(
+                path=config.blobcache.rstrip(os.sep) + '.statistics')
+        self._snapshots = None
+        if config and config.snapshotindex:
+            self._snapshots = SnapshotStore(config.snapshotindex)
+        self._sidecar = None
+        if config and config.hdtsidecar:
+            self._sidecar = HDTStore(config.hdtsidecar)
+        self.storeLock = threading.RLock()
+        self._synced = None
+        self._initialSync = threading.Event()
+        self.syncProgress = {'done': 0, 'total': 0}
+        self.syncError = None
+        self.indexer = None
+        if config and config.asyncprovenance:
+            self.indexer = ProvenanceIndexer(self)
+        self._committer = None
+        if config and config.groupcommitwindow is not None:
+            self._committer = GroupCommitter(
+                self, config.groupcommitwindow, config.groupcommitlimit)
+        elif config and config.wal:
+            self._committer = AsyncCommitter(self, config.wal)
 
     def _exists(self, cid):
-        uri = QUIT['commit-' + cid]
-        for _ in self.store.store.quads((uri, None, None, QUIT.default)):
-            return True
-        return False
+        if self._synced is None:
+            with self.storeLock:
+                if self._synced is None:
+                    self._synced = self._syncedCommits()
+        return cid in self._synced
+
+    def _syncedCommits(self):
+        """Collect the ids of all commits in the store with a single pass."""
+        prefix = str(QUIT['commit-'])
+        default = self.store.store.default_context
+        synced = set()
+        for commit in default.objects(None, PROV['wasGeneratedBy']):
+            synced.add(str(commit)[len(prefix):])
+        for cid in default.objects(None, QUIT['hex']):
+            synced.add(str(cid))
+        return synced
 
     def getDefaultBranch(self):
         """Get the default branch for the Git repository which should be used in the application.
@@ -128,55 +302,174 @@ class Quit(object):
         return "master"
 
     def rebuild(self):
-        for context in self.store.contexts():
-            self.store.remove((None, None, None), context)
+        self.store.clear()
+        self._synced = set()
         self.syncAll()
 
+    def _storeFeatures(self):
+        return self.config.features & (Feature.Provenance | Feature.Persistence)
+
+    def isStoreConsistent(self):
+        """Check if the data of the store can be continued from the repository.
+
+        The store is inconsistent if its data is damaged, was built with other features or if a
+        ref was moved to a commit which does not descend from the last synchronized commit, e.g.
+        after a force push.
+        """
+        if not self.store.consistent:
+            return False
+        if not self.store.refs:
+            return True
+        if self.store.features != self._storeFeatures():
+            return False
+
+        repository = self.repository._repository
+        for ref, cid in self.store.refs.items():
+            if repository.get(cid) is None:
+                return False
+            try:
+                head = self.repository.revision(ref)
+            except RevisionNotFound:
+                continue
+            if head.id != cid and not repository.descendant_of(head.id, cid):
+                return False
+        return True
+
     def syncAll(self):
-        """Synchronize store with repository data."""
-        def traverse(commit, seen):
-            commits = []
-            merges = []
-
-            while True:
-                id = commit.id
-                if id in seen:
-                    break
-                seen.add(id)
-                if self._exists(id):
-                    break
-                commits.append(commit)
-                parents = commit.parents
-                if not parents:
-                    break
-                commit = parents[0]
-                if len(parents) > 1:
-                    merges.append((len(commits), parents[1:]))
-            for idx, parents in reversed(merges):
-                for parent in parents:
-                    commits[idx:idx] = traverse(parent, seen)
-            return commits
-
-        seen = set()
+        """Synchronize store with repository data.
+
+        Only commits which are not in the store are synchronized. If the store does not match the
+        repository it is rebuilt.
+        """
+        if not self.isStoreConsistent():
+            logger.info('The store does not match the repository, rebuilding it')
+            self.rebuild()
+            return
 
+        self.syncProgress = {'done': 0, 'total': 0}
+
+        repository = self.repository._repository
+        walker = repository.walk(None, pygit2.GIT_SORT_TOPOLOGICAL | pygit2.GIT_SORT_REVERSE)
         for name in self.repository.tags_or_branches:
-            initial_commit = self.repository.revision(name)
-            commits = traverse(initial_commit, seen)
+            walker.push(pygit2.Oid(hex=self.repository.revision(name).id))
+        # the history of the last synchronized commits is complete in the store
+        for cid in self.store.refs.values():
+            walker.hide(pygit2.Oid(hex=cid))
+
+        commits = [commit for commit in walker if not self._exists(commit.hex)]
+        self.syncProgress = {'done': 0, 'total': len(commits)}
+
+        if self.config.syncworkers and len(commits) > 1:
+            self._syncParallel([commit.hex for commit in commits], self.config.syncworkers)
+        else:
+            for commit in commits:
+                self.syncSingle(Revision(self.repository, commit))
+                self.syncProgress['done'] += 1
+
+        with self.storeLock:
+            self.store.setSynced(
+                {name: self.repository.revision(name).id
+                 for name in self.repository.tags_or_branches},
+                self._storeFeatures())
+        self._initialSync.set()
+
+    def syncAllInBackground(self):
+        """Synchronize the store with the repository in a background thread.
+
+        Queries on the branches are answered from the blobs in the meantime, use waitForSync() to
+        wait for the provenance and persistence data of the history.
+        """
+        def run():
+            try:
+                self.syncAll()
+            except Exception as e:
+                logger.exception(e)
+                self.syncError = e
+                self._initialSync.set()
+
+        thread = threading.Thread(target=run, name='quit-sync', daemon=True)
+        thread.start()
+        return thread
+
+    def waitForSync(self, timeout=None):
+        """Block until the history is synchronized with the store.
 
-            while commits:
-                commit = commits.pop()
-                self.syncSingle(commit)
+        Returns:
+            True if the store is synchronized, False if the timeout expired before.
+        Raises:
+            The exception which stopped the synchronization
+        """
+        synced = self._initialSync.wait(timeout)
+        if self.syncError is not None:
+            raise self.syncError
+        return synced
+
+    @property
+    def isSynced(self):
+        """True if the history was synchronized with the store once."""
+        return self._initialSync.is_set() and self.syncError is None
+
+    def _syncParallel(self, commits, workers):
+        """Compute the changesets of commits in worker processes and add them in their order.
+
+        The changesets of different commits are independent, thus they are computed by a pool of
+        processes with their own repository and caches. The results are added to the store by
+        this process in the order of the commits, i.e. parents before their children.
+        """
+        config = copy(self.config)
+        # workers must not replay the write-ahead log or start background threads
+        config.groupcommitwindow = None
+        config.wal = None
+        config.asyncprovenance = False
+
+        logger.info('Synchronizing {} commits with {} processes'.format(len(commits), workers))
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_initSyncWorker,
+                                 initargs=(config, self.repository.path)) as executor:
+            pending = deque()
+            remaining = iter(commits)
+            # keep a bounded number of commits in flight to stream the results
+            for cid in islice(remaining, workers * 4):
+                pending.append((cid, executor.submit(_syncWorker, cid)))
+            while pending:
+                cid, future = pending.popleft()
+                quads = future.result()
+                with self.storeLock:
+                    if not self._exists(cid):
+                        if quads:
+                            self.store.addQuads(quads)
+                        self._synced.add(cid)
+                self.syncProgress['done'] += 1
+                for cid in islice(remaining, 1):
+                    pending.append((cid, executor.submit(_syncWorker, cid)))
+
+    def syncSingle(self, commit, delta=None):
+        with self.storeLock:
+            if not self._exists(commit.id):
+                self.changeset(commit, delta)
+                self._synced.add(commit.id)
+
+    def waitForProvenance(self, timeout=None):
+        """Block until the provenance of all commits is in the store.
 
-    def syncSingle(self, commit):
-        if not self._exists(commit.id):
-            self.changeset(commit)
+        Returns:
+            True if the provenance is complete, False if the timeout expired before.
+        """
+        if self.indexer is None:
+            return True
+        return self.indexer.wait(timeout)
 
-    def instance(self, reference, force=False):
+    def instance(self, reference, force=False, graphs=None):
         """Create and return dataset for a given commit id.
 
+        The graphs of the dataset are only parsed when they are accessed for the first time.
+        Modifications of the dataset are recorded in overlays and do not touch the cached graphs.
+
         Args:
             reference: commit id or reference of the commit to retrieve
             force: force to get the dataset from the git repository instead of the internal cache
+            graphs: a set of graph IRIs to restrict the dataset to or None to get all graphs
         Returns:
             Instance of VirtualGraph representing the respective dataset
         """
@@ -186,40 +479,118 @@ class Quit(object):
         if reference:
             commit = self.repository.revision(reference)
             commitid = commit.id
+            default_graphs = self._assembleGraphs(commit, force, graphs)
 
-            for blob in self.getFilesForCommit(commit):
-                try:
-                    (name, oid) = blob
-                    (f, context) = self.getFileReferenceAndContext(blob, commit)
-                    internal_identifier = context.identifier + '-' + str(oid)
-
-                    if force or not self.config.hasFeature(Feature.Persistence):
-                        g = context
-                    else:
-                        g = RewriteGraph(
-                            self.store.store.store,
-                            internal_identifier,
-                            context.identifier
-                        )
-                    default_graphs.append(g)
-                except KeyError:
-                    pass
+        instance = InMemoryCopyOnEditAggregatedGraph(
+            graphs=default_graphs, identifier='default')
+
+        return VirtualGraph(instance), commitid
+
+    def cachedInstance(self, reference, graphs=None):
+        """Return a dataset for a given commit id to be used for read-only queries.
+
+        Commits are immutable, thus the graphs of a commit are assembled only once and shared
+        between requests. If several requests need the same commit at once, only one of them
+        assembles the graphs while the others wait for it. Each request gets graphs which are not
+        loaded yet, a parsed graph is kept by the blob cache within its budget and not by the
+        shared dataset. Use instance() to get a dataset which can be updated.
+
+        Args:
+            reference: commit id or reference of the commit to retrieve
+            graphs: a set of graph IRIs to restrict the dataset to or None to get all graphs
+        Returns:
+            Instance of VirtualGraph representing the respective dataset
+        """
+        if not reference:
+            return self.instance(reference, graphs=graphs)
+
+        head = self._committer.head(reference) if self._committer is not None else None
+        if head is not None:
+            # updates on the branch are not committed yet
+            default_graphs = [g for g in head.contexts()
+                              if graphs is None or g.identifier in graphs]
+            instance = InMemoryAggregatedGraph(graphs=default_graphs, identifier='default')
+            return VirtualGraph(instance), None
+
+        commit = self.repository.revision(reference)
+
+        try:
+            blobs, default_graphs = self._instances.get(commit.id)
+        except KeyError:
+            blobs, default_graphs = self._loading.do(
+                commit.id, partial(self._cacheGraphs, commit))
+
+        default_graphs = [g.unloaded() if isinstance(g, LazyGraph) else g for g in default_graphs
+                          if graphs is None or g.identifier in graphs]
 
         instance = InMemoryAggregatedGraph(
             graphs=default_graphs, identifier='default')
 
-        return VirtualGraph(instance), commitid
+        return VirtualGraph(instance), commit.id
+
+    def _cacheGraphs(self, commit):
+        entry = (frozenset(self.getFilesForCommit(commit)), self._assembleGraphs(commit))
+        self._instances.set(commit.id, entry)
+        return entry
+
+    def _assembleGraphs(self, commit, force=False, graphs=None):
+        default_graphs = []
+        graphconfig = self.getGraphConfig(commit.id)
+
+        for blob in self.getFilesForCommit(commit):
+            try:
+                (name, oid) = blob
+                identifier = URIRef(graphconfig.getgraphuriforfile(name))
+                if graphs is not None and identifier not in graphs:
+                    continue
+                internal_identifier = identifier + '-' + str(oid)
 
-    def changeset(self, commit):
+                if (
+                    force or not self.config.hasFeature(Feature.Persistence) or
+                    not self._exists(commit.id)
+                ):
+                    # the persisted graphs are not in the store before the commit is synchronized
+                    g = LazyGraph(identifier, partial(self.getContext, blob, commit))
+                    # the query planner does not need to load the graph
+                    g.statistics = self._knownStatistics(oid)
+                else:
+                    g = RewriteGraph(
+                        self.store.store.store,
+                        internal_identifier,
+                        identifier
+                    )
+                default_graphs.append(g)
+            except KeyError:
+                pass
+        return default_graphs
+
+    def changeset(self, commit, delta=None):
+        """Add provenance and persistence data of a commit to the store.
+
+        Args:
+            commit: the commit to add
+            delta: the changes of the commit per graph as returned by graphdiff(), if it is
+                not given the changes are computed from the commit and its first parent
+        """
+        quads = self.changesetQuads(commit, delta)
+        if quads:
+            self.store.addQuads(quads)
+
+    def changesetQuads(self, commit, delta=None):
+        """Compute the provenance and persistence data of a commit without adding it.
+
+        Returns:
+            A list of (s, p, o, context identifier) quads
+        """
 
         if (
             not self.config.hasFeature(Feature.Persistence)
         ) and (
             not self.config.hasFeature(Feature.Provenance)
         ):
-            return
+            return []
 
-        g = self.store.store
+        g = ConjunctiveGraph(identifier=self.store.store.default_context.identifier)
 
         if self.config.hasFeature(Feature.Provenance):
             role_author_uri = QUIT['Author']
@@ -228,9 +599,6 @@ class Quit(object):
             g.add((role_author_uri, is_a, PROV['Role']))
             g.add((role_committer_uri, is_a, PROV['Role']))
 
-        # Create the commit
-        i1, commitid = self.instance(commit.id, True)
-
         commit_uri = QUIT['commit-' + commit.id]
 
         if self.config.hasFeature(Feature.Provenance):
@@ -299,11 +667,13 @@ class Quit(object):
                 g.add((commit_uri, PROV["wasInformedBy"], parent_uri))
 
             # Diff
-            parent = next(iter(commit.parents or []), None)
+            if delta is None:
+                parent = next(iter(commit.parents or []), None)
 
-            i2, commitid = self.instance(parent.id, True) if parent else (None, None)
+                i1, commitid = self.instance(commit.id, True)
+                i2, commitid = self.instance(parent.id, True) if parent else (None, None)
 
-            delta = graphdiff(i2.store if i2 else None, i1.store)
+                delta = graphdiff(i2.store if i2 else None, i1.store)
 
             for index, (iri, changesets) in enumerate(delta.items()):
                 update_uri = QUIT['update-{}-{}'.format(commit.id, index)]
@@ -315,10 +685,8 @@ class Quit(object):
                     g.addN((s, p, o, op_uri) for s, p, o in triples)
 
         # Entities
-        if commit.id not in self._graphconfigs:
-            self.updateGraphConfig(commit.id)
-
-        map = self._graphconfigs.get(commit.id).getgraphurifilemap()
+        graphconfig = self.getGraphConfig(commit.id)
+        map = graphconfig.getgraphurifilemap()
 
         for entity in commit.node().entries(recursive=True):
             # todo check if file was changed
@@ -327,18 +695,17 @@ class Quit(object):
                 if entity.name not in map.values():
                     continue
 
-                graphUri = self._graphconfigs.get(commit.id).getgraphuriforfile(entity.name)
+                graphUri = graphconfig.getgraphuriforfile(entity.name)
                 blob = (entity.name, entity.oid)
 
                 try:
                     f, context = self.getFileReferenceAndContext(blob, commit)
                 except KeyError:
-                    graph = Graph(identifier=graphUri)
-                    graph.parse(data=entity.content, format='nt')
+                    data = entity.data
+                    context = parse_graph(data, graph=self._graph(identifier=URIRef(graphUri)))
+                    f = FileReference(entity.name, data.decode('utf-8'))
 
-                    self._blobs.set(
-                        blob, (FileReference(entity.name, entity.content), graph)
-                    )
+                    self._blobs.set(blob, (f, context))
 
                 private_uri = QUIT["graph-{}".format(entity.oid)]
 
@@ -375,6 +742,8 @@ class Quit(object):
                     g.addN((s, p, o, private_uri) for s, p, o
                            in context.triples((None, None, None)))
 
+        return [(s, p, o, c.identifier) for s, p, o, c in g.quads((None, None, None))]
+
     def getFilesForCommit(self, commit):
         """Get all entry, oid tupples for a commit.
 
@@ -384,45 +753,164 @@ class Quit(object):
         if commit is None:
             return set()
 
-        if commit.id not in self._commits:
-            if commit.id not in self._graphconfigs:
-                self.updateGraphConfig(commit.id)
+        try:
+            return self._commits.get(commit.id)
+        except KeyError:
+            pass
 
-            uriFileMap = self._graphconfigs.get(commit.id).getgraphurifilemap()
-            blobs = set()
+        uriFileMap = self.getGraphConfig(commit.id).getgraphurifilemap()
+        blobs = set()
 
-            for entity in commit.node().entries(recursive=True):
-                if entity.is_file:
-                    if entity.name not in uriFileMap.values():
-                        continue
-                    blob = (entity.name, entity.oid)
-                    blobs.add(blob)
-            self._commits.set(commit.id, blobs)
-            return blobs
-        return self._commits.get(commit.id)
+        for entity in commit.node().entries(recursive=True):
+            if entity.is_file:
+                if entity.name not in uriFileMap.values():
+                    continue
+                blob = (entity.name, entity.oid)
+                blobs.add(blob)
+        self._commits.set(commit.id, blobs)
+        return blobs
 
     def getFileReferenceAndContext(self, blob, commit):
         """Get the FileReference and Context for a given blob (name, oid) of a commit.
 
-        On Cache miss this method also updates teh commits cache.
+        On Cache miss this method also updates teh commits cache. If several requests miss the
+        same blob at once, only one of them parses it while the others wait for it.
+        """
+        try:
+            return self._blobs.get(blob)
+        except KeyError:
+            pass
+        return self._loading.do(blob, partial(self._parseBlob, blob, commit))
+
+    def _parseBlob(self, blob, commit):
+        try:
+            # the blob may have been parsed by a request which finished just before
+            return self._blobs.peek(blob)
+        except KeyError:
+            pass
+
+        (name, oid) = blob
+        data = commit.node(path=name).data
+        graphUri = self.getGraphConfig(commit.id).getgraphuriforfile(name)
+        graph = None
+        if self._snapshots is not None:
+            try:
+                index = self._snapshots.get(str(oid))
+            except KeyError:
+                index = SnapshotIndex.build(parse_triples(data))
+                self._snapshots.set(str(oid), index)
+            graph = SnapshotGraph(index, URIRef(graphUri))
+        elif self._parsedBlobs is not None:
+            try:
+                graph = self._parsedBlobs.get(str(oid), URIRef(graphUri))
+            except KeyError:
+                pass
+        if graph is None:
+            graph = parse_graph(data, graph=self._graph(identifier=URIRef(graphUri)))
+            if self._parsedBlobs is not None:
+                self._parsedBlobs.set(str(oid), graph)
+        self._attachStatistics(oid, graph)
+        quitWorkingData = (FileReference(name, data.decode('utf-8')), graph)
+        self._blobs.set(blob, quitWorkingData)
+        return quitWorkingData
+
+    def getContext(self, blob, commit):
+        """Get the parsed Graph for a given blob (name, oid) of a commit.
+
+        If the HDT sidecar is enabled, a graph which is not cached is read from its compressed
+        snapshot and not added to the cache, the FileReference is only built for updates.
         """
-        if commit.id not in self._graphconfigs:
-            self.updateGraphConfig(commit.id)
+        if self._sidecar is None:
+            return self.getFileReferenceAndContext(blob, commit)[1]
+        try:
+            return self._blobs.get(blob)[1]
+        except KeyError:
+            pass
+
+        (name, oid) = blob
+        try:
+            snapshot = self._sidecar.get(str(oid))
+        except KeyError:
+            snapshot = self._loading.do(
+                ('sidecar', str(oid)), partial(self._writeSnapshot, name, oid, commit))
+        graphUri = self.getGraphConfig(commit.id).getgraphuriforfile(name)
+        graph = SnapshotGraph(snapshot, URIRef(graphUri))
+        graph.statistics = self._knownStatistics(oid)
+        return graph
+
+    def _writeSnapshot(self, name, oid, commit):
+        try:
+            return self._sidecar.get(str(oid))
+        except KeyError:
+            pass
+        triples = list(parse_triples(commit.node(path=name).data))
+        snapshot = self._sidecar.set(str(oid), triples)
+        self.statistics.set(oid, GraphStatistics.fromTriples(triples))
+        return snapshot
+
+    def _knownStatistics(self, oid):
+        """Get the statistics of a blob from the catalog or None if they are not known."""
+        try:
+            return self.statistics.get(oid)
+        except KeyError:
+            return None
+
+    def _attachStatistics(self, oid, graph):
+        """Provide the statistics of a parsed blob to the query planner, compute them if unknown."""
+        try:
+            graph.statistics = self.statistics.get(oid)
+        except KeyError:
+            graph.statistics = self.statistics.set(oid, GraphStatistics.fromTriples(graph))
+
+    def cacheStatistics(self):
+        """Get the hit, miss and eviction counters of the caches per tier."""
+        statistics = {'blobs': self._blobs.statistics(), 'instances': self._instances.statistics()}
+        if self._parsedBlobs is not None:
+            statistics['blobs']['disk'] = self._parsedBlobs.statistics()
+        return statistics
 
-        if blob not in self._blobs:
+    def commitStatistics(self, reference):
+        """Get the statistics of the graphs of a commit.
+
+        The statistics are taken from the catalog, only blobs which have neither been parsed nor
+        committed by this instance are loaded.
+
+        Args:
+            reference: commit id or reference of the commit
+        Returns:
+            A dictionary of the graph IRIs to tuples of the blob oid and its GraphStatistics
+        """
+        commit = self.repository.revision(reference)
+        graphconfig = self.getGraphConfig(commit.id)
+        result = {}
+        for blob in self.getFilesForCommit(commit):
             (name, oid) = blob
-            content = commit.node(path=name).content
-            graphUri = self._graphconfigs.get(commit.id).getgraphuriforfile(name)
-            graph = Graph(identifier=URIRef(graphUri))
-            graph.parse(data=content, format='nt')
-            quitWorkingData = (FileReference(name, content), graph)
-            self._blobs.set(blob, quitWorkingData)
-            return quitWorkingData
-        return self._blobs.get(blob)
+            try:
+                statistics = self.statistics.get(oid)
+            except KeyError:
+                statistics = self.statistics.set(
+                    oid, graphStatistics(self.getContext(blob, commit)))
+            result[URIRef(graphconfig.getgraphuriforfile(name))] = (str(oid), statistics)
+        return result
 
     def applyQueryOnCommit(self, parsedQuery, parent_commit_ref, target_ref, query=None,
                            default_graph=[], named_graph=[]):
-        """Apply an update query on the graph and the git repository."""
+        """Apply an update query on the graph and the git repository.
+
+        If group commit is enabled, concurrent updates on the same ref are written as one commit.
+        If a write-ahead log is configured, the update is committed in the background and the
+        sequence number of the update in the log is returned instead of a commit id.
+        """
+        if self._committer is not None:
+            return self._committer.applyQueryOnCommit(
+                parsedQuery, parent_commit_ref, target_ref, query=query,
+                default_graph=default_graph, named_graph=named_graph)
+
+        return self._applyQueryOnCommit(parsedQuery, parent_commit_ref, target_ref, query=query,
+                                        default_graph=default_graph, named_graph=named_graph)
+
+    def _applyQueryOnCommit(self, parsedQuery, parent_commit_ref, target_ref, query=None,
+                            default_graph=[], named_graph=[]):
         graph, commitid = self.instance(parent_commit_ref)
         resultingChanges, exception = graph.update(parsedQuery)
         if exception:
@@ -435,6 +923,33 @@ class Quit(object):
             raise exception
         return oid
 
+    def flush(self):
+        """Wait until all updates which were acknowledged are committed."""
+        if self._committer is not None:
+            self._committer.flush()
+
+    def commitOf(self, sequence, timeout=None):
+        """Return the id of the commit of an update which was acknowledged with a sequence number.
+
+        Returns:
+            The id of the commit or None if the update was not committed before the timeout.
+        Raises:
+            KeyError: if the sequence number is unknown
+        """
+        if self._committer is None:
+            raise KeyError(sequence)
+        return self._committer.commitOf(sequence, timeout)
+
+    @property
+    def commitError(self):
+        """The error of the last attempt to commit a logged update or None if it succeeded."""
+        return getattr(self._committer, 'error', None)
+
+    @property
+    def pendingUpdates(self):
+        """The number of acknowledged updates which are not committed yet."""
+        return getattr(self._committer, 'pending', 0)
+
     def commit(self, graph, delta, message, parent_commit_ref, target_ref, query=None,
                default_graph=[], named_graph=[], **kwargs):
         """Commit changes after applying deltas to the blobs.
@@ -474,14 +989,18 @@ class Quit(object):
                 pass
         index = self.repository.index(parent_commit_id)
 
-        if parent_commit_id not in self._graphconfigs:
-            self.updateGraphConfig(parent_commit_id)
-
-        graphconfig = self._graphconfigs.get(parent_commit_id)
+        graphconfig = self.getGraphConfig(parent_commit_id)
         known_files = graphconfig.getfiles().keys()
 
-        blobs_new = self._applyKnownGraphs(delta, blobs, parent_commit, index)
-        new_contexts = self._applyUnknownGraphs(delta, known_files)
+        # The changes are known, thus there is no need to diff the commit against its parent
+        parents = {URIRef(graphconfig.getgraphuriforfile(name)): (name, oid)
+                   for name, oid in blobs}
+        changes = self._graphChanges(
+            delta, lambda identifier: self._parentGraph(parents.get(identifier), parent_commit))
+
+        pending = OrderedDict(changes)
+        blobs_new = self._applyKnownGraphs(pending, blobs, parent_commit, index, graphconfig)
+        new_contexts = self._applyUnknownGraphs(pending, known_files)
         new_config = copy(graphconfig)
 
         for identifier, fileReference in new_contexts.items():
@@ -495,7 +1014,10 @@ class Quit(object):
 
             # Update Cache and add new contexts to store
             blob = fileReference.path, index.stash[fileReference.path][0]
-            self._blobs.set(blob, (fileReference, graph.store.get_context(identifier)))
+            context = graph.store.get_context(identifier)
+            # all triples of a new graph are additions of the update
+            self._attachStatistics(blob[1], context)
+            self._blobs.set(blob, (fileReference, context), admit=True)
             blobs_new.add(blob)
         if graphconfig.mode == 'configuration':
             index.add('config.ttl', new_config.graphconf.serialize(format='turtle'))
@@ -511,7 +1033,10 @@ class Quit(object):
         if oid:
             self._commits.set(oid.hex, blobs_new)
             commit = self.repository.revision(oid.hex)
-            self.syncSingle(commit)
+            if self.indexer is not None:
+                self.indexer.enqueue(commit, changes)
+            else:
+                self.syncSingle(commit, changes)
 
         return oid.hex
 
@@ -542,52 +1067,132 @@ class Quit(object):
             out.append('{}: "{}"'.format(k, v.replace('"', "\\\"")))
         return "\n".join(out)
 
-    def _applyKnownGraphs(self, delta, blobs, parent_commit, index):
+    def _applyKnownGraphs(self, changes, blobs, parent_commit, index, graphconfig):
+        """Apply the net changes to the graphs of the parent commit.
+
+        The changes of these graphs are removed from changes.
+        """
         blobs_new = set()
         for blob in blobs:
             (fileName, oid) = blob
+            identifier = URIRef(graphconfig.getgraphuriforfile(fileName))
+            changeset = changes.pop(identifier, None)
+
+            if not changeset:
+                # The tree of the parent commit is the base for the new tree, thus untouched
+                # graphs keep their blob without being serialized again
+                blobs_new.add(blob)
+                continue
+
             try:
                 file_reference, context = self.getFileReferenceAndContext(blob, parent_commit)
-                for entry in delta:
-                    changeset = entry['delta'].get(context.identifier, None)
-
-                    if changeset:
-                        applyChangeset(file_reference, changeset, context.identifier)
-                        del entry['delta'][context.identifier]
+                # The parent version stays cached, both versions share their unchanged lines and
+                # triples
+                file_reference = file_reference.copy()
+                overlay = OverlayGraph(context)
+                applyChangeset(file_reference, changeset, identifier)
+                for (op, triples) in changeset:
+                    if op == 'additions':
+                        overlay += triples
+                    elif op == 'removals':
+                        overlay -= triples
+                if overlay.modifications > OVERLAY_FOLD_TRIPLES:
+                    folded = self._graph(identifier=identifier)
+                    folded.addN((s, p, o, folded) for s, p, o in overlay)
+                    overlay = folded
 
                 index.add(file_reference.path, file_reference.content)
 
-                self._blobs.remove(blob)
                 blob = fileName, index.stash[file_reference.path][0]
-                self._blobs.set(blob, (file_reference, context))
+                self._updateStatistics(oid, blob[1], context, overlay, [changeset])
+                # a new version is likely read next, but has not been requested yet
+                self._blobs.set(blob, (file_reference, overlay), admit=True)
                 blobs_new.add(blob)
             except KeyError:
                 pass
         return blobs_new
 
-    def _applyUnknownGraphs(self, delta, known_blobs):
+    def _updateStatistics(self, parent, oid, context, overlay, changesets):
+        """Derive the statistics of a changed blob from the statistics of its parent blob."""
+        try:
+            statistics = self.statistics.get(parent)
+        except KeyError:
+            statistics = graphStatistics(context)
+        overlay.statistics = self.statistics.set(
+            oid, statistics.applyChanges(context, overlay, changesets))
+
+    def _applyUnknownGraphs(self, changes, known_blobs):
+        """Create the graphs which are not in the parent commit from their net changes."""
         new_contexts = {}
-        for entry in delta:
-            for identifier, changeset in entry['delta'].items():
-                if isinstance(identifier, BNode) or str(identifier) == 'default':
-                    continue  # TODO default graph use case
+        # the default graph and blank node graphs are not in changes, TODO default graph use case
+        for identifier, changeset in changes.items():
+            fileName = iri_to_name(identifier) + '.nt'
+
+            if fileName in known_blobs:
+                reg = re.compile(re.escape(iri_to_name(identifier)) + "_([0-9]+).nt")
+                #  n ~ numbers (in blobname), b ~ blobname, m ~ match
+                n = [
+                    int(m.group(1)) for b in known_blobs for m in [reg.search(b)] if m
+                ] + [0]
+                fileName = '{}_{}.nt'.format(iri_to_name(identifier), max(n) + 1)
+
+            new_contexts[identifier] = FileReference(fileName, '')
+            applyChangeset(new_contexts[identifier], changeset, identifier)
+        return new_contexts
 
-                if identifier not in new_contexts.keys():
-                    fileName = iri_to_name(identifier) + '.nt'
+    def _parentGraph(self, blob, commit):
+        """Get the graph of a blob of the parent commit or None if the graph is new."""
+        if blob is None:
+            return None
+        try:
+            return self.getFileReferenceAndContext(blob, commit)[1]
+        except KeyError:
+            return None
 
-                    if fileName in known_blobs:
-                        reg = re.compile(re.escape(iri_to_name(identifier)) + "_([0-9]+).nt")
-                        #  n ~ numbers (in blobname), b ~ blobname, m ~ match
-                        n = [
-                            int(m.group(1)) for b in known_blobs for m in [reg.search(b)] if m
-                        ] + [0]
-                        fileName = '{}_{}.nt'.format(iri_to_name(identifier), max(n) + 1)
+    def _graphChanges(self, delta, parentGraph):
+        """Merge the delta of an update into the net changes per graph.
 
-                    new_contexts[identifier] = FileReference(fileName, '')
+        The operations of an update record the filled templates of all solutions, thus they also
+        contain triples which were already in the graph, were not in it or were changed several
+        times. The last operation on a triple decides if it is in the graph after the update, it
+        is an addition or a removal if this differs from the graph of the parent commit.
 
-                fileReference = new_contexts[identifier]
-                applyChangeset(fileReference, changeset, identifier)
-        return new_contexts
+        Args:
+            delta: the delta of the operations of an update
+            parentGraph: a function returning the graph of an identifier in the parent commit or
+                None if the graph is new
+        Returns:
+            An OrderedDict in the format of graphdiff()
+        """
+        changes = {}
+        for entry in delta:
+            for identifier, changeset in entry['delta'].items():
+                if isinstance(identifier, BNode) or str(identifier) == 'default':
+                    continue
+                present = changes.setdefault(identifier, {})
+                for (op, triples) in changeset:
+                    if op in ('additions', 'removals'):
+                        for triple in triples:
+                            present[triple] = op == 'additions'
+
+        result = OrderedDict()
+        for identifier in sorted(changes):
+            graph = parentGraph(identifier)
+            additions, removals = set(), set()
+            for triple, isPresent in changes[identifier].items():
+                wasPresent = graph is not None and triple in graph
+                if isPresent and not wasPresent:
+                    additions.add(triple)
+                elif wasPresent and not isPresent:
+                    removals.add(triple)
+            changeset = []
+            if additions:
+                changeset.append(('additions', additions))
+            if removals:
+                changeset.append(('removals', removals))
+            if changeset:
+                result[identifier] = changeset
+        return result
 
     def _isDeltaEmpty(self, result):
         for entry in result:
@@ -613,8 +1218,31 @@ class Quit(object):
             logger.debug('Git garbage collection failed to spawn.')
             logger.debug(e)
 
+    def getGraphConfig(self, commitId):
+        """Get the graph configuration for a given commit id.
+
+        On Cache miss this method also updates the graph configuration cache.
+        """
+        try:
+            return self._graphconfigs.get(commitId)
+        except KeyError:
+            return self.updateGraphConfig(commitId)
+
     def updateGraphConfig(self, commitId):
         """Update the graph configuration for a given commit id."""
         graphconf = QuitGraphConfiguration(self.repository._repository)
         graphconf.initgraphconfig(commitId)
         self._graphconfigs.set(commitId, graphconf)
+        return graphconf
+
+
+_worker = None
+
+
+def _initSyncWorker(config, path):
+    global _worker
+    _worker = Quit(config, Repository(path), MemoryStore())
+
+
+def _syncWorker(cid):
+    return _worker.changesetQuads(_worker.repository.revision(cid))
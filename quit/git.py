@@ -26,7 +26,8 @@ class Repository(object):
     - There is no possibility to set remotes on a Quit Repository object.
     """
 
-    def __init__(self, path, origin=None, create=False, garbageCollection=False, callback=None):
+    def __init__(self, path, origin=None, create=False, garbageCollection=False, callback=None,
+                 worktree=True):
         """Initialize a quit repo at a given location of the filesystem.
 
         Keyword arguments:
@@ -39,8 +40,12 @@ class Repository(object):
                   repository (default: False)
         callback -- an instance of pygit2.RemoteCallbacks to handle cedentials and
                   push_update_reference (default: None)
+        worktree -- boolean whether commits on the checked out branch update the working directory
+                  or only write git objects and move the branch, see sync_worktree()
+                  (default: True)
         """
         self.path = path
+        self.worktree = worktree
         self.callback = callback if callback else QuitRemoteCallbacks()
         self._repository = self.init_repository(path, origin, create)
         self.log_repository(self._repository)
@@ -117,6 +122,53 @@ class Repository(object):
     def close(self):
         self._repository = None
 
+    def sync_worktree(self):
+        """Update the working directory and the index to the checked out commit.
+
+        Files which were changed in the working directory since they were checked out are kept.
+
+        Returns:
+        A list of the paths which were kept because of local changes.
+        """
+        if self.is_bare or self._repository.head_is_unborn:
+            return []
+
+        repository = self._repository
+        index = repository.index
+        index.read()
+        checkedOut = repository.get(index.write_tree())
+        head = repository.head.peel(pygit2.Tree)
+
+        conflicts = []
+        for delta in checkedOut.diff_to_tree(head).deltas:
+            path = delta.new_file.path
+            fullpath = os.path.join(repository.workdir, path)
+
+            expected = None if delta.status == pygit2.GIT_DELTA_ADDED else delta.old_file.id
+            target = None if delta.status == pygit2.GIT_DELTA_DELETED else delta.new_file.id
+            current = pygit2.hashfile(fullpath) if os.path.isfile(fullpath) else None
+
+            if current != expected and current != target:
+                conflicts.append(path)
+                continue
+
+            if target is None:
+                if current is not None:
+                    os.remove(fullpath)
+                index.remove(path)
+            else:
+                if current != target:
+                    os.makedirs(os.path.dirname(fullpath), exist_ok=True)
+                    with open(fullpath, 'wb') as f:
+                        f.write(repository.get(target).data)
+                index.add(pygit2.IndexEntry(path, target, delta.new_file.mode))
+
+        index.write()
+        if conflicts:
+            logger.info("Local changes in working directory, not updated: {}".format(
+                ', '.join(conflicts)))
+        return conflicts
+
     def lookup(self, name):
         """Lookup the oid for a reference.
 
@@ -603,6 +655,13 @@ class Node(object):
             return None
         return self.blob.data.decode("utf-8")
 
+    @property
+    def data(self):
+        """The raw bytes of a file."""
+        if not self.is_file:
+            return None
+        return self.blob.data
+
     def entries(self, recursive=False):
         if isinstance(self.obj, pygit2.Tree):
             for entry in self.obj:
@@ -695,7 +754,8 @@ class Index(object):
         self.dirty = True
 
         branch = re.sub("refs/heads/", "", ref)
-        if not self.repository.is_bare and (branch == self.repository.current_head or
+        if self.repository.worktree and not self.repository.is_bare and (
+           branch == self.repository.current_head or
            self.repository.current_head is None):
             try:
                 tree = self.repository._repository.get(oid)
@@ -1,4 +1,5 @@
 import functools
+import threading
 from itertools import chain
 from rdflib import Graph, ConjunctiveGraph, URIRef
 from rdflib.graph import ModificationException
@@ -41,64 +42,223 @@ class RewriteGraph(Graph):
         return len(self.__graph)
 
 
-def _copyIfNotExists(store, self, other):
-    if other and self not in store.contexts(None):
-        store.addN((s, p, o, self) for s, p, o in other.triples((None, None, None)))
+class LazyGraph(Graph):
+    """A graph which is only loaded when its triples are requested for the first time.
 
+    The loader is a callable without arguments which returns the actual Graph. All triple
+    operations are delegated to that Graph, thus modifications are applied to the loaded Graph.
+    Concurrent first accesses call the loader only once.
+    """
 
-class CopyOnEditGraph(Graph):
-    def __init__(self, template, store='default', identifier=None, namespace_manager=None):
-        super().__init__(store, identifier, namespace_manager)
+    def __init__(self, identifier, loader, namespace_manager=None):
+        super().__init__(identifier=identifier, namespace_manager=namespace_manager)
+        self._loader = loader
+        self._graph = None
+        self._lock = threading.Lock()
 
-        assert not template or isinstance(
-            template, Graph), "template must be graph"
-        assert not template or template.identifier == identifier, "identifier must match"
+    @property
+    def loaded(self):
+        return self._graph is not None
+
+    def _load(self):
+        graph = self._graph
+        if graph is None:
+            with self._lock:
+                if self._graph is None:
+                    self._graph = self._loader()
+                graph = self._graph
+        return graph
+
+    def unloaded(self):
+        """Return a LazyGraph with the same loader and statistics which is not loaded yet.
+
+        A graph which is shared for a long time should not keep its loaded graph alive, a copy is
+        loaded for each use instead and the loader is in charge of caching.
+        """
+        graph = LazyGraph(self.identifier, self._loader)
+        statistics = getattr(self, 'statistics', None)
+        if statistics is not None:
+            graph.statistics = statistics
+        return graph
 
-        self._template = template
-        self._store = store
+    @property
+    def store(self):
+        return self._load().store
 
-    def add(self, triple_or_quad):
-        _copyIfNotExists(self._store, self, self._template)
-        super().add(triple_or_quad)
+    def triples(self, triple):
+        return self._load().triples(triple)
 
-    def addN(self, triple_or_quad):
-        _copyIfNotExists(self._store, self, self._template)
-        super().addN(triple_or_quad)
+    def add(self, triple):
+        self._load().add(triple)
+        return self
 
-    def remove(self, triple_or_quad):
-        _copyIfNotExists(self._store, self, self._template)
-        super().remove(triple_or_quad)
+    def addN(self, quads):
+        graph = self._load()
+        graph.addN((s, p, o, graph) for s, p, o, c in quads)
+        return self
 
-    def triples(self, triple):
-        if self not in self._store.contexts(None):
-            return self._template.triples(triple) if self._template else (_ for _ in ())
-        else:
-            return super().triples(triple)
+    def remove(self, triple):
+        self._load().remove(triple)
+        return self
+
+    def __contains__(self, triple):
+        return triple in self._load()
+
+    def __len__(self):
+        return len(self._load())
+
+
+class OverlayGraph(Graph):
+    """A graph which records modifications on top of an unmodified base graph.
+
+    Added triples and removed triples are kept in two separate sets, the base graph is never
+    touched. Thus the memory needed for a modification only depends on the size of the
+    modification and not on the size of the base graph. An overlay on top of another overlay
+    keeps the other overlay as its base, which must not be modified anymore. Once there are
+    FOLD_DEPTH overlays on top of each other, their modifications are merged into a single
+    overlay, so a lookup only passes a bounded number of overlays.
+    """
+
+    FOLD_DEPTH = 8
+
+    def __init__(self, base, namespace_manager=None):
+        assert isinstance(base, Graph), "base must be graph"
+
+        super().__init__(identifier=base.identifier, namespace_manager=namespace_manager)
+
+        if isinstance(base, OverlayGraph) and base._depth >= self.FOLD_DEPTH:
+            base = base.merged()
+        self._base = base
+        self._depth = base._depth + 1 if isinstance(base, OverlayGraph) else 1
+        self._additions = Graph(identifier=base.identifier)
+        self._removals = set()
+        self._merged = None
 
     @property
-    def store(self):
-        if self not in self._store.contexts(None):
-            return self._template.store
-        else:
-            return super().store
+    def root(self):
+        """The graph below all overlays."""
+        return self._base.root if isinstance(self._base, OverlayGraph) else self._base
 
-    def unwrap(self):
-        return Graph(store=self.store, identifier=self.identifier)
+    @property
+    def modifications(self):
+        """The number of triples added and removed by all overlays on top of the root graph."""
+        count = len(self._additions) + len(self._removals)
+        return count + self._base.modifications if isinstance(self._base, OverlayGraph) else count
 
-    def __isub__(self, other):
-        """Subtract all triples in Graph other from Graph.
+    def merged(self):
+        """Return a single overlay on top of the root graph with the modifications of all overlays.
 
-        BNode IDs are not changed.
+        The result is kept until this overlay is modified, thus the overlays which are created on
+        top of the same overlay share the merged modifications.
         """
-        for triple in other:
-            self.remove(triple)
+        if self._merged is not None:
+            return self._merged
+        layers = []
+        graph = self
+        while isinstance(graph, OverlayGraph):
+            layers.append(graph)
+            graph = graph._base
+        merged = OverlayGraph(graph)
+        additions, removals = merged._additions, merged._removals
+        for layer in reversed(layers):
+            for triple in layer._removals:
+                if triple in additions:
+                    additions.remove(triple)
+                else:
+                    removals.add(triple)
+            for triple in layer._additions:
+                if triple in removals:
+                    removals.remove(triple)
+                else:
+                    additions.add(triple)
+        self._merged = merged
+        return merged
+
+    @property
+    def modified(self):
+        return len(self._additions) > 0 or len(self._removals) > 0
+
+    def triples(self, triple):
+        for t in self._base.triples(triple):
+            if t not in self._removals:
+                yield t
+        yield from self._additions.triples(triple)
+
+    def add(self, triple):
+        self._merged = None
+        if triple in self._removals:
+            self._removals.remove(triple)
+        elif triple not in self._base:
+            self._additions.add(triple)
         return self
 
+    def addN(self, quads):
+        for s, p, o, c in quads:
+            self.add((s, p, o))
+        return self
+
+    def remove(self, triple):
+        self._merged = None
+        for t in list(self.triples(triple)):
+            if t in self._additions:
+                self._additions.remove(t)
+            else:
+                self._removals.add(t)
+        return self
+
+    def __contains__(self, triple):
+        for _ in self.triples(triple):
+            return True
+        return False
+
     def __len__(self):
-        if self not in self._store.contexts(None):
-            return self._template.__len__()
+        return len(self._base) - len(self._removals) + len(self._additions)
+
+
+class SnapshotGraph(Graph):
+    """A read-only graph which answers triple patterns from a SnapshotIndex or an HDTSnapshot."""
+
+    def __init__(self, index, identifier, namespace_manager=None):
+        super().__init__(identifier=identifier, namespace_manager=namespace_manager)
+        self.index = index
+
+    def blocks(self, triple):
+        """Yield the triples matching a pattern in lists."""
+        s, p, o = triple
+        if isinstance(p, Path):
+            yield list(self.triples(triple))
+        else:
+            yield from self.index.blocks(triple)
+
+    def triples(self, triple):
+        s, p, o = triple
+        if isinstance(p, Path):
+            for s, o in p.eval(self, s, o):
+                yield s, p, o
         else:
-            return super().__len__()
+            for block in self.index.blocks(triple):
+                yield from block
+
+    def add(self, triple_or_quad):
+        raise ModificationException()
+
+    def addN(self, triple_or_quad):
+        raise ModificationException()
+
+    def remove(self, triple_or_quad):
+        raise ModificationException()
+
+    def __iadd__(self, other):
+        raise ModificationException()
+
+    def __isub__(self, other):
+        raise ModificationException()
+
+    def parse(self, source, publicID=None, format="xml", **args):
+        raise ModificationException()
+
+    def __len__(self):
+        return len(self.index)
 
 
 class InMemoryAggregatedGraph(ConjunctiveGraph):
@@ -108,6 +268,9 @@ class InMemoryAggregatedGraph(ConjunctiveGraph):
         if not (isinstance(graphs, list) and all(isinstance(g, Graph) for g in graphs)):
             raise Exception("graphs argument must be a list of Graphs!!")
         self._contexts = graphs
+        self._index = {}
+        for graph in graphs:
+            self._index.setdefault(str(graph.identifier), graph)
 
     def __repr__(self):
         return "<{}: {}|{} graphs>".format(
@@ -157,6 +320,27 @@ class InMemoryAggregatedGraph(ConjunctiveGraph):
                     for s, p, o in graph.triples((s, p, o)):
                         yield s, p, o
 
+    def blocks(self, triple_or_quad, context=None):
+        """Yield the triples matching a pattern in lists or iterables.
+
+        Graphs which provide blocks themselves, e.g. snapshots, return their triples in lists,
+        the triples of all other graphs are returned as one iterable per graph.
+        """
+        s, p, o, c = self._spoc(triple_or_quad)
+        context = self._graph(context or c)
+
+        if isinstance(p, Path):
+            yield self.triples((s, p, o), context)
+            return
+
+        for graph in self.contexts():
+            if context is None or graph.identifier == context.identifier:
+                blocks = getattr(graph, 'blocks', None)
+                if blocks is not None:
+                    yield from blocks((s, p, o))
+                else:
+                    yield graph.triples((s, p, o))
+
     def quads(self, triple_or_quad=None):
         s, p, o, c = self._spoc(triple_or_quad)
         context = self._graph(c)
@@ -187,10 +371,12 @@ class InMemoryAggregatedGraph(ConjunctiveGraph):
         Returns:
             Graph if found, else None
         """
-        if isinstance(identifier, URIRef):
-            return next((x for x in self._contexts if x.identifier == identifier), None)
-        else:
-            return next((x for x in self._contexts if str(x.identifier) == identifier), None)
+        context = self._index.get(str(identifier))
+        if context is None or (
+            isinstance(identifier, URIRef) and context.identifier != identifier
+        ):
+            return None
+        return context
 
     def get_context(self, identifier, quoted=False):
         """Return the requested context/Graph.
@@ -212,35 +398,14 @@ class InMemoryAggregatedGraph(ConjunctiveGraph):
 
 
 class InMemoryCopyOnEditAggregatedGraph(InMemoryAggregatedGraph):
+    """An aggregated graph which never modifies the graphs it was created with.
 
-    def add(self, triple_or_quad):
-        s, p, o, c = self._spoc(triple_or_quad, default=True)
-
-        _copyIfNotExists(self.store, c, self._get_context(self.identifier))
-
-        self.store.add((s, p, o), context=c, quoted=False)
-
-    def addN(self, quads):
-        def do(g):
-            c = self._graph(g)
-
-            _copyIfNotExists(self.store, c, self._get_context(self.identifier))
-
-            return g
-
-        self.store.addN((s, p, o, do(c)) for s, p, o, c in quads)
+    Every graph is wrapped in an OverlayGraph, so modifications are only visible through this
+    aggregated graph.
+    """
 
-    def remove(self, triple_or_quad):
-        s, p, o, c = self._spoc(triple_or_quad)
-
-        _copyIfNotExists(self.store, c, self._get_context(self.identifier))
-
-        self.store.remove((s, p, o), context=c)
-
-    def get_context(self, identifier, quoted=False):
-        if isinstance(identifier, Graph):
-            identifier = identifier.identifier
-        return CopyOnEditGraph(
-            store=self.store, identifier=identifier, namespace_manager=self,
-            template=self._get_context(identifier)
-        )
+    def __init__(self, store='default', identifier=None, graphs=[]):
+        if not (isinstance(graphs, list) and all(isinstance(g, Graph) for g in graphs)):
+            raise Exception("graphs argument must be a list of Graphs!!")
+        super().__init__(store=store, identifier=identifier,
+                         graphs=[OverlayGraph(g) for g in graphs])
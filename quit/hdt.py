@@ -0,0 +1,465 @@
+"""A compressed, self-indexed snapshot format for the graphs of archived revisions.
+
+The format follows HDT (Header, Dictionary, Triples). The dictionary keeps the terms of a graph in
+four sorted sections, terms which are subject and object ("shared"), subjects, predicates and
+objects, each front coded in blocks of 16 terms. A subject gets the id of its position in the
+shared section or the number of shared terms plus its position in the subject section, objects
+likewise. The triples are kept in the bitmap triples layout in SPO order: the predicates of the
+(subject, predicate) pairs and the objects of the triples as two sequences, the bitmaps which mark
+where the pairs of a subject and the objects of a pair end are stored as their select directories,
+i.e. as the offsets at which each subject and each pair starts. An additional object index and
+predicate index answer patterns without a bound subject.
+
+A snapshot is a single file which is memory-mapped, the dictionary and the arrays are read in place
+and only the terms of matching triples are decoded. Thus opening a snapshot of a cold revision
+costs almost no memory and time, unlike parsing its blob.
+"""
+
+import logging
+import marshal
+import mmap
+import os
+import struct
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from rdflib import BNode, Literal
+from rdflib.plugins.serializers.nt import _quoteLiteral
+from rdflib.util import from_n3
+from quit.ntriples import _Parser
+
+logger = logging.getLogger('quit.hdt')
+
+MAGIC = b'QUITHDT1\n'
+BLOCK = 16
+
+
+def _encode(term):
+    if isinstance(term, Literal):
+        return _quoteLiteral(term).encode('utf-8')
+    if isinstance(term, BNode):
+        return ('_:' + str(term)).encode('utf-8')
+    return ('<' + str(term) + '>').encode('utf-8')
+
+
+def _varint(value, out):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _readVarint(data, position):
+    byte = data[position]
+    if byte < 0x80:
+        return byte, position + 1
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+def _array(values):
+    """Return an array of the values with the smallest unsigned item size."""
+    maximum = max(values, default=0)
+    for typecode in ('B', 'H', 'I', 'Q'):
+        if maximum < 1 << (8 * array(typecode).itemsize):
+            return array(typecode, values)
+
+
+def _frontCode(strings):
+    """Encode sorted strings in blocks, return the block offsets and the data."""
+    offsets = []
+    data = bytearray()
+    previous = b''
+    for i, string in enumerate(strings):
+        if i % BLOCK == 0:
+            offsets.append(len(data))
+            _varint(len(string), data)
+            data += string
+        else:
+            prefix = 0
+            limit = min(len(previous), len(string))
+            while prefix < limit and previous[prefix] == string[prefix]:
+                prefix += 1
+            _varint(prefix, data)
+            _varint(len(string) - prefix, data)
+            data += string[prefix:]
+        previous = string
+    offsets.append(len(data))
+    return offsets, bytes(data)
+
+
+class _Section(object):
+    """A front coded section of the dictionary."""
+
+    # number of decoded blocks which are kept
+    CACHE = 1024
+
+    def __init__(self, offsets, data, count):
+        self.offsets = offsets
+        self.data = data
+        self.count = count
+        self._blocks = {}
+        self._heads = None
+
+    def _block(self, block):
+        """Return the strings of a block."""
+        strings = self._blocks.get(block)
+        if strings is not None:
+            return strings
+        # a copy of the block is read faster than the memory map
+        data = bytes(self.data[self.offsets[block]:self.offsets[block + 1]])
+        length, position = _readVarint(data, 0)
+        string = data[position:position + length]
+        position += length
+        strings = [string]
+        while position < len(data):
+            prefix, position = _readVarint(data, position)
+            length, position = _readVarint(data, position)
+            string = string[:prefix] + data[position:position + length]
+            position += length
+            strings.append(string)
+        if len(self._blocks) >= self.CACHE:
+            self._blocks.clear()
+        self._blocks[block] = strings
+        return strings
+
+    def _first(self, block):
+        length, position = _readVarint(self.data, self.offsets[block])
+        return bytes(self.data[position:position + length])
+
+    def heads(self):
+        """Return the first strings of all blocks, they are searched to locate a string."""
+        if self._heads is None:
+            self._heads = [self._first(block) for block in range(len(self.offsets) - 1)]
+        return self._heads
+
+    def extract(self, id):
+        """Return the string at position id."""
+        return self._block(id // BLOCK)[id % BLOCK]
+
+    def locate(self, string):
+        """Return the position of a string or None."""
+        block = bisect_right(self.heads(), string) - 1
+        if block < 0:
+            return None
+        for i, candidate in enumerate(self._block(block)):
+            if candidate == string:
+                return block * BLOCK + i
+            if candidate > string:
+                return None
+        return None
+
+
+class HDTSnapshot(object):
+    """A memory-mapped snapshot of the triples of a graph."""
+
+    BLOCK_SIZE = 1000
+    # decoded terms are kept per role up to this number, a scan does not keep the whole graph
+    TERM_CACHE = 100000
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._map)
+        if bytes(view[:len(MAGIC)]) != MAGIC:
+            raise ValueError('not a snapshot')
+        length, = struct.unpack_from('<Q', view, len(MAGIC))
+        start = len(MAGIC) + 8
+        header = marshal.loads(view[start:start + length])
+        start += length + (-(start + length) % 8)
+
+        sections = {}
+        for name, (offset, size, typecode) in header['sections'].items():
+            section = view[start + offset:start + offset + size]
+            sections[name] = section.cast(typecode) if typecode else section
+        self.counts = header['counts']
+        self.dictionary = {
+            name: _Section(sections[name + 'Offsets'], sections[name], header['counts'][name])
+            for name in ('shared', 'subjects', 'predicates', 'objects')}
+        self.subjectOffsets = sections['subjectOffsets']
+        self.pairPredicates = sections['pairPredicates']
+        self.pairOffsets = sections['pairOffsets']
+        self.objects = sections['tripleObjects']
+        self.objectOffsets = sections['objectOffsets']
+        self.objectPositions = sections['objectPositions']
+        self.predicateOffsets = sections['predicateOffsets']
+        self.predicatePairs = sections['predicatePairs']
+
+        self._parser = _Parser()
+        self._lock = threading.Lock()
+        self._terms = ({}, {}, {})
+        self._known = ({}, {}, {})
+        # the stored label of each decoded blank node, the parser keeps the blank node of each
+        # label, both are never evicted to locate a blank node again after the caches are cleared
+        self._labels = {}
+
+    @classmethod
+    def write(cls, path, triples):
+        """Write a snapshot of an iterable of (s, p, o) tuples to path."""
+        triples = set((_encode(s), _encode(p), _encode(o)) for s, p, o in triples)
+        subjects = set(s for s, _, _ in triples)
+        objects = set(o for _, _, o in triples)
+        shared = sorted(subjects & objects)
+        subjects = sorted(subjects.difference(shared))
+        objects = sorted(objects.difference(shared))
+        predicates = sorted(set(p for _, p, _ in triples))
+
+        sharedIds = {term: i for i, term in enumerate(shared)}
+        subjectIds = dict(sharedIds)
+        subjectIds.update((term, len(shared) + i) for i, term in enumerate(subjects))
+        objectIds = dict(sharedIds)
+        objectIds.update((term, len(shared) + i) for i, term in enumerate(objects))
+        predicateIds = {term: i for i, term in enumerate(predicates)}
+        encoded = sorted((subjectIds[s], predicateIds[p], objectIds[o]) for s, p, o in triples)
+
+        subjectOffsets = []
+        pairPredicates = []
+        pairOffsets = []
+        objectColumn = []
+        last = (None, None)
+        for s, p, o in encoded:
+            if s != last[0]:
+                subjectOffsets.append(len(pairPredicates))
+            if (s, p) != last:
+                pairOffsets.append(len(objectColumn))
+                pairPredicates.append(p)
+            objectColumn.append(o)
+            last = (s, p)
+        subjectOffsets.append(len(pairPredicates))
+        pairOffsets.append(len(objectColumn))
+
+        objectCount = len(shared) + len(objects)
+        objectOffsets, objectPositions = cls._invert(objectColumn, objectCount)
+        predicateOffsets, predicatePairs = cls._invert(pairPredicates, len(predicates))
+
+        sections = [
+            ('subjectOffsets', _array(subjectOffsets)),
+            ('pairPredicates', _array(pairPredicates)),
+            ('pairOffsets', _array(pairOffsets)),
+            ('tripleObjects', _array(objectColumn)),
+            ('objectOffsets', _array(objectOffsets)),
+            ('objectPositions', _array(objectPositions)),
+            ('predicateOffsets', _array(predicateOffsets)),
+            ('predicatePairs', _array(predicatePairs)),
+        ]
+        counts = {'triples': len(encoded)}
+        for name, strings in (('shared', shared), ('subjects', subjects),
+                              ('predicates', predicates), ('objects', objects)):
+            offsets, data = _frontCode(strings)
+            sections.append((name + 'Offsets', _array(offsets)))
+            sections.append((name, data))
+            counts[name] = len(strings)
+
+        # the sections are aligned to 8 bytes, their offsets are relative to the first section
+        header = {'counts': counts, 'sections': {}}
+        position = 0
+        for name, data in sections:
+            size = len(data) * data.itemsize if isinstance(data, array) else len(data)
+            typecode = data.typecode if isinstance(data, array) else None
+            header['sections'][name] = (position, size, typecode)
+            position += size + (-size % 8)
+        header = marshal.dumps(header)
+
+        with open(path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<Q', len(header)))
+            f.write(header)
+            f.write(b'\0' * (-f.tell() % 8))
+            for name, data in sections:
+                f.write(data.tobytes() if isinstance(data, array) else data)
+                f.write(b'\0' * (-f.tell() % 8))
+
+    @staticmethod
+    def _invert(values, count):
+        """Return the offsets and positions of the values grouped by value."""
+        offsets = [0] * (count + 1)
+        for value in values:
+            offsets[value + 1] += 1
+        for i in range(count):
+            offsets[i + 1] += offsets[i]
+        positions = [0] * len(values)
+        fill = list(offsets[:-1])
+        for position, value in enumerate(values):
+            positions[fill[value]] = position
+            fill[value] += 1
+        return offsets, positions
+
+    def __len__(self):
+        return self.counts['triples']
+
+    def _locate(self, term, role):
+        """Return the id of a term as subject (0), predicate (1) or object (2) or None."""
+        id = self._known[role].get(term)
+        if id is not None:
+            return id
+        string = self._labels.get(term) if isinstance(term, BNode) else None
+        if string is None:
+            string = _encode(term)
+        if role == 1:
+            return self.dictionary['predicates'].locate(string)
+        id = self.dictionary['shared'].locate(string)
+        if id is not None:
+            return id
+        id = self.dictionary['subjects' if role == 0 else 'objects'].locate(string)
+        return None if id is None else self.counts['shared'] + id
+
+    def _term(self, id, role):
+        cache = self._terms[role]
+        term = cache.get(id)
+        if term is not None:
+            return term
+        if role == 1:
+            string = self.dictionary['predicates'].extract(id)
+        elif id < self.counts['shared']:
+            string = self.dictionary['shared'].extract(id)
+        else:
+            string = self.dictionary['subjects' if role == 0 else 'objects'].extract(
+                id - self.counts['shared'])
+        with self._lock:
+            try:
+                term = self._parser.term(string)
+            except (ValueError, IndexError):
+                term = from_n3(string.decode('utf-8'))
+            if isinstance(term, BNode):
+                self._labels[term] = bytes(string)
+        if len(cache) >= self.TERM_CACHE:
+            cache.clear()
+        cache[id] = term
+        # shared terms have the same id as subject and object
+        for known in ((self._known[0], self._known[2]) if role != 1 and id < self.counts['shared']
+                      else (self._known[role],)):
+            if len(known) >= self.TERM_CACHE:
+                known.clear()
+            known[term] = id
+        return term
+
+    def _subject(self, pair):
+        return bisect_right(self.subjectOffsets, pair) - 1
+
+    def _pair(self, position):
+        return bisect_right(self.pairOffsets, position) - 1
+
+    def _ids(self, s, p, o):
+        """Yield the id triples matching a pattern of ids."""
+        pairOffsets = self.pairOffsets
+        objects = self.objects
+        if s is not None:
+            lo, hi = self.subjectOffsets[s], self.subjectOffsets[s + 1]
+            if p is not None:
+                lo = bisect_left(self.pairPredicates, p, lo, hi)
+                hi = lo + 1 if lo < hi and self.pairPredicates[lo] == p else lo
+            for pair in range(lo, hi):
+                start, end = pairOffsets[pair], pairOffsets[pair + 1]
+                if o is not None:
+                    i = bisect_left(objects, o, start, end)
+                    if i < end and objects[i] == o:
+                        yield s, self.pairPredicates[pair], o
+                else:
+                    predicate = self.pairPredicates[pair]
+                    for i in range(start, end):
+                        yield s, predicate, objects[i]
+        elif o is not None:
+            for i in range(self.objectOffsets[o], self.objectOffsets[o + 1]):
+                pair = self._pair(self.objectPositions[i])
+                predicate = self.pairPredicates[pair]
+                if p is None or predicate == p:
+                    yield self._subject(pair), predicate, o
+        elif p is not None:
+            for i in range(self.predicateOffsets[p], self.predicateOffsets[p + 1]):
+                pair = self.predicatePairs[i]
+                subject = self._subject(pair)
+                for j in range(pairOffsets[pair], pairOffsets[pair + 1]):
+                    yield subject, p, objects[j]
+        else:
+            subjectOffsets = self.subjectOffsets
+            for subject in range(len(subjectOffsets) - 1):
+                for pair in range(subjectOffsets[subject], subjectOffsets[subject + 1]):
+                    predicate = self.pairPredicates[pair]
+                    for j in range(pairOffsets[pair], pairOffsets[pair + 1]):
+                        yield subject, predicate, objects[j]
+
+    def _pattern(self, triple):
+        """Return the ids of the terms of a pattern or None if a term is not in the snapshot."""
+        ids = []
+        for role, term in enumerate(triple):
+            if term is None:
+                ids.append(None)
+                continue
+            id = self._locate(term, role)
+            if id is None:
+                return None
+            ids.append(id)
+        return ids
+
+    def blocks(self, triple, size=None):
+        """Yield the triples matching a pattern as lists of at most size (s, p, o) tuples."""
+        size = size or self.BLOCK_SIZE
+        ids = self._pattern(triple)
+        if ids is None:
+            return
+
+        # only the unbound terms are decoded
+        s, p, o = triple
+        block = []
+        term = self._term
+        for i, j, k in self._ids(*ids):
+            block.append((s if s is not None else term(i, 0),
+                          p if p is not None else term(j, 1),
+                          o if o is not None else term(k, 2)))
+            if len(block) == size:
+                yield block
+                block = []
+        if block:
+            yield block
+
+    def count(self, triple):
+        """Return the number of triples matching a pattern."""
+        ids = self._pattern(triple)
+        return 0 if ids is None else sum(1 for _ in self._ids(*ids))
+
+
+class HDTStore(object):
+    """A sidecar directory of snapshots keyed by the blob oid."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, oid):
+        return os.path.join(self.path, oid[:2], oid[2:] + '.hdt')
+
+    def get(self, oid):
+        """Open the snapshot of a blob.
+
+        Raises:
+            KeyError if there is no snapshot of the blob
+        """
+        filename = self._file(oid)
+        if not os.path.isfile(filename):
+            raise KeyError(oid)
+        try:
+            return HDTSnapshot(filename)
+        except (OSError, ValueError, EOFError, TypeError, struct.error) as e:
+            logger.warning('Dropping damaged snapshot {}: {}'.format(oid, e))
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+            raise KeyError(oid)
+
+    def set(self, oid, triples):
+        """Write the snapshot of a blob from an iterable of triples and open it."""
+        filename = self._file(oid)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        tmp = '{}.{}.{}.tmp'.format(filename, os.getpid(), threading.get_ident())
+        HDTSnapshot.write(tmp, triples)
+        os.replace(tmp, filename)
+        return HDTSnapshot(filename)
@@ -0,0 +1,164 @@
+"""A fast N-Triples parser for the blobs written by the QuitStore.
+
+The blobs of the store are written by FileReference.content: one triple per line, separated by
+single spaces and terminated by " .". Such lines are parsed directly on the bytes of the blob,
+each term is decoded on its own and IRIs are only decoded once per blob. All other lines, e.g.
+comments, lines with tabs or escaped IRIs, are handed to the rdflib N-Triples parser, thus every
+valid N-Triples document is accepted.
+"""
+
+from itertools import islice
+from rdflib import BNode, Graph, Literal, URIRef
+from rdflib.plugins.parsers.ntriples import W3CNTriplesParser, unquote
+
+_QUOTE = ord('"')
+_LT = ord('<')
+_SPACE = ord(' ')
+
+
+class _Sink(object):
+    def __init__(self):
+        self.triples = []
+
+    def triple(self, s, p, o):
+        self.triples.append((s, p, o))
+
+
+class _Parser(object):
+    def __init__(self):
+        # labels of blank nodes are only valid within a document
+        self.bnodes = {}
+        self.iris = {}
+        self._sink = _Sink()
+        self._fallback = W3CNTriplesParser(self._sink)
+
+    def iri(self, data):
+        try:
+            return self.iris[data]
+        except KeyError:
+            pass
+        if b'\\' in data:
+            raise ValueError('escaped IRI')
+        iri = self.iris[data] = URIRef(data.decode('utf-8'))
+        return iri
+
+    def bnode(self, data):
+        label = data.decode('utf-8')
+        try:
+            return self.bnodes[label]
+        except KeyError:
+            bnode = self.bnodes[label] = BNode()
+            return bnode
+
+    def literal(self, data):
+        end = data.rfind(b'"')
+        if end < 1:
+            raise ValueError('unterminated literal')
+        value = data[1:end]
+        value = unquote(value.decode('utf-8')) if b'\\' in value else value.decode('utf-8')
+        suffix = data[end + 1:]
+        if not suffix:
+            return Literal(value)
+        if suffix.startswith(b'@'):
+            return Literal(value, lang=suffix[1:].decode('ascii'))
+        if suffix.startswith(b'^^<') and suffix.endswith(b'>'):
+            return Literal(value, datatype=self.iri(suffix[3:-1]))
+        raise ValueError('invalid literal suffix')
+
+    def term(self, data):
+        """Parse a single term in N-Triples syntax."""
+        if data[0] == _LT:
+            return self.iri(data[1:-1])
+        if data[0] == _QUOTE:
+            return self.literal(data)
+        if data.startswith(b'_:'):
+            return self.bnode(data[2:])
+        raise ValueError('invalid term')
+
+    def line(self, line):
+        """Parse a canonical line, raise ValueError if the line is not canonical."""
+        if not line.endswith(b' .'):
+            raise ValueError('not canonical')
+
+        if line[0] == _LT:
+            # an IRI can not contain '>', thus the first one ends the subject
+            end = line.index(b'>', 1)
+            s = self.iri(line[1:end])
+        elif line.startswith(b'_:'):
+            end = line.index(b' ', 2) - 1
+            s = self.bnode(line[2:end + 1])
+        else:
+            raise ValueError('invalid subject')
+
+        start = end + 2
+        if line[end + 1] != _SPACE or line[start] != _LT:
+            raise ValueError('invalid predicate')
+        end = line.index(b'>', start + 1)
+        if line[end + 1] != _SPACE:
+            raise ValueError('invalid object')
+        p = self.iri(line[start + 1:end])
+
+        term = line[end + 2:-2]
+        if term[0] == _QUOTE:
+            o = self.literal(term)
+        elif term[0] == _LT and term.endswith(b'>') and b' ' not in term:
+            o = self.iri(term[1:-1])
+        elif term.startswith(b'_:') and b' ' not in term:
+            o = self.bnode(term[2:])
+        else:
+            raise ValueError('invalid object')
+        return s, p, o
+
+    def fallback(self, line):
+        """Parse any N-Triples line with rdflib."""
+        self._sink.triples = []
+        self._fallback.parsestring(line, bnode_context=self.bnodes)
+        return self._sink.triples
+
+    def triples(self, data):
+        for line in data.split(b'\n'):
+            line = line.rstrip(b'\r')
+            if not line:
+                continue
+            try:
+                yield self.line(line)
+            except (ValueError, IndexError):
+                yield from self.fallback(line)
+
+
+def parse_triples(data):
+    """Parse an N-Triples document and yield its triples.
+
+    Args:
+        data: the document as bytes, bytearray, memoryview or str
+    Returns:
+        An iterator of (s, p, o) tuples of rdflib terms
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    elif not isinstance(data, bytes):
+        data = bytes(data)
+    return _Parser().triples(data)
+
+
+def parse_batches(data, size=10000):
+    """Parse an N-Triples document and yield lists of at most size triples."""
+    triples = parse_triples(data)
+    while True:
+        batch = list(islice(triples, size))
+        if not batch:
+            return
+        yield batch
+
+
+def parse_graph(data, identifier=None, graph=None):
+    """Parse an N-Triples document into a new Graph or into the given graph.
+
+    Returns:
+        The graph containing the triples of the document
+    """
+    if graph is None:
+        graph = Graph(identifier=identifier)
+    for batch in parse_batches(data):
+        graph.addN((s, p, o, graph) for s, p, o in batch)
+    return graph
@@ -0,0 +1,170 @@
+"""A persistent sorted set for the versions of a graph.
+
+The set is a B+-tree of immutable nodes. A modification copies the nodes on the path from the
+root to the modified leaf and returns a new set, all other nodes are shared with the original set.
+Thus a new version of a graph with n lines, which differs by d lines from its parent, only
+allocates O(d log n) nodes and both versions can be kept at the cost of one.
+"""
+
+from bisect import bisect_left, bisect_right
+
+# maximal number of items of a leaf and of children of a branch, nodes are split beyond
+_CAPACITY = 64
+
+
+class _Node(object):
+    """A node of the tree, leaves keep items and branches keep the first item of each child."""
+
+    __slots__ = ('keys', 'children', 'size')
+
+    def __init__(self, keys, children=None):
+        self.keys = keys
+        self.children = children
+        if children is None:
+            self.size = len(keys)
+        else:
+            self.size = sum(child.size for child in children)
+
+
+def _leaf(items):
+    return _Node(items)
+
+
+def _branch(children):
+    return _Node([child.keys[0] for child in children], children)
+
+
+def _split(node):
+    """Return a list of one or two nodes holding the content of an overfull node."""
+    if node.children is None:
+        if len(node.keys) <= _CAPACITY:
+            return [node]
+        middle = len(node.keys) // 2
+        return [_leaf(node.keys[:middle]), _leaf(node.keys[middle:])]
+    if len(node.children) <= _CAPACITY:
+        return [node]
+    middle = len(node.children) // 2
+    return [_branch(node.children[:middle]), _branch(node.children[middle:])]
+
+
+def _merge(left, right):
+    """Join two neighbouring nodes of the same depth."""
+    if left.children is None:
+        return _split(_leaf(left.keys + right.keys))
+    return _split(_branch(left.children + right.children))
+
+
+def _insert(node, item):
+    """Return the nodes replacing node after inserting item or None if item is present."""
+    if node.children is None:
+        i = bisect_left(node.keys, item)
+        if i < len(node.keys) and node.keys[i] == item:
+            return None
+        return _split(_leaf(node.keys[:i] + [item] + node.keys[i:]))
+
+    i = max(bisect_right(node.keys, item) - 1, 0)
+    replacement = _insert(node.children[i], item)
+    if replacement is None:
+        return None
+    return _split(_branch(node.children[:i] + replacement + node.children[i + 1:]))
+
+
+def _remove(node, item):
+    """Return the nodes replacing node after removing item or None if item is missing."""
+    if node.children is None:
+        i = bisect_left(node.keys, item)
+        if i == len(node.keys) or node.keys[i] != item:
+            return None
+        keys = node.keys[:i] + node.keys[i + 1:]
+        return [_leaf(keys)] if keys else []
+
+    i = bisect_right(node.keys, item) - 1
+    if i < 0:
+        return None
+    replacement = _remove(node.children[i], item)
+    if replacement is None:
+        return None
+    children = node.children[:i] + replacement + node.children[i + 1:]
+    if not children:
+        return []
+
+    # join an underfull child with a neighbour
+    if replacement and len(replacement[0].keys) < _CAPACITY // 4 and len(children) > 1:
+        j = i - 1 if i > 0 else i
+        children = children[:j] + _merge(children[j], children[j + 1]) + children[j + 2:]
+    return [_branch(children)]
+
+
+def _items(node):
+    if node.children is None:
+        yield from node.keys
+    else:
+        for child in node.children:
+            yield from _items(child)
+
+
+class PersistentSortedSet(object):
+    """An immutable sorted set, modifications return a new set sharing unchanged nodes."""
+
+    __slots__ = ('_root',)
+
+    def __init__(self, items=()):
+        items = sorted(set(items))
+        nodes = [_leaf(items[i:i + _CAPACITY // 2]) for i in range(0, len(items), _CAPACITY // 2)]
+        while len(nodes) > 1:
+            nodes = [_branch(nodes[i:i + _CAPACITY // 2])
+                     for i in range(0, len(nodes), _CAPACITY // 2)]
+        self._root = nodes[0] if nodes else None
+
+    @classmethod
+    def _fromRoot(cls, root):
+        result = cls.__new__(cls)
+        result._root = root
+        return result
+
+    def _replace(self, nodes):
+        if not nodes:
+            return PersistentSortedSet._fromRoot(None)
+        if len(nodes) > 1:
+            return PersistentSortedSet._fromRoot(_branch(nodes))
+        root = nodes[0]
+        while root.children is not None and len(root.children) == 1:
+            root = root.children[0]
+        return PersistentSortedSet._fromRoot(root)
+
+    def add(self, item):
+        """Return a set which contains item."""
+        if self._root is None:
+            return PersistentSortedSet._fromRoot(_leaf([item]))
+        nodes = _insert(self._root, item)
+        return self if nodes is None else self._replace(nodes)
+
+    def discard(self, item):
+        """Return a set which does not contain item."""
+        if self._root is None:
+            return self
+        nodes = _remove(self._root, item)
+        return self if nodes is None else self._replace(nodes)
+
+    def __contains__(self, item):
+        node = self._root
+        if node is None:
+            return False
+        while node.children is not None:
+            i = bisect_right(node.keys, item) - 1
+            if i < 0:
+                return False
+            node = node.children[i]
+        i = bisect_left(node.keys, item)
+        return i < len(node.keys) and node.keys[i] == item
+
+    def __iter__(self):
+        if self._root is None:
+            return iter(())
+        return _items(self._root)
+
+    def __len__(self):
+        return self._root.size if self._root is not None else 0
+
+    def __bool__(self):
+        return self._root is not None
@@ -1,10 +1,16 @@
 #!/usr/bin/env python3
 
 import functools as ft
+import logging
+import threading
+import time
 
+from collections import deque
 from rdflib import BNode
 from quit.namespace import FOAF, PROV, QUIT
 
+logger = logging.getLogger('quit.provenance')
+
 
 class Blame(object):
     """
@@ -44,7 +50,7 @@ class Blame(object):
         """
 
         commit = self.quit.repository.revision(branch_or_ref)
-        g, commitid = self.quit.instance(branch_or_ref)
+        g, commitid = self.quit.cachedInstance(branch_or_ref)
 
         quads = [x for x in g.store.quads((None, None, None))]
 
@@ -91,8 +97,88 @@ class Blame(object):
             }
             """ % values_string
 
-        return self.quit.store.store.query(
-            q,
-            initNs={'foaf': FOAF, 'prov': PROV, 'quit': QUIT},
-            initBindings={'commit': QUIT['commit-' + commit.id]}
-        )
+        with self.quit.storeLock:
+            result = self.quit.store.store.query(
+                q,
+                initNs={'foaf': FOAF, 'prov': PROV, 'quit': QUIT},
+                initBindings={'commit': QUIT['commit-' + commit.id]}
+            )
+            # evaluate the query before the provenance store is changed again
+            result.bindings
+        return result
+
+
+class ProvenanceIndexer(object):
+    """Add the provenance and persistence data of new commits to the store in the background.
+
+    A single worker indexes the commits in the order they were written. The id of the last indexed
+    commit is the watermark up to which the provenance store is complete. A commit which fails to
+    be indexed stays queued and is retried with a growing delay, error holds the failure until
+    the commit is indexed.
+    """
+
+    # the delay of the first retry of a failed commit in seconds, it doubles up to RETRY_MAX
+    RETRY_DELAY = 1
+    RETRY_MAX = 60
+
+    def __init__(self, quit):
+        self.quit = quit
+        self.indexed = None
+        self.error = None
+        self._condition = threading.Condition()
+        self._queue = deque()
+        self._worker = threading.Thread(target=self._run, name='quit-provenance', daemon=True)
+        self._worker.start()
+
+    def enqueue(self, commit, delta=None):
+        """Queue a commit and its changes per graph, if they are known, for indexing."""
+        with self._condition:
+            self._queue.append((commit, delta))
+            self._condition.notify_all()
+
+    @property
+    def pending(self):
+        """The number of commits which are not indexed yet."""
+        with self._condition:
+            return len(self._queue)
+
+    def wait(self, timeout=None):
+        """Block until all queued commits are indexed or indexing a commit failed.
+
+        Returns:
+            True if the provenance store caught up, False if the timeout expired before or a
+            commit can not be indexed.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: not self._queue or self.error is not None,
+                                     timeout=timeout)
+            return not self._queue
+
+    def _run(self):
+        failures = 0
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queue)
+                commit, delta = self._queue[0]
+
+            try:
+                self.quit.syncSingle(commit, delta)
+            except Exception as e:
+                # the provenance store is only complete up to the watermark, thus the following
+                # commits wait until the failed commit is indexed
+                logger.exception(e)
+                failures += 1
+                with self._condition:
+                    self.error = e
+                    self._condition.notify_all()
+                delay = min(self.RETRY_DELAY * 2 ** (failures - 1), self.RETRY_MAX)
+                logger.warning('Retrying to index commit {} in {}s'.format(commit.id, delay))
+                time.sleep(delay)
+                continue
+
+            failures = 0
+            with self._condition:
+                self.error = None
+                self._queue.popleft()
+                self.indexed = commit.id
+                self._condition.notify_all()
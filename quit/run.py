@@ -11,8 +11,6 @@ from werkzeug.middleware.dispatcher import DispatcherMiddleware
 
 logger = logging.getLogger('quit.run')
 
-sys.setrecursionlimit(2 ** 15)
-
 defaults = getDefaults()
 env = parseEnv()
 args = parseArgs(sys.argv[1:])
@@ -0,0 +1,199 @@
+"""Read-only snapshots of the graphs of immutable commits as sorted NumPy arrays.
+
+A blob never changes, thus its triples can be kept in a representation which is built once and
+only read afterwards. A SnapshotIndex encodes the terms of a blob to integers and keeps the triples
+three times, sorted in SPO, POS and OSP order. A triple pattern is answered by a binary search on
+the columns of the matching order and the result is decoded block by block with a single NumPy
+indexing operation. The arrays are written as .npy files, which are memory-mapped when loaded, so
+several processes share one copy in the page cache.
+
+NumPy is an optional dependency, it is only needed if the snapshot index is enabled.
+"""
+
+import logging
+import marshal
+import os
+import shutil
+import threading
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from quit.cache import decode_term, encode_term
+from quit.termstore import _INDEXES, _ORDERS
+
+logger = logging.getLogger('quit.snapshot')
+
+# the inverse permutations to restore the SPO column order of an index
+_COLUMNS = {'spo': [0, 1, 2], 'pos': [2, 0, 1], 'osp': [1, 2, 0]}
+
+
+class SnapshotIndex(object):
+    """The triples of a graph as arrays of term ids in SPO, POS and OSP order."""
+
+    BLOCK_SIZE = 10000
+
+    def __init__(self, terms, arrays):
+        """Initialize an index.
+
+        Args:
+            terms: a list of the terms, the position of a term is its id
+            arrays: a dict of the order name to an array of shape (3, n), the columns of the
+                triples in that order sorted lexicographically
+        """
+        self.terms = numpy.empty(len(terms), dtype=object)
+        self.terms[:] = terms
+        self._terms = list(terms)
+        self.arrays = arrays
+        self._ids = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, triples):
+        """Build an index from an iterable of (s, p, o) tuples."""
+        ids = {}
+        terms = []
+        rows = []
+        for triple in triples:
+            for term in triple:
+                id = ids.get(term)
+                if id is None:
+                    id = ids[term] = len(terms)
+                    terms.append(term)
+                rows.append(id)
+
+        spo = numpy.array(rows, dtype=numpy.uint32).reshape(-1, 3)
+        if len(spo):
+            spo = numpy.unique(spo, axis=0)
+        arrays = {}
+        for name, order in _ORDERS.items():
+            # each column is kept contiguous, so a range of it can be searched without a copy
+            columns = spo[:, list(order)].T
+            arrays[name] = numpy.ascontiguousarray(
+                columns[:, numpy.lexsort((columns[2], columns[1], columns[0]))])
+        index = cls(terms, arrays)
+        index._ids = ids
+        return index
+
+    def _id(self, term):
+        if self._ids is None:
+            with self._lock:
+                if self._ids is None:
+                    self._ids = {term: id for id, term in enumerate(self.terms)}
+        return self._ids.get(term)
+
+    def _range(self, triple):
+        """Return the name of the index and the range of rows matching a pattern or None."""
+        ids = []
+        for term in triple:
+            if term is None:
+                ids.append(None)
+                continue
+            id = self._id(term)
+            if id is None:
+                return None
+            ids.append(id)
+
+        bound = tuple(id is not None for id in ids)
+        if bound not in _INDEXES:
+            return 'spo', 0, len(self)
+
+        name, length = _INDEXES[bound]
+        columns = self.arrays[name]
+        lo, hi = 0, len(self)
+        for column, position in enumerate(_ORDERS[name][:length]):
+            values = columns[column, lo:hi]
+            # a key of another type than the array would convert the whole array
+            key = values.dtype.type(ids[position])
+            lo, hi = (lo + int(values.searchsorted(key, 'left')),
+                      lo + int(values.searchsorted(key, 'right')))
+        return name, lo, hi
+
+    def blocks(self, triple, size=None):
+        """Yield the triples matching a pattern as lists of at most size (s, p, o) tuples."""
+        size = size or self.BLOCK_SIZE
+        match = self._range(triple)
+        if match is None:
+            return
+        name, lo, hi = match
+        columns = self.arrays[name]
+        if hi - lo <= 16:
+            # NumPy calls cost more than they save on a few triples
+            terms = self._terms
+            block = columns[:, lo:hi][_COLUMNS[name]].tolist()
+            yield [(terms[s], terms[p], terms[o]) for s, p, o in zip(*block)]
+            return
+        for start in range(lo, hi, size):
+            block = columns[:, start:min(start + size, hi)][_COLUMNS[name]]
+            yield list(zip(*self.terms[block].tolist()))
+
+    def count(self, triple):
+        """Return the number of triples matching a pattern."""
+        match = self._range(triple)
+        return 0 if match is None else match[2] - match[1]
+
+    def __len__(self):
+        return self.arrays['spo'].shape[1]
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays.values())
+
+
+class SnapshotStore(object):
+    """A directory of snapshot indexes keyed by the blob oid.
+
+    Every index is a directory with a .npy file per order and the marshalled term table. An index
+    is written to a temporary directory and renamed, thus readers never see a partial index.
+    """
+
+    def __init__(self, path):
+        if numpy is None:
+            raise ImportError('The snapshot index needs NumPy, install it with pip install numpy')
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _directory(self, oid):
+        return os.path.join(self.path, oid[:2], oid[2:])
+
+    def get(self, oid):
+        """Load the index of a blob with memory-mapped arrays.
+
+        Raises:
+            KeyError if there is no index for the blob
+        """
+        directory = self._directory(oid)
+        if not os.path.isdir(directory):
+            raise KeyError(oid)
+        try:
+            with open(os.path.join(directory, 'terms'), 'rb') as f:
+                terms = [decode_term(entry) for entry in marshal.load(f)]
+            arrays = {name: numpy.load(os.path.join(directory, name + '.npy'), mmap_mode='r')
+                      for name in _ORDERS}
+        except (OSError, ValueError, EOFError, TypeError) as e:
+            logger.warning('Dropping damaged snapshot {}: {}'.format(oid, e))
+            shutil.rmtree(directory, ignore_errors=True)
+            raise KeyError(oid)
+        return SnapshotIndex(terms, arrays)
+
+    def set(self, oid, index):
+        """Write the index of a blob, an existing index is kept."""
+        directory = self._directory(oid)
+        if os.path.isdir(directory):
+            return
+        os.makedirs(os.path.dirname(directory), exist_ok=True)
+        tmp = '{}.{}.{}.tmp'.format(directory, os.getpid(), threading.get_ident())
+        os.makedirs(tmp)
+        try:
+            with open(os.path.join(tmp, 'terms'), 'wb') as f:
+                marshal.dump([encode_term(term) for term in index.terms], f)
+            for name, array in index.arrays.items():
+                numpy.save(os.path.join(tmp, name + '.npy'), array)
+            os.rename(tmp, directory)
+        except OSError:
+            # another process has written the same index in the meantime
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not os.path.isdir(directory):
+                raise
@@ -0,0 +1,246 @@
+"""Cardinality statistics of graphs, used to order the triple patterns of a query.
+
+The statistics of a graph are the number of triples, of distinct subjects and of distinct objects,
+and the same numbers for each predicate. They estimate the number of triples matching a pattern
+without evaluating it.
+
+The StatisticsCatalog keeps the statistics of the blobs which have been parsed or committed by their
+oid. A blob never changes, thus its statistics are computed once and the statistics of a new
+version of a graph are derived from its parent version and the changes of the commit.
+"""
+
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from rdflib import URIRef
+from rdflib.paths import Path
+from quit.graphs import InMemoryAggregatedGraph, LazyGraph, OverlayGraph
+
+logger = logging.getLogger('quit.statistics')
+
+
+class GraphStatistics(object):
+    """The number of triples, distinct subjects and objects of a graph and of each predicate."""
+
+    def __init__(self, triples=0, subjects=0, objects=0, predicates=None):
+        self.triples = triples
+        self.subjects = subjects
+        self.objects = objects
+        # predicate -> [triples, distinct subjects, distinct objects]
+        self.predicates = predicates if predicates is not None else {}
+
+    @classmethod
+    def fromTriples(cls, triples):
+        """Compute the statistics of an iterable of (s, p, o) tuples."""
+        subjects = set()
+        objects = set()
+        predicates = {}
+        count = 0
+        for s, p, o in triples:
+            count += 1
+            subjects.add(s)
+            objects.add(o)
+            entry = predicates.get(p)
+            if entry is None:
+                entry = predicates[p] = [0, set(), set()]
+            entry[0] += 1
+            entry[1].add(s)
+            entry[2].add(o)
+        return cls(count, len(subjects), len(objects), {
+            p: [n, len(s), len(o)] for p, (n, s, o) in predicates.items()})
+
+    def __add__(self, other):
+        """Combine the statistics of two graphs, distinct terms are counted in both."""
+        predicates = {p: list(entry) for p, entry in self.predicates.items()}
+        for p, entry in other.predicates.items():
+            if p in predicates:
+                predicates[p] = [a + b for a, b in zip(predicates[p], entry)]
+            else:
+                predicates[p] = list(entry)
+        return GraphStatistics(self.triples + other.triples, self.subjects + other.subjects,
+                               self.objects + other.objects, predicates)
+
+    def applyChanges(self, before, after, changesets):
+        """Return the statistics of a graph after changes without a scan of the graph.
+
+        The counts are adjusted by the changed triples, a term of a changed triple is a new
+        distinct term if it did not occur in its position before and does now, the graphs are only
+        asked for these terms.
+
+        Args:
+            before: the graph described by these statistics
+            after: the graph after the changes
+            changesets: a list of changesets with ('additions', triples) and ('removals', triples)
+                which only contain triples that were actually added or removed
+        """
+        predicates = {p: list(entry) for p, entry in self.predicates.items()}
+        count = self.triples
+        subjects, objects, pairs = set(), set(), set()
+        for changeset in changesets:
+            for op, triples in changeset:
+                sign = 1 if op == 'additions' else -1
+                for s, p, o in triples:
+                    count += sign
+                    predicates.setdefault(p, [0, 0, 0])[0] += sign
+                    subjects.add(s)
+                    objects.add(o)
+                    pairs.add((s, p, o))
+
+        def change(pattern):
+            return (pattern in after) - (pattern in before)
+
+        for s, p in set((s, p) for s, p, _ in pairs):
+            predicates[p][1] += change((s, p, None))
+        for p, o in set((p, o) for _, p, o in pairs):
+            predicates[p][2] += change((None, p, o))
+        return GraphStatistics(
+            count,
+            self.subjects + sum(change((s, None, None)) for s in subjects),
+            self.objects + sum(change((None, None, o)) for o in objects),
+            {p: entry for p, entry in predicates.items() if entry[0] > 0})
+
+    def toDict(self):
+        """Return the statistics as a dictionary which can be serialized to JSON."""
+        return {
+            'triples': self.triples,
+            'subjects': self.subjects,
+            'objects': self.objects,
+            'predicates': {
+                str(p): {'triples': n, 'subjects': s, 'objects': o}
+                for p, (n, s, o) in self.predicates.items()}
+        }
+
+    @classmethod
+    def fromDict(cls, data):
+        """Restore statistics from the dictionary returned by toDict()."""
+        return cls(data['triples'], data['subjects'], data['objects'], {
+            URIRef(p): [entry['triples'], entry['subjects'], entry['objects']]
+            for p, entry in data['predicates'].items()})
+
+    def estimate(self, s, p, o):
+        """Estimate the number of triples matching a pattern.
+
+        Every term is None if it is unbound, True if it is bound to a value which is not known yet
+        or the value.
+        """
+        if p is None or p is True or isinstance(p, Path):
+            count, subjects, objects = self.triples, self.subjects, self.objects
+            if p is True and self.predicates:
+                count /= len(self.predicates)
+        else:
+            count, subjects, objects = self.predicates.get(p, (0, 0, 0))
+        if not count:
+            return 0
+        if s is not None:
+            count /= max(subjects, 1)
+        if o is not None:
+            count /= max(objects, 1)
+        return count
+
+
+class StatisticsCatalog(object):
+    """The statistics of the graphs of blobs by the oid of the blob.
+
+    At most capacity entries are kept in memory, the least recently used are dropped. If a path is
+    given, the statistics are also written to a file per blob in that directory. They are read
+    from there when they are not in memory, thus they survive evictions and restarts.
+    """
+
+    def __init__(self, capacity=10000, path=None):
+        self.capacity = capacity
+        self.path = path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def __contains__(self, oid):
+        try:
+            self.get(oid)
+        except KeyError:
+            return False
+        return True
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, oid):
+        """Get the statistics of a blob.
+
+        Raises:
+            KeyError if the statistics of the blob are not known
+        """
+        oid = str(oid)
+        with self._lock:
+            try:
+                self._entries.move_to_end(oid)
+                return self._entries[oid]
+            except KeyError:
+                pass
+        if self.path is None:
+            raise KeyError(oid)
+
+        try:
+            with open(self._file(oid), 'r', encoding='utf-8') as f:
+                statistics = GraphStatistics.fromDict(json.load(f))
+        except FileNotFoundError:
+            raise KeyError(oid)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning('Dropping damaged statistics of blob {}: {}'.format(oid, e))
+            raise KeyError(oid)
+        with self._lock:
+            self._add(oid, statistics)
+        return statistics
+
+    def set(self, oid, statistics):
+        oid = str(oid)
+        if self.path is not None:
+            filename = self._file(oid)
+            tmp = '{}.{}.tmp'.format(filename, threading.get_ident())
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(statistics.toDict(), f)
+            os.replace(tmp, filename)
+        with self._lock:
+            self._add(oid, statistics)
+        return statistics
+
+    def _add(self, oid, statistics):
+        self._entries[oid] = statistics
+        self._entries.move_to_end(oid)
+        while self.capacity is not None and len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def _file(self, oid):
+        return os.path.join(self.path, oid + '.json')
+
+
+def graphStatistics(graph):
+    """Return the statistics of a graph.
+
+    A graph can provide its statistics in a statistics attribute, otherwise they are computed by
+    a scan of the graph and kept in that attribute. Lazy graphs and overlays are created for each
+    query and update, their statistics are taken from the graph they wrap, the additions of an
+    overlay are counted and its removals are neglected. The statistics of an aggregated graph are
+    combined from the statistics of its graphs.
+    """
+    statistics = getattr(graph, 'statistics', None)
+    if statistics is not None:
+        return statistics
+    if isinstance(graph, LazyGraph):
+        return graphStatistics(graph._load())
+    if isinstance(graph, OverlayGraph):
+        statistics = graphStatistics(graph._base)
+        if len(graph._additions):
+            statistics += GraphStatistics.fromTriples(graph._additions)
+        return statistics
+
+    if isinstance(graph, InMemoryAggregatedGraph):
+        statistics = GraphStatistics()
+        for context in graph.contexts():
+            statistics += graphStatistics(context)
+    else:
+        statistics = GraphStatistics.fromTriples(graph.triples((None, None, None)))
+    graph.statistics = statistics
+    return statistics
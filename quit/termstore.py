@@ -0,0 +1,266 @@
+"""A compact rdflib store which keeps triples as integer-encoded arrays.
+
+Every term is encoded once per process by a TermDictionary, thus identical IRIs and literals are
+shared by all graphs and versions. The dictionary counts how often a term is used by the stores and
+forgets it, and reuses its id, once the last store holding it was dropped.
+
+A CompactStore keeps the encoded triples of one graph in three sorted columns of unsigned integers
+(SPO order) and builds permutations for the POS and OSP orders on demand. Additions are buffered
+and merged into the columns when the store is read.
+"""
+
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from rdflib import Graph
+from rdflib.store import Store
+
+# which columns are bound by a pattern -> (index, length of the bound prefix of its key)
+_INDEXES = {
+    (True, False, False): ('spo', 1),
+    (True, True, False): ('spo', 2),
+    (True, True, True): ('spo', 3),
+    (False, True, False): ('pos', 1),
+    (False, True, True): ('pos', 2),
+    (False, False, True): ('osp', 1),
+    (True, False, True): ('osp', 2),
+}
+
+# the order of the columns in the key of an index
+_ORDERS = {'spo': (0, 1, 2), 'pos': (1, 2, 0), 'osp': (2, 0, 1)}
+
+
+class TermDictionary(object):
+    """Map rdflib terms to integers and back, a term is only kept once.
+
+    Every call of encode counts one use of the term, release gives uses back. A term which is no
+    longer used is dropped and its id is handed out again.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._terms = []
+        self._counts = []
+        self._free = []
+        self._lock = threading.Lock()
+
+    def encode(self, term):
+        """Return the id of a term, a new id is assigned to unknown terms."""
+        with self._lock:
+            return self._encode(term)
+
+    def encodeAll(self, terms):
+        """Return the ids of several terms, like encode but taking the lock only once."""
+        with self._lock:
+            return array('I', (self._encode(term) for term in terms))
+
+    def _encode(self, term):
+        id = self._ids.get(term)
+        if id is not None:
+            self._counts[id] += 1
+            return id
+        if self._free:
+            id = self._free.pop()
+            self._terms[id] = term
+            self._counts[id] = 1
+        else:
+            id = len(self._terms)
+            self._terms.append(term)
+            self._counts.append(1)
+        self._ids[term] = id
+        return id
+
+    def release(self, ids):
+        """Give back one use of every id, unused terms are dropped."""
+        with self._lock:
+            for id in ids:
+                self._counts[id] -= 1
+                if not self._counts[id]:
+                    del self._ids[self._terms[id]]
+                    self._terms[id] = None
+                    self._free.append(id)
+
+    def lookup(self, term):
+        """Return the id of a term or None if the term is unknown."""
+        return self._ids.get(term)
+
+    def decode(self, id):
+        return self._terms[id]
+
+    def __len__(self):
+        return len(self._ids)
+
+
+terms = TermDictionary()
+
+
+class _Keys(object):
+    """A sequence of the key prefixes of an index, used to bisect it."""
+
+    def __init__(self, columns, permutation, length):
+        self.columns = columns
+        self.permutation = permutation
+        self.length = length
+
+    def __len__(self):
+        return len(self.permutation) if self.permutation is not None else len(self.columns[0])
+
+    def __getitem__(self, i):
+        row = self.permutation[i] if self.permutation is not None else i
+        return tuple(column[row] for column in self.columns[:self.length])
+
+
+class CompactStore(Store):
+    """A store for the triples of a single graph encoded as arrays of term ids.
+
+    A triple takes 12 bytes in the columns and 4 bytes per built permutation. The store is not
+    context aware, like the Memory store of a Graph it holds exactly one graph.
+    """
+
+    context_aware = False
+    formula_aware = False
+    transaction_aware = False
+    graph_aware = False
+
+    def __init__(self, configuration=None, identifier=None, dictionary=None):
+        super().__init__(configuration=configuration, identifier=identifier)
+        self.dictionary = dictionary if dictionary is not None else terms
+        self._columns = (array('I'), array('I'), array('I'))
+        self._permutations = {}
+        self._pending = array('I')
+        self._lock = threading.Lock()
+        self._namespaces = {}
+        self._prefixes = {}
+
+    def add(self, triple, context, quoted=False):
+        ids = self.dictionary.encodeAll(triple)
+        with self._lock:
+            self._pending.extend(ids)
+
+    def addN(self, quads):
+        ids = self.dictionary.encodeAll(term for s, p, o, c in quads for term in (s, p, o))
+        with self._lock:
+            self._pending.extend(ids)
+
+    def remove(self, triple, context=None):
+        triple = triple or (None, None, None)
+        with self._lock:
+            self._merge()
+            rows = self._match(triple)
+            if rows is None:
+                return
+            removed = set(rows)
+            if not removed:
+                return
+            s, p, o = self._columns
+            keep = [i for i in range(len(s)) if i not in removed]
+            self._columns = tuple(array('I', (column[i] for i in keep)) for column in (s, p, o))
+            self._permutations = {}
+        self.dictionary.release(id for i in removed for id in (s[i], p[i], o[i]))
+
+    def triples(self, triple, context=None):
+        with self._lock:
+            self._merge()
+            s, p, o = self._columns
+            rows = self._match(triple)
+        if rows is None:
+            return
+        decode = self.dictionary._terms
+        for i in rows:
+            yield (decode[s[i]], decode[p[i]], decode[o[i]]), ()
+
+    def __len__(self, context=None):
+        with self._lock:
+            self._merge()
+            return len(self._columns[0])
+
+    def contexts(self, triple=None):
+        return iter(())
+
+    def __del__(self):
+        # give the terms back to the dictionary, which may already be gone at interpreter exit
+        try:
+            self.dictionary.release(self._pending)
+            for column in self._columns:
+                self.dictionary.release(column)
+        except Exception:
+            pass
+
+    def _merge(self):
+        """Merge the buffered additions into the sorted columns."""
+        if not self._pending:
+            return
+        pending = self._pending
+        rows = set(zip(*self._columns))
+        duplicates = array('I')
+        for row in zip(pending[0::3], pending[1::3], pending[2::3]):
+            if row in rows:
+                duplicates.extend(row)
+            else:
+                rows.add(row)
+        # every row holds one use of its terms, a duplicate gives its uses back
+        self.dictionary.release(duplicates)
+        rows = sorted(rows)
+        self._columns = tuple(array('I', (row[i] for row in rows)) for i in range(3))
+        self._permutations = {}
+        self._pending = array('I')
+
+    def _permutation(self, name):
+        if name == 'spo':
+            return None
+        permutation = self._permutations.get(name)
+        if permutation is None:
+            columns = [self._columns[i] for i in _ORDERS[name]]
+            permutation = array('I', sorted(range(len(columns[0])),
+                                            key=lambda i: tuple(c[i] for c in columns)))
+            self._permutations[name] = permutation
+        return permutation
+
+    def _match(self, triple):
+        """Return the rows matching a pattern or None if a bound term is unknown."""
+        ids = []
+        for term in triple[:3]:
+            if term is None:
+                ids.append(None)
+                continue
+            id = self.dictionary.lookup(term)
+            if id is None:
+                return None
+            ids.append(id)
+
+        bound = tuple(id is not None for id in ids)
+        if bound not in _INDEXES:
+            return range(len(self._columns[0]))
+
+        name, length = _INDEXES[bound]
+        order = _ORDERS[name]
+        permutation = self._permutation(name)
+        keys = _Keys([self._columns[i] for i in order], permutation, length)
+        key = tuple(ids[i] for i in order[:length])
+        lo = bisect_left(keys, key)
+        hi = bisect_right(keys, key, lo)
+        if permutation is None:
+            return range(lo, hi)
+        return permutation[lo:hi]
+
+    def bind(self, prefix, namespace, override=True):
+        if not override and namespace in self._prefixes:
+            return
+        self._prefixes.pop(self._namespaces.get(prefix), None)
+        self._namespaces.pop(self._prefixes.get(namespace), None)
+        self._namespaces[prefix] = namespace
+        self._prefixes[namespace] = prefix
+
+    def namespace(self, prefix):
+        return self._namespaces.get(prefix)
+
+    def prefix(self, namespace):
+        return self._prefixes.get(namespace)
+
+    def namespaces(self):
+        return iter(list(self._namespaces.items()))
+
+
+def compact_graph(identifier=None, namespace_manager=None):
+    """Create a Graph backed by a CompactStore."""
+    return Graph(store=CompactStore(), identifier=identifier, namespace_manager=namespace_manager)
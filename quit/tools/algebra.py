@@ -10,6 +10,8 @@ import functools
 import operator
 import collections
 
+import rdflib.plugins.sparql
+
 from rdflib import Literal, Variable, URIRef, BNode
 
 from rdflib.plugins.sparql.sparql import Prologue, Query
@@ -22,6 +24,8 @@ from rdflib.paths import (
 from pyparsing import ParseResults
 from functools import reduce
 
+from quit.tools import optimizer
+
 
 # ---------------------------
 # Some convenience methods
@@ -84,12 +88,53 @@ def _knownTerms(triple, varsknown, varscount):
             )
 
 
-def reorderTriples(l):
+def _planTriples(patterns, statistics, bindings=None):
+    """
+    Order triple patterns greedily by the estimated number of matching
+    triples, variables of the patterns ordered before count as bound
+    """
+    remaining = list(patterns)
+    varsknown = set()
+    varscount = collections.defaultdict(int)
+    for t in remaining:
+        for c in t:
+            if isinstance(c, (Variable, BNode)):
+                varscount[c] += 1
+
+    def _term(term):
+        if not isinstance(term, (Variable, BNode)):
+            return term
+        value = bindings.get(term) if bindings is not None else None
+        if value is not None:
+            return value
+        return True if term in varsknown else None
+
+    def _cost(i):
+        t = remaining[i]
+        return (statistics.estimate(*(_term(c) for c in t)),
+                _knownTerms(t, varsknown, varscount), i)
+
+    plan = []
+    while remaining:
+        t = remaining.pop(min(range(len(remaining)), key=_cost))
+        plan.append(t)
+        varsknown.update(c for c in t if isinstance(c, (Variable, BNode)))
+    return plan
+
+
+def reorderTriples(l, statistics=None, bindings=None):
     """
     Reorder triple patterns so that we execute the
     ones with most bindings first
+
+    If the statistics of the graph are given, the patterns are ordered by
+    their estimated number of matches, bindings gives the values of the
+    variables which are already bound
     """
 
+    if statistics is not None:
+        return _planTriples(l, statistics, bindings)
+
     def _addvar(term, varsknown):
         if isinstance(term, (Variable, BNode)):
             varsknown.add(term)
@@ -645,6 +690,59 @@ def analyse(n, children):
         return True
 
 
+def _graphIris(e, iris, inGraph=False):
+    """
+    Collect the IRIs of GRAPH <iri> patterns in iris
+
+    raise StopTraversal if any graph could be read
+    """
+
+    if isinstance(e, (list, ParseResults, tuple)):
+        for x in e:
+            _graphIris(x, iris, inGraph)
+    elif isinstance(e, CompValue):
+        # patterns of EXISTS may still be in their parse-tree form
+        if e.name in ('Graph', 'GraphGraphPattern'):
+            if not isinstance(e.term, URIRef):
+                raise StopTraversal(None)
+            iris.add(e.term)
+            inGraph = True
+        elif e.name in ('BGP', 'TriplesBlock') and e.triples and not inGraph:
+            if rdflib.plugins.sparql.SPARQL_DEFAULT_GRAPH_UNION:
+                # the default graph is the union of all graphs
+                raise StopTraversal(None)
+        for k, val in e.items():
+            if k != '_vars':
+                _graphIris(val, iris, inGraph)
+
+
+def collectGraphIris(q):
+    """
+    Collect the constant graph IRIs a translated query reads from
+
+    Returns a set with the IRIs of all GRAPH <iri> patterns and FROM
+    clauses or None if the query can read from any graph, i.e. if it
+    contains GRAPH ?var or reads the default graph while the default graph
+    is the union of all graphs
+    """
+
+    main = q.algebra if isinstance(q, Query) else q
+
+    iris = set()
+    for d in main.datasetClause or []:
+        if d.default:
+            iris.add(d.default)
+        elif d.named:
+            iris.add(d.named)
+
+    try:
+        _graphIris(main.p, iris)
+    except StopTraversal as st:
+        return st.rv
+
+    return iris
+
+
 def translatePrologue(p, base, initNs=None, prologue=None):
 
     if prologue is None:
@@ -759,8 +857,13 @@ def translateQuery(q, base=None, initNs=None):
         res = CompValue(q[1].name, p=P, datasetClause=datasetClause, PV=PV)
 
     res = traverse(res, visitPost=simplify)
+    if optimizer.DEBUG:
+        pprintAlgebra(Query(prologue, res))
+    res = optimizer.optimize(res)
     _traverseAgg(res, visitor=analyse)
     _traverseAgg(res, _addVars)
+    if optimizer.DEBUG:
+        pprintAlgebra(Query(prologue, res))
 
     return Query(prologue, res)
 
@@ -15,23 +15,33 @@ also return a dict of list of dicts
 """
 
 import collections
+import heapq
+import itertools
+import pickle
+import tempfile
 
 from rdflib import Variable, Graph, BNode, URIRef, Literal
 from six import iteritems, itervalues
 
 from rdflib.plugins.sparql import CUSTOM_EVALS
-from rdflib.plugins.sparql.parserutils import value
+from rdflib.plugins.sparql.parserutils import CompValue, value
 from rdflib.plugins.sparql.sparql import (
     QueryContext, AlreadyBound, FrozenBindings, SPARQLError)
 from rdflib.plugins.sparql.evalutils import (
-    _filter, _eval, _join, _diff, _minus, _fillTemplate, _ebv, _val)
+    _filter, _eval, _join, _diff, _fillTemplate, _ebv, _val)
 
 from rdflib.plugins.sparql.aggregates import Aggregator
 from rdflib.plugins.sparql.algebra import Join, ToMultiSet, Values
 
+from quit.statistics import graphStatistics
+from quit.tools.algebra import reorderTriples
 from quit.web import service
 from quit.exceptions import UnSupportedQuery, UnSupportedQueryType, FromNamedError
 
+# the solutions of the build side of a hash join are partitioned on disk beyond this number
+HASH_JOIN_MEMORY_ROWS = 100000
+HASH_JOIN_PARTITIONS = 64
+
 def evalBGP(ctx, bgp):
 
     """
@@ -48,29 +58,48 @@ def evalBGP(ctx, bgp):
     _p = ctx[p]
     _o = ctx[o]
 
-    for ss, sp, so in ctx.graph.triples((_s, _p, _o)):
-        if None in (_s, _p, _o):
-            c = ctx.push()
-        else:
-            c = ctx
+    # the statistics only tell predicates apart, the remaining patterns are
+    # planned again if this pattern binds a variable in their predicate position
+    rest = bgp[1:]
+    replan = len(rest) > 1 and any(
+        ctx[t[1]] is None and t[1] in (s, p, o) for t in rest)
 
-        if _s is None:
-            c[s] = ss
+    for block in _blocks(ctx.graph, (_s, _p, _o)):
+        for ss, sp, so in block:
+            if None in (_s, _p, _o):
+                c = ctx.push()
+            else:
+                c = ctx
 
-        try:
-            if _p is None:
-                c[p] = sp
-        except AlreadyBound:
-            continue
+            if _s is None:
+                c[s] = ss
 
-        try:
-            if _o is None:
-                c[o] = so
-        except AlreadyBound:
-            continue
+            try:
+                if _p is None:
+                    c[p] = sp
+            except AlreadyBound:
+                continue
 
-        for x in evalBGP(c, bgp[1:]):
-            yield x
+            try:
+                if _o is None:
+                    c[o] = so
+            except AlreadyBound:
+                continue
+
+            if replan:
+                rest = reorderTriples(bgp[1:], graphStatistics(ctx.graph), c)
+            for x in evalBGP(c, rest):
+                yield x
+
+
+def _blocks(graph, triple):
+    """
+    Return the matching triples in blocks if the graph supports it
+    """
+    blocks = getattr(graph, 'blocks', None)
+    if blocks is not None:
+        return blocks(triple)
+    return (graph.triples(triple),)
 
 
 def evalExtend(ctx, extend):
@@ -82,6 +111,10 @@ def evalExtend(ctx, extend):
             if isinstance(e, SPARQLError):
                 raise e
 
+            # the variable may be bound by the solution a lazy join pushed into this part
+            bound = c.get(extend.var)
+            if bound is not None and bound != e:
+                continue
             yield c.merge({extend.var: e})
 
         except SPARQLError:
@@ -109,25 +142,30 @@ def evalJoin(ctx, join):
     if join.lazy:
         return evalLazyJoin(ctx, join)
     else:
-        a = evalPart(ctx, join.p1)
-        b = set(evalPart(ctx, join.p2))
-        return _join(a, b)
+        return evalHashJoin(ctx, join)
 
 
 def evalUnion(ctx, union):
+    """
+    A solution of a part is skipped if an earlier part yielded it, a
+    flattened union has a list of parts instead of p1 and p2
+    """
+    parts = union['parts'] if 'parts' in union else (union.p1, union.p2)
     res = set()
-    for x in evalPart(ctx, union.p1):
-        res.add(x)
-        yield x
-    for x in evalPart(ctx, union.p2):
-        if x not in res:
-            yield x
+    for i, part in enumerate(parts):
+        seen = set()
+        for x in evalPart(ctx, part):
+            if x not in res:
+                if i < len(parts) - 1:
+                    seen.add(x)
+                yield x
+        res |= seen
 
 
 def evalMinus(ctx, minus):
-    a = evalPart(ctx, minus.p1)
-    b = set(evalPart(ctx, minus.p2))
-    return _minus(a, b)
+    for a, matches in _hashMatches(ctx, minus.p1, minus.p2):
+        if all(a.disjointDomain(b) for b in matches):
+            yield a
 
 
 def evalLeftJoin(ctx, join):
@@ -153,6 +191,180 @@ def evalLeftJoin(ctx, join):
                 yield a
 
 
+class _HashTable(object):
+    """
+    The solutions of the build side of a hash join, indexed by the values of
+    the join variables
+
+    A solution may not bind all join variables, an index on the bound ones
+    is built on demand
+    """
+
+    def __init__(self, solutions, variables):
+        self.solutions = solutions
+        self.variables = variables
+        self._indexes = {}
+
+    def matches(self, solution):
+        """
+        Return the solutions which are compatible with solution
+        """
+        key = tuple(v for v in self.variables if v in solution)
+        index = self._indexes.get(key)
+        if index is None:
+            index = self._indexes[key] = collections.defaultdict(list)
+            for row in self.solutions:
+                index[tuple(row[v] for v in key)].append(row)
+        candidates = index.get(tuple(solution[v] for v in key), ())
+        return [row for row in candidates if solution.compatible(row)]
+
+
+def _bound(solutions):
+    """
+    Return the variables bound in all solutions
+    """
+    bound = None
+    for solution in solutions:
+        bound = set(solution) if bound is None else bound.intersection(solution)
+    return bound or set()
+
+
+def _spill(solutions, f, batch=1000):
+    """
+    Write solutions to a file, return the variables bound in all of them
+    """
+    bound = None
+    rows = []
+    for solution in solutions:
+        bound = set(solution) if bound is None else bound.intersection(solution)
+        rows.append(tuple(solution.items()))
+        if len(rows) == batch:
+            pickle.dump(rows, f, pickle.HIGHEST_PROTOCOL)
+            rows = []
+    if rows:
+        pickle.dump(rows, f, pickle.HIGHEST_PROTOCOL)
+    f.seek(0)
+    return bound or set()
+
+
+def _unspill(f):
+    while True:
+        try:
+            rows = pickle.load(f)
+        except EOFError:
+            f.seek(0)
+            return
+        yield from rows
+
+
+def _partition(f, variables, batch=1000):
+    """
+    Distribute the solutions of a file to files by the hash of the join variables
+    """
+    partitions = [tempfile.TemporaryFile() for _ in range(HASH_JOIN_PARTITIONS)]
+    buffers = [[] for _ in partitions]
+    for row in _unspill(f):
+        bindings = dict(row)
+        i = hash(tuple(bindings[v] for v in variables)) % HASH_JOIN_PARTITIONS
+        buffers[i].append(row)
+        if len(buffers[i]) == batch:
+            pickle.dump(buffers[i], partitions[i], pickle.HIGHEST_PROTOCOL)
+            buffers[i] = []
+    for partition, rows in zip(partitions, buffers):
+        if rows:
+            pickle.dump(rows, partition, pickle.HIGHEST_PROTOCOL)
+        partition.seek(0)
+    return partitions
+
+
+def _spilledMatches(ctx, probe, build):
+    """
+    A grace hash join: both sides are written to disk and partitioned by
+    the variables bound in all solutions of both sides, then each pair
+    of partitions is joined in memory
+    """
+    with tempfile.TemporaryFile() as buildFile, tempfile.TemporaryFile() as probeFile:
+        variables = tuple(_spill(build, buildFile) & _spill(probe, probeFile))
+        buildPartitions = _partition(buildFile, variables)
+        probePartitions = _partition(probeFile, variables)
+        try:
+            for b, a in zip(buildPartitions, probePartitions):
+                table = _HashTable(
+                    [FrozenBindings(ctx, row) for row in _unspill(b)], variables)
+                for row in _unspill(a):
+                    solution = FrozenBindings(ctx, row)
+                    yield solution, table.matches(solution)
+        finally:
+            for f in buildPartitions + probePartitions:
+                f.close()
+
+
+def _hashMatches(ctx, p1, p2):
+    """
+    Yield each solution of p1 with the list of compatible solutions of p2
+
+    The solutions of p2 are kept in a hash table on the variables they all
+    bind, if there are more than HASH_JOIN_MEMORY_ROWS solutions both
+    parts are partitioned on disk
+    """
+    build = evalPart(ctx, p2)
+    solutions = list(itertools.islice(build, HASH_JOIN_MEMORY_ROWS + 1))
+    if len(solutions) > HASH_JOIN_MEMORY_ROWS:
+        yield from _spilledMatches(
+            ctx, evalPart(ctx, p1), itertools.chain(solutions, build))
+        return
+
+    variables = _bound(solutions)
+    if p1._vars is not None:
+        variables &= p1._vars
+    table = _HashTable(solutions, tuple(variables))
+    for a in evalPart(ctx, p1):
+        yield a, table.matches(a)
+
+
+def evalHashJoin(ctx, join):
+    """
+    Join the parts by a hash table of the solutions of the second part,
+    used if the bindings of the first part can not be pushed into the second
+    """
+    for a, matches in _hashMatches(ctx, join.p1, join.p2):
+        for b in matches:
+            yield a.merge(b)
+
+
+def evalHashLeftJoin(ctx, join):
+    """
+    An OPTIONAL evaluated by a hash table of the solutions of the optional part,
+    which is evaluated only once instead of once per solution of the first part
+    """
+    for a, matches in _hashMatches(ctx, join.p1, join.p2):
+        ok = False
+        for b in matches:
+            c = a.merge(b)
+            if _ebv(join.expr, c):
+                ok = True
+                yield c
+        if not ok:
+            yield a
+
+
+def _lazy(part):
+    """
+    Check if the bindings of a solution can be pushed into a part, this is
+    not the case for sub-selects and joins which are not lazy, they would
+    be evaluated again for every solution
+    """
+    if not isinstance(part, CompValue):
+        return True
+    if part.name in ('Project', 'Slice', 'Distinct', 'Reduced', 'OrderBy', 'AggregateJoin'):
+        return False
+    if part.name == 'Join' and not part.lazy:
+        return False
+    if 'parts' in part:
+        return all(_lazy(p) for p in part['parts'])
+    return all(_lazy(part[p]) for p in ('p', 'p1', 'p2') if p in part)
+
+
 def evalFilter(ctx, part):
     # TODO: Deal with dict returned from evalPart!
     for c in evalPart(ctx, part.p):
@@ -220,9 +432,9 @@ def evalPart(ctx, part):
             pass  # the given custome-function did not handle this part
 
     if part.name == 'BGP':
-        # Reorder triples patterns by number of bound nodes in the current ctx
-        # Do patterns with more bound nodes first
-        triples = sorted(part.triples, key=lambda t: len([n for n in t if ctx[n] is None]))
+        # Reorder triples patterns by their estimated number of matches in
+        # the current graph, with the bindings of the current ctx
+        triples = reorderTriples(part.triples, graphStatistics(ctx.graph), ctx)
 
         return evalBGP(ctx, triples)
     elif part.name == 'Filter':
@@ -230,7 +442,9 @@ def evalPart(ctx, part):
     elif part.name == 'Join':
         return evalJoin(ctx, part)
     elif part.name == 'LeftJoin':
-        return evalLeftJoin(ctx, part)
+        if _lazy(part.p2):
+            return evalLeftJoin(ctx, part)
+        return evalHashLeftJoin(ctx, part)
     elif part.name == 'Graph':
         return evalGraph(ctx, part)
     elif part.name == 'Union':
@@ -317,35 +531,59 @@ def evalAggregateJoin(ctx, agg):
         yield FrozenBindings(ctx)
 
 
-def evalOrderBy(ctx, part):
+class _Descending(object):
+    """A sort key which orders its value in descending order."""
 
-    res = evalPart(ctx, part.p)
+    __slots__ = ('value',)
 
-    for e in reversed(part.expr):
+    def __init__(self, value):
+        self.value = value
 
-        reverse = bool(e.order and e.order == 'DESC')
-        res = sorted(res, key=lambda x: _val(value(x, e.expr, variables=True)), reverse=reverse)
+    def __eq__(self, other):
+        return self.value == other.value
 
-    return res
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+def _orderKey(conditions):
+    """Return a key function over all order conditions and whether to sort in reverse."""
+    exprs = [c.expr for c in conditions]
+    descending = [bool(c.order and c.order == 'DESC') for c in conditions]
+
+    if all(descending) or not any(descending):
+        def key(row):
+            return tuple(_val(value(row, e, variables=True)) for e in exprs)
+        return key, descending[0]
+
+    def key(row):
+        return tuple(_Descending(_val(value(row, e, variables=True))) if desc
+                     else _val(value(row, e, variables=True))
+                     for e, desc in zip(exprs, descending))
+    return key, False
+
+
+def evalOrderBy(ctx, part):
+    """Sort the solutions by all order conditions at once.
+
+    If the optimizer found a LIMIT above the ORDER BY it sets the number of solutions which are
+    requested as limit, then only these first solutions are kept in a heap.
+    """
+    res = evalPart(ctx, part.p)
+    key, reverse = _orderKey(part.expr)
+
+    if part.limit is None:
+        return sorted(res, key=key, reverse=reverse)
+    if reverse:
+        return heapq.nlargest(part.limit, res, key=key)
+    return heapq.nsmallest(part.limit, res, key=key)
 
 
 def evalSlice(ctx, slice):
-    # import pdb; pdb.set_trace()
     res = evalPart(ctx, slice.p)
-    i = 0
-    while i < slice.start:
-        next(res)
-        i += 1
-    i = 0
-    for x in res:
-        i += 1
-        if slice.length is None:
-            yield x
-        else:
-            if i <= slice.length:
-                yield x
-            else:
-                break
+    if slice.length is None:
+        return itertools.islice(res, slice.start, None)
+    return itertools.islice(res, slice.start, slice.start + slice.length)
 
 
 def evalReduced(ctx, part):
@@ -0,0 +1,435 @@
+"""
+Rewrite the SPARQL Algebra of a query before it is evaluated
+
+The translation keeps the structure of the query, a FILTER applies to the
+whole group it appears in and the projection is only applied at the end.
+The rules in this module rewrite the algebra into an equivalent one which
+discards solutions as early as possible:
+
+- constant folding evaluates expressions without variables once
+- filter pushdown moves each conjunct of a filter to the smallest part of
+  the pattern which binds all of its variables
+- equality substitution replaces a variable which a filter compares to an
+  IRI, or to any term with sameTerm, by that term in a basic graph pattern
+  or a GRAPH pattern and binds the variable afterwards
+- projection pushdown removes unused variables before the solutions are
+  sorted
+- union flattening evaluates nested unions as one union
+- a LIMIT above an ORDER BY is passed to the ORDER BY which then only keeps
+  the first solutions
+
+Set DEBUG to print the algebra before and after the rewrite.
+"""
+
+from types import MethodType
+
+from rdflib import Literal, URIRef, Variable
+from rdflib.graph import DATASET_DEFAULT_GRAPH_ID
+from rdflib.plugins.sparql.algebra import ToMultiSet, Values
+from rdflib.plugins.sparql.operators import and_, EBV, TrueFilter
+from rdflib.plugins.sparql.parserutils import CompValue, Expr
+from rdflib.plugins.sparql.sparql import FrozenBindings, QueryContext, SPARQLError
+
+# print the algebra before and after the rewrite with pprintAlgebra
+DEBUG = False
+
+# expressions which yield another value each time they are evaluated
+_VOLATILE = ('Builtin_RAND', 'Builtin_NOW', 'Builtin_UUID', 'Builtin_STRUUID', 'Builtin_BNODE')
+
+# expressions which depend on more than the variables they mention
+_UNMOVABLE = ('Builtin_EXISTS', 'Builtin_NOTEXISTS')
+
+
+class _Unsafe(Exception):
+    """Raised if a variable can not be substituted in a part of the algebra."""
+
+
+def _copy(node, **values):
+    """Copy a node of the algebra, expressions keep their evaluation function."""
+    if isinstance(node, Expr):
+        result = Expr(node.name)
+        if node._evalfn is not None:
+            result._evalfn = MethodType(node._evalfn.__func__, result)
+    else:
+        result = CompValue(node.name)
+    for k, v in node.items():
+        if k != '_vars':
+            result[k] = v
+    result.update(values)
+    return result
+
+
+def _variables(e, res=None):
+    """Collect the variables of an expression or a part of the algebra."""
+    if res is None:
+        res = set()
+    if isinstance(e, Variable):
+        res.add(e)
+    elif isinstance(e, (list, tuple)):
+        for x in e:
+            _variables(x, res)
+    elif isinstance(e, CompValue):
+        for k, v in e.items():
+            if k != '_vars':
+                _variables(v, res)
+    elif isinstance(e, dict):
+        _variables(list(e.keys()), res)
+    return res
+
+
+def _names(e, res=None):
+    """Collect the names of all expressions within an expression."""
+    if res is None:
+        res = set()
+    if isinstance(e, (list, tuple)):
+        for x in e:
+            _names(x, res)
+    elif isinstance(e, CompValue):
+        res.add(e.name)
+        for k, v in e.items():
+            if k != '_vars':
+                _names(v, res)
+    return res
+
+
+def _certain(part):
+    """Return the variables which are bound in every solution of a part."""
+    name = part.name
+    if name == 'BGP':
+        return set(t for triple in part.triples for t in triple if isinstance(t, Variable))
+    elif name == 'Join':
+        return _certain(part.p1) | _certain(part.p2)
+    elif name in ('LeftJoin', 'Minus'):
+        return _certain(part.p1)
+    elif name in ('Filter', 'Distinct', 'Reduced', 'OrderBy', 'Slice'):
+        return _certain(part.p)
+    elif name == 'Extend':
+        if isinstance(part.expr, (URIRef, Literal)):
+            return _certain(part.p) | {part.var}
+        return _certain(part.p)
+    elif name == 'Graph':
+        res = _certain(part.p)
+        if isinstance(part.term, Variable):
+            res.add(part.term)
+        return res
+    elif name == 'Union':
+        parts = _unionParts(part)
+        return set.intersection(*(_certain(p) for p in parts))
+    elif name == 'Project':
+        return _certain(part.p) & set(part.PV)
+    elif name == 'ToMultiSet':
+        if part.p.name == 'values':
+            rows = [set(k for k, v in row.items() if v != 'UNDEF') for row in part.p.res]
+            return set.intersection(*rows) if rows else set()
+        return _certain(part.p)
+    return set()
+
+
+def _inScope(part):
+    """Return the variables which may be bound by a part or None if they are not known."""
+    name = part.name
+    if name == 'BGP':
+        return _certain(part)
+    elif name in ('Join', 'LeftJoin'):
+        p1, p2 = _inScope(part.p1), _inScope(part.p2)
+        return None if p1 is None or p2 is None else p1 | p2
+    elif name == 'Union':
+        scopes = [_inScope(p) for p in _unionParts(part)]
+        return None if None in scopes else set.union(*scopes)
+    elif name in ('Minus', 'Filter', 'Distinct', 'Reduced', 'OrderBy', 'Slice'):
+        return _inScope(part.p1 if name == 'Minus' else part.p)
+    elif name == 'Extend':
+        res = _inScope(part.p)
+        return None if res is None else res | {part.var}
+    elif name == 'Graph':
+        res = _inScope(part.p)
+        if res is not None and isinstance(part.term, Variable):
+            res.add(part.term)
+        return res
+    elif name == 'Project':
+        return set(part.PV)
+    elif name == 'ToMultiSet':
+        if part.p.name == 'values':
+            return _variables([list(row.keys()) for row in part.p.res])
+        return _inScope(part.p)
+    return None
+
+
+def _unionParts(part):
+    if 'parts' in part:
+        return part['parts']
+    return [part.p1, part.p2]
+
+
+def _conjuncts(expr):
+    """Split an expression into the operands of a conjunction."""
+    if isinstance(expr, Expr) and expr.name == 'ConditionalAndExpression':
+        res = _conjuncts(expr.expr)
+        for other in expr.other:
+            res.extend(_conjuncts(other))
+        return res
+    return [expr]
+
+
+def _constant(e):
+    if isinstance(e, (list, tuple)):
+        return all(_constant(x) for x in e)
+    return not isinstance(e, (Variable, CompValue))
+
+
+def foldConstants(e):
+    """Evaluate the parts of an expression which do not depend on a solution."""
+    if isinstance(e, list):
+        return [foldConstants(x) for x in e]
+    if not isinstance(e, Expr) or e.name in _UNMOVABLE or e.name.startswith('Aggregate_'):
+        return e
+
+    values = {k: foldConstants(v) for k, v in e.items() if k != '_vars'}
+    e = _copy(e, **values)
+    if e.name in _VOLATILE or e.name == 'Function' or not _constant(list(values.values())):
+        return e
+    try:
+        value = e.eval(FrozenBindings(QueryContext()))
+    except Exception:
+        return e
+    if isinstance(value, (URIRef, Literal)):
+        return value
+    return e
+
+
+def _truth(expr):
+    """Return the effective boolean value of a constant expression or None."""
+    if isinstance(expr, (URIRef, Literal)):
+        try:
+            return EBV(expr)
+        except SPARQLError:
+            return False
+    return None
+
+
+def _empty():
+    return ToMultiSet(Values([]))
+
+
+def _equality(expr):
+    """Return (variable, term) if an expression is only true if the variable is the term."""
+    if not isinstance(expr, Expr):
+        return None
+    if expr.name == 'RelationalExpression' and expr.op == '=':
+        a, b = expr.expr, expr.other
+        if isinstance(b, Variable):
+            a, b = b, a
+        # = compares literals by their value, IRIs are only equal to themselves
+        if isinstance(a, Variable) and isinstance(b, URIRef):
+            return a, b
+    elif expr.name == 'Builtin_sameTerm':
+        a, b = expr.arg1, expr.arg2
+        if isinstance(b, Variable):
+            a, b = b, a
+        if isinstance(a, Variable) and isinstance(b, (URIRef, Literal)):
+            return a, b
+    return None
+
+
+def _substitute(part, var, term):
+    """Replace a variable by a term in a part which has the variable bound in all solutions.
+
+    Raises:
+        _Unsafe if the part contains a pattern the variable can not be replaced in
+    """
+    if isinstance(part, Variable):
+        return term if part == var else part
+    if isinstance(part, list):
+        return [_substitute(x, var, term) for x in part]
+    if isinstance(part, tuple):
+        return tuple(_substitute(x, var, term) for x in part)
+    if not isinstance(part, CompValue):
+        return part
+    if not isinstance(part, Expr):
+        if part.name not in ('BGP', 'Join', 'LeftJoin', 'Filter', 'Union', 'Minus', 'Graph',
+                             'Extend', 'TrueFilter'):
+            raise _Unsafe()
+        if part.name == 'Extend' and part.var == var:
+            raise _Unsafe()
+        # the variable is in the domain of the solutions which are removed
+        if part.name == 'Minus' and var in _variables(part.p2):
+            raise _Unsafe()
+    return _copy(part, **{k: _substitute(v, var, term)
+                          for k, v in part.items() if k != '_vars'})
+
+
+def _bind(part, var, term):
+    """Try to replace a filter for var = term on a part by a binding, return None if not."""
+    if part.name == 'BGP' and var in _certain(part):
+        return CompValue('Extend', p=_substitute(part, var, term), expr=term, var=var)
+    if part.name == 'Graph' and part.term == var and term != DATASET_DEFAULT_GRAPH_ID:
+        # the pattern is evaluated without the graph variable, which is joined afterwards
+        if var in _variables(part.p) and var not in _certain(part.p):
+            return None
+        try:
+            inner = _substitute(part.p, var, term)
+        except _Unsafe:
+            return None
+        return CompValue('Extend', p=CompValue('Graph', term=term, p=inner), expr=term, var=var)
+    return None
+
+
+def _pushFilter(expr, variables, part):
+    """Move a filter expression with the given variables as far down into a part as possible."""
+    name = part.name
+    if name == 'Filter':
+        part['p'] = _pushFilter(expr, variables, part.p)
+        return part
+    elif name == 'Join':
+        for key in ('p1', 'p2'):
+            if variables <= _certain(part[key]):
+                part[key] = _pushFilter(expr, variables, part[key])
+                return part
+    elif name in ('LeftJoin', 'Minus'):
+        if variables <= _certain(part.p1):
+            part['p1'] = _pushFilter(expr, variables, part.p1)
+            return part
+    elif name == 'Union':
+        parts = [_pushFilter(expr, variables, p) for p in _unionParts(part)]
+        return CompValue('Union', parts=parts)
+    elif name == 'Extend':
+        if part.var not in variables:
+            part['p'] = _pushFilter(expr, variables, part.p)
+            return part
+    elif name == 'Graph':
+        if part.term not in variables:
+            part['p'] = _pushFilter(expr, variables, part.p)
+            return part
+
+    equality = _equality(expr)
+    if equality is not None:
+        bound = _bind(part, *equality)
+        if bound is not None:
+            return bound
+    return CompValue('Filter', expr=expr, p=part)
+
+
+def _filter(expr, part):
+    """Apply the conjuncts of a filter expression to a part."""
+    for conjunct in _conjuncts(foldConstants(expr)):
+        truth = _truth(conjunct)
+        if truth is True:
+            continue
+        if truth is False:
+            return _empty()
+        if _names(conjunct) & set(_UNMOVABLE):
+            part = CompValue('Filter', expr=conjunct, p=part)
+        else:
+            part = _pushFilter(conjunct, _variables(conjunct), part)
+    return part
+
+
+def _leftJoin(part):
+    """Move the conjuncts of the condition of an optional part which only use its variables."""
+    certain = _certain(part.p2)
+    remaining = []
+    for conjunct in _conjuncts(foldConstants(part.expr)):
+        truth = _truth(conjunct)
+        if truth is True:
+            continue
+        if truth is None and not _names(conjunct) & set(_UNMOVABLE) and \
+                _variables(conjunct) <= certain:
+            part['p2'] = _pushFilter(conjunct, _variables(conjunct), part.p2)
+        else:
+            remaining.append(conjunct)
+    part['expr'] = and_(*remaining) if remaining else TrueFilter
+    return part
+
+
+def _rewrite(part):
+    """Apply the rules bottom-up to all parts of the algebra."""
+    if isinstance(part, list):
+        return [_rewrite(x) for x in part]
+    if not isinstance(part, CompValue) or isinstance(part, Expr):
+        return part
+    for k, v in list(part.items()):
+        if k not in ('expr', '_vars') and isinstance(v, (CompValue, list)):
+            part[k] = _rewrite(v)
+
+    name = part.name
+    if name == 'Filter':
+        return _filter(part.expr, part.p)
+    elif name == 'LeftJoin':
+        return _leftJoin(part)
+    elif name == 'Extend':
+        part['expr'] = foldConstants(part.expr)
+    elif name == 'Union':
+        parts = []
+        for p in _unionParts(part):
+            if p.name == 'Union':
+                parts.extend(_unionParts(p))
+            else:
+                parts.append(p)
+        if len(parts) > 2:
+            return CompValue('Union', parts=parts)
+    return part
+
+
+def _project(part, required):
+    """Remove unused variables before the solutions are sorted.
+
+    All solutions are kept until they are sorted, the aggregates of a group are updated with
+    each solution, thus the variables are only removed below an ORDER BY without a limit.
+
+    Args:
+        part: the part below a projection
+        required: the variables which are used above the part
+    """
+    name = part.name
+    if name == 'Filter':
+        part['p'] = _project(part.p, required | _variables(part.expr))
+    elif name == 'Extend':
+        part['p'] = _project(part.p, (required - {part.var}) | _variables(part.expr))
+    elif name == 'OrderBy' and part.limit is None:
+        part['p'] = _restrict(part.p, required | _variables(part.expr))
+    return part
+
+
+def _restrict(part, required):
+    scope = _inScope(part)
+    if scope is None or scope <= required:
+        return part
+    return CompValue('Project', p=part, PV=sorted(scope & required))
+
+
+def _projections(part):
+    """Push the projections of the query and of all sub-selects down."""
+    if isinstance(part, list):
+        for x in part:
+            _projections(x)
+    elif isinstance(part, CompValue) and not isinstance(part, Expr):
+        for k, v in part.items():
+            if k not in ('expr', '_vars'):
+                _projections(v)
+        if part.name == 'Project':
+            part['p'] = _project(part.p, set(part.PV))
+
+
+def _limits(part):
+    """Set the number of solutions requested from an ORDER BY below a LIMIT as its limit."""
+    if isinstance(part, list):
+        for x in part:
+            _limits(x)
+    elif isinstance(part, CompValue) and not isinstance(part, Expr):
+        for k, v in part.items():
+            if k not in ('expr', '_vars'):
+                _limits(v)
+        if part.name == 'Slice' and part.length is not None:
+            p = part.p
+            while p.name == 'Project':
+                p = p.p
+            if p.name == 'OrderBy':
+                p['limit'] = part.start + part.length
+
+
+def optimize(algebra):
+    """Rewrite the algebra of a translated query, the rewritten algebra is returned."""
+    algebra['p'] = _rewrite(algebra.p)
+    _limits(algebra.p)
+    _projections(algebra.p)
+    return algebra
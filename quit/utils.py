@@ -49,6 +49,21 @@ def iri_to_name(iri):
     return quote_plus("_".join(nameParts))
 
 
+def parse_size(size):
+    """Parse a size like 512M or 2G into a number of bytes.
+
+    Raises:
+        ValueError if the size can not be parsed
+    """
+    if isinstance(size, int):
+        return size
+    size = str(size).strip().upper().rstrip('B')
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
 def graphdiff(first, second):
     """
     Diff between graph instances, should be replaced/included in quit diff
@@ -0,0 +1,113 @@
+import json
+import logging
+import os
+import threading
+from rdflib.term import Identifier
+from rdflib.util import from_n3
+
+logger = logging.getLogger('quit.wal')
+
+
+class WriteAheadLog(object):
+    """An append-only log of updates which are not yet written to the repository.
+
+    Every entry is a JSON object on its own line and gets a sequence number. An entry is durable
+    once append() returns. The sequence number of the last entry written to the repository is
+    kept in a checkpoint file next to the log, the log is truncated when it is fully checkpointed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._checkpointPath = path + '.checkpoint'
+        self._lock = threading.Lock()
+        self.checkpointed = self._readCheckpoint()
+        self.sequence = self.checkpointed
+        for entry in self.entries():
+            self.sequence = max(self.sequence, entry['sequence'])
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def _readCheckpoint(self):
+        try:
+            with open(self._checkpointPath, 'r', encoding='utf-8') as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def entries(self):
+        """Return all entries which are not checkpointed yet in the order of their sequence."""
+        entries = []
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # an incomplete line is left by a crash during an append
+                        logger.warning('Skipping incomplete entry of the write-ahead log')
+                        continue
+                    if entry['sequence'] > self.checkpointed:
+                        entries.append(entry)
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def append(self, entry):
+        """Append an entry, wait until it is on disk and return its sequence number."""
+        with self._lock:
+            self.sequence += 1
+            entry = dict(entry, sequence=self.sequence)
+            self._file.write(json.dumps(entry) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            return self.sequence
+
+    def checkpoint(self, sequence):
+        """Mark all entries up to sequence as written to the repository."""
+        with self._lock:
+            tmp = self._checkpointPath + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(str(sequence))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self._checkpointPath)
+            self.checkpointed = sequence
+
+            if sequence >= self.sequence:
+                self._file.truncate(0)
+
+    def close(self):
+        self._file.close()
+
+
+def serializeDelta(delta):
+    """Convert the delta of an update into a structure which can be written as JSON."""
+    def term(t):
+        return t.n3() if isinstance(t, Identifier) else t
+
+    result = []
+    for entry in delta:
+        entry = dict(entry)
+        entry['delta'] = [
+            [term(identifier), [[op, [[term(t) for t in triple] for triple in triples]]
+                                for op, triples in changeset]]
+            for identifier, changeset in entry['delta'].items()
+        ]
+        result.append(entry)
+    return result
+
+
+def deserializeDelta(data):
+    """Restore the delta of an update written by serializeDelta()."""
+    def term(t):
+        return t if t == 'default' else from_n3(t)
+
+    result = []
+    for entry in data:
+        entry = dict(entry)
+        entry['delta'] = {
+            term(identifier): [(op, [tuple(from_n3(t) for t in triple) for triple in triples])
+                               for op, triples in changeset]
+            for identifier, changeset in entry['delta']
+        }
+        result.append(entry)
+    return result
@@ -15,7 +15,7 @@ from jinja2 import Environment, contextfilter, Markup
 
 from quit.application import initialize
 from quit.conf import Feature as QuitFeature
-from quit.core import MemoryStore, Quit
+from quit.core import MemoryStore, PersistentStore, Quit
 from quit.git import Repository, QuitRemoteCallbacks
 import quit.utils as utils
 
@@ -130,15 +130,21 @@ def register_app(app, arguments):
         origin=config.getUpstream(),
         create=True,
         garbageCollection=garbageCollection,
-        callback=QuitRemoteCallbacks(session=session)
+        callback=QuitRemoteCallbacks(session=session),
+        worktree=not config.detachworktree
     )
     bindings = config.getBindings()
 
-    quit = Quit(config, repository, MemoryStore(bindings))
-    quit.syncAll()
+    if config.provenancestore:
+        store = PersistentStore(config.provenancestore, bindings)
+    else:
+        store = MemoryStore(bindings)
 
-    content = quit.store.store.serialize(format='trig')
-    logger.debug("Initialize store with following content: {}".format(content))
+    quit = Quit(config, repository, store)
+    if config.backgroundsync:
+        quit.syncAllInBackground()
+    else:
+        quit.syncAll()
 
     app.config['quit'] = quit
     app.config['blame'] = Blame(quit)
@@ -159,8 +165,9 @@ def register_blueprints(app):
     from quit.web.modules.endpoint import endpoint
     from quit.web.modules.git import git
     from quit.web.modules.application import application
+    from quit.web.modules.status import status
 
-    for bp in [debug, endpoint, git, application]:
+    for bp in [debug, endpoint, git, application, status]:
         app.register_blueprint(bp)
 
     @app.route("/")
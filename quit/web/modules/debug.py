@@ -4,6 +4,7 @@ from werkzeug.http import parse_accept_header
 from flask import Blueprint, request, current_app, make_response
 from quit.conf import Feature
 from quit.web.app import render_template, feature_required
+from quit.web.modules.status import unavailable
 
 __all__ = ('debug')
 
@@ -27,6 +28,10 @@ def blame(branch_or_ref):
     else:
         mimetype = 'application/sparql-results+json'
 
+    response = unavailable(quit)
+    if response is not None:
+        return response
+
     try:
         res = blame.run(branch_or_ref=branch_or_ref)
 
@@ -55,3 +60,19 @@ def blame(branch_or_ref):
         current_app.logger.error(e)
         current_app.logger.error(traceback.format_exc())
         return "<pre>" + traceback.format_exc() + "</pre>", 400
+
+
+@debug.route("/debug/dump", methods=['GET'])
+def dump():
+    """Serialize the provenance and persistence store as TriG.
+
+    Returns:
+        HTTP Response 200: The content of the store.
+    """
+    quit = current_app.config['quit']
+
+    with quit.storeLock:
+        content = quit.store.store.serialize(format='trig')
+    response = make_response(content, 200)
+    response.headers['Content-Type'] = 'application/trig'
+    return response
@@ -1,12 +1,14 @@
 import traceback
 
 import logging
-from flask import Blueprint, request, current_app, make_response
+from flask import Blueprint, request, current_app, jsonify, make_response
 from rdflib import ConjunctiveGraph
 from quit.conf import Feature
 from quit import helpers as helpers
 from quit.helpers import parse_sparql_request, parse_query_type
+from quit.tools.algebra import collectGraphIris
 from quit.web.app import render_template, feature_required
+from quit.web.modules.status import unavailable
 from quit.exceptions import UnSupportedQuery, SparqlProtocolError, NonAbsoluteBaseError
 from quit.exceptions import FromNamedError, QuitMergeConflict, RevisionNotFound
 import datetime
@@ -22,6 +24,9 @@ resultSetMimetypesDefault = 'application/sparql-results+xml'
 askMimetypesDefault = 'application/sparql-results+xml'
 rdfMimetypesDefault = 'text/turtle'
 
+# the longest time in seconds a request waits for a logged update to be committed
+SEQUENCE_WAIT_TIMEOUT = 30
+
 resultSetMimetypes = ['application/sparql-results+xml', 'application/xml',
                       'application/sparql-results+json', 'application/json', 'text/csv',
                       'text/html', 'application/xhtml+xml']
@@ -140,7 +145,10 @@ def sparql(branch_or_ref):
                                               named_graph=named_graph)
                 response = make_response('', 200)
                 response.headers["X-CurrentBranch"] = target_head
-                if oid is not None:
+                if isinstance(oid, int):
+                    # the update is in the write-ahead log but not committed yet
+                    response.headers["X-CurrentSequence"] = oid
+                elif oid is not None:
                     response.headers["X-CurrentCommit"] = oid
                 else:
                     response.headers["X-CurrentCommit"] = commitid
@@ -151,7 +159,8 @@ def sparql(branch_or_ref):
                 return make_response('Error after executing the update query.', 400)
     elif queryType in ['SelectQuery', 'DescribeQuery', 'AskQuery', 'ConstructQuery']:
         try:
-            graph, commitid = quit.instance(branch_or_ref)
+            graph, commitid = quit.cachedInstance(
+                branch_or_ref, graphs=collectGraphIris(parsedQuery))
         except Exception as e:
             logger.exception(e)
             return make_response('No branch or reference given.', 400)
@@ -179,6 +188,34 @@ def sparql(branch_or_ref):
         return make_response("Unsupported Query Type: {}".format(queryType), 400)
 
 
+@endpoint.route("/sequence/<int:sequence>", methods=['GET'])
+def sequence(sequence):
+    """Look up the commit of an update which was acknowledged with a X-CurrentSequence header.
+
+    Add the parameter wait=true to wait until the update is committed.
+
+    Returns:
+        HTTP Response 200: The id of the commit as JSON, it can be queried as reference.
+        HTTP Response 202: If the update is not committed yet.
+        HTTP Response 404: If the sequence number is unknown or its commit is forgotten.
+    """
+    quit = current_app.config['quit']
+    wait = request.values.get('wait', '').lower() in ('1', 'true', 'yes')
+    try:
+        oid = quit.commitOf(sequence, timeout=SEQUENCE_WAIT_TIMEOUT if wait else 0)
+    except KeyError:
+        return make_response('No update with sequence number {}'.format(sequence), 404)
+
+    if oid is None:
+        response = jsonify({'sequence': sequence, 'commit': None,
+                            'error': str(quit.commitError) if quit.commitError else None})
+        response.status_code = 202
+        return response
+    response = jsonify({'sequence': sequence, 'commit': oid})
+    response.headers["X-CurrentCommit"] = oid
+    return response
+
+
 @endpoint.route("/provenance", methods=['POST', 'GET'])
 @feature_required(Feature.Provenance)
 def provenance():
@@ -189,6 +226,8 @@ def provenance():
         HTTP Response 200: If request contained a valid update query.
         HTTP Response 400: If request doesn't contain a valid sparql query.
         HTTP Response 406: If accept header is not acceptable.
+        HTTP Response 503: If the history is not synchronized yet or if wait=true was given but the
+            provenance of a commit can not be indexed.
     """
     quit = current_app.config['quit']
 
@@ -212,14 +251,33 @@ def provenance():
         if queryType not in ['SelectQuery', 'AskQuery', 'ConstructQuery', 'DescribeQuery']:
             return make_response('Unsupported Query Type', 400)
 
-        res = graph.query(query)
-
         mimetype = _getBestMatchingMimeType(request, queryType)
 
         if not mimetype:
             return make_response("Mimetype: {} not acceptable".format(mimetype), 406)
 
-        return create_result_response(res, mimetype)
+        # the provenance of the history is only complete after the initial synchronization
+        response = unavailable(quit)
+        if response is not None:
+            return response
+        if request.values.get('wait', '').lower() in ('1', 'true', 'yes'):
+            if not quit.waitForProvenance():
+                # the indexer is stuck at a commit it retries to index
+                return make_response('The provenance of a commit could not be indexed: {}'.format(
+                    quit.indexer.error), 503)
+
+        with quit.storeLock:
+            res = graph.query(query)
+            response = create_result_response(res, mimetype)
+
+        if quit.indexer is not None:
+            # the provenance of commits after the watermark might still be missing
+            if quit.indexer.indexed is not None:
+                response.headers["X-IndexedCommit"] = quit.indexer.indexed
+            response.headers["X-PendingCommits"] = quit.indexer.pending
+            if quit.indexer.error is not None:
+                response.headers["X-IndexError"] = str(quit.indexer.error)
+        return response
     else:
         if request.accept_mimetypes.best_match(['text/html']) == 'text/html':
             return render_template('sparql.html', mode='provenance')
@@ -18,6 +18,12 @@ __all__ = ('git')
 git = Blueprint('git', __name__)
 
 
+@git.before_request
+def flush():
+    """Let the git operations see all updates which were acknowledged before."""
+    current_app.config['quit'].flush()
+
+
 @git.route("/commits", defaults={'branch_or_ref': None}, methods=['GET'])
 @git.route("/commits/<path:branch_or_ref>", methods=['GET'])
 def commits(branch_or_ref):
@@ -147,6 +153,29 @@ def fetch(remote, refspec):
         return "<pre>" + traceback.format_exc() + "</pre>", 400
 
 
+@git.route("/worktree/sync", methods=['POST', 'GET'])
+def sync_worktree():
+    """Update the working directory to the checked out branch.
+
+    This is needed if the store does not update the working directory on commits
+    (--detach-worktree).
+
+    Returns:
+    HTTP Response 200: If the working directory was updated
+    HTTP Response 409: If files were kept because of local changes, they are listed in the body
+    HTTP Response 400: If the update did not work
+    """
+    try:
+        conflicts = current_app.config['quit'].repository.sync_worktree()
+        if conflicts:
+            return "\n".join(conflicts), 409
+        return '', 200
+    except Exception as e:
+        current_app.logger.error(e)
+        current_app.logger.error(traceback.format_exc())
+        return "<pre>" + traceback.format_exc() + "</pre>", 400
+
+
 @git.route("/push", defaults={'remote': None, "refspec": None}, methods=['POST', 'GET'])
 @git.route("/push/<remote>", defaults={"refspec": None}, methods=['GET', 'POST'])
 @git.route("/push/<remote>/<path:refspec>", methods=['GET', 'POST'])
@@ -0,0 +1,99 @@
+from flask import Blueprint, current_app, jsonify, make_response
+from quit.exceptions import RevisionNotFound
+from quit.statistics import GraphStatistics
+
+__all__ = ('status')
+
+status = Blueprint('status', __name__)
+
+
+def _status(quit):
+    return {
+        'synced': quit.isSynced,
+        'commits': dict(quit.syncProgress),
+        'error': str(quit.syncError) if quit.syncError is not None else None,
+        'pendingUpdates': quit.pendingUpdates,
+        'commitError': str(quit.commitError) if quit.commitError is not None else None
+    }
+
+
+def unavailable(quit):
+    """Return a response with the synchronization progress if the history is not synchronized.
+
+    Requests which need the provenance of the whole history answer with it instead of waiting
+    for the synchronization.
+
+    Returns:
+        HTTP Response 503 with the progress as JSON or None if the history is synchronized.
+    """
+    if quit.isSynced:
+        return None
+    response = jsonify(_status(quit))
+    response.status_code = 503
+    return response
+
+
+@status.route("/health", methods=['GET'])
+def health():
+    """Report that the store is running and the progress of the synchronization.
+
+    Returns:
+        HTTP Response 200: If the store is running, also during the synchronization.
+        HTTP Response 500: If the synchronization failed or logged updates can not be committed.
+    """
+    quit = current_app.config['quit']
+    response = jsonify(_status(quit))
+    if quit.syncError is not None or quit.commitError is not None:
+        response.status_code = 500
+    return response
+
+
+@status.route("/ready", methods=['GET'])
+def ready():
+    """Report if the history is synchronized with the provenance and persistence store.
+
+    Returns:
+        HTTP Response 200: If the history is synchronized.
+        HTTP Response 503: If the synchronization is in progress or failed, or if logged updates
+            can not be committed.
+    """
+    quit = current_app.config['quit']
+    response = jsonify(_status(quit))
+    if not quit.isSynced or quit.commitError is not None:
+        response.status_code = 503
+    return response
+
+
+@status.route("/stats", methods=['GET'])
+def cacheStats():
+    """Report the hit, miss and eviction counters of each tier of the caches.
+
+    Returns:
+        HTTP Response 200: The counters of the blob cache and of the cache of datasets as JSON.
+    """
+    return jsonify(current_app.config['quit'].cacheStatistics())
+
+
+@status.route("/stats/<path:branch_or_ref>", methods=['GET'])
+def stats(branch_or_ref):
+    """Report the statistics of the graphs of a commit.
+
+    The statistics are the number of triples, of distinct subjects and objects, and the same
+    numbers per predicate. The distinct terms of the total are summed over the graphs.
+
+    Returns:
+        HTTP Response 200: The statistics of each graph and their total as JSON.
+        HTTP Response 404: If the branch or reference does not exist.
+    """
+    quit = current_app.config['quit']
+    try:
+        graphs = quit.commitStatistics(branch_or_ref)
+    except RevisionNotFound:
+        return make_response('No commit found for {}'.format(branch_or_ref), 404)
+
+    total = GraphStatistics()
+    result = {}
+    for identifier, (oid, statistics) in graphs.items():
+        total += statistics
+        result[str(identifier)] = dict(statistics.toDict(), blob=oid)
+    return jsonify({'graphs': result, 'total': total.toDict()})
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Measure the hash join, the hash optional join and the hash minus of the query evaluation.
+
+Generates a graph with two properties of each subject and evaluates queries whose parts can not
+be joined lazily, i.e. sub-selects and MINUS. With --baseline the queries are also evaluated by
+rdflib, which compares all pairs of solutions, this takes very long beyond 10^4 rows.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rdflib import Graph, Literal, URIRef  # noqa: E402
+from rdflib.plugins.sparql import algebra, evaluate  # noqa: E402
+from rdflib.plugins.sparql.parser import parseQuery  # noqa: E402
+import quit.tools.evaluate  # noqa: E402
+from quit.tools.algebra import translateQuery  # noqa: E402
+
+QUERIES = {
+    'join': """SELECT * WHERE {
+        { SELECT DISTINCT ?s ?a WHERE { ?s <urn:a> ?a } }
+        { SELECT DISTINCT ?s ?b WHERE { ?s <urn:b> ?b } }
+    }""",
+    'optional': """SELECT * WHERE {
+        ?s <urn:a> ?a OPTIONAL { SELECT ?s ?b WHERE { ?s <urn:b> ?b } }
+    }""",
+    'minus': 'SELECT * WHERE { ?s <urn:a> ?a MINUS { ?s <urn:b> ?b } }',
+}
+
+
+def generate(rows):
+    graph = Graph()
+    a, b = URIRef('urn:a'), URIRef('urn:b')
+    for i in range(rows):
+        s = URIRef('urn:s{}'.format(i))
+        graph.add((s, a, Literal(i)))
+        # every second subject has no b, thus the optional and minus queries keep them
+        if i % 2:
+            graph.add((s, b, Literal(i)))
+    return graph
+
+
+def measure(label, function):
+    start = time.perf_counter()
+    count = sum(1 for _ in function())
+    print('{:<28} {:>10} results {:>8.2f}s'.format(label, count, time.perf_counter() - start))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100000, help='number of subjects')
+    parser.add_argument('--memory-rows', type=int,
+                        default=quit.tools.evaluate.HASH_JOIN_MEMORY_ROWS,
+                        help='solutions of the build side which are kept in memory')
+    parser.add_argument('--baseline', action='store_true', help='also evaluate with rdflib')
+    args = parser.parse_args()
+
+    quit.tools.evaluate.HASH_JOIN_MEMORY_ROWS = args.memory_rows
+    graph = generate(args.rows)
+    for name, query in QUERIES.items():
+        measure('hash ' + name, lambda: quit.tools.evaluate.evalQuery(
+            graph, translateQuery(parseQuery(query)), {})['bindings'])
+        if args.baseline:
+            measure('rdflib ' + name, lambda: evaluate.evalQuery(
+                graph, algebra.translateQuery(parseQuery(query)), {})['bindings'])
+
+
+if __name__ == '__main__':
+    main()
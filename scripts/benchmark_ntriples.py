@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Compare the N-Triples parser of the QuitStore with the rdflib parser.
+
+Generates a document of canonical lines as written by the store and reports the time to parse it
+with rdflib and with quit.ntriples.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rdflib import Graph  # noqa: E402
+from quit.ntriples import parse_graph, parse_triples  # noqa: E402
+
+
+def generate(lines):
+    out = []
+    for i in range(lines):
+        s = '<http://example.org/resource/{}>'.format(i // 10)
+        if i % 3 == 0:
+            o = '"value {}"'.format(i)
+        elif i % 3 == 1:
+            o = '"{}"^^<http://www.w3.org/2001/XMLSchema#integer>'.format(i)
+        else:
+            o = '<http://example.org/resource/{}>'.format(i % 1000)
+        out.append('{} <http://example.org/property/{}> {} .'.format(s, i % 20, o))
+    return '\n'.join(out).encode('utf-8') + b'\n'
+
+
+def measure(label, function):
+    start = time.perf_counter()
+    count = function()
+    elapsed = time.perf_counter() - start
+    print('{:<24} {:>10} triples {:>8.2f}s {:>12.0f} triples/s'.format(
+        label, count, elapsed, count / elapsed if elapsed else 0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lines', type=int, default=10000000, help='number of lines')
+    parser.add_argument('--skip-rdflib', action='store_true', help='only run the quit parser')
+    args = parser.parse_args()
+
+    data = generate(args.lines)
+    print('{} lines, {} bytes'.format(args.lines, len(data)))
+
+    if not args.skip_rdflib:
+        measure('rdflib Graph.parse', lambda: len(Graph().parse(data=data, format='nt')))
+    measure('quit parse_triples', lambda: sum(1 for _ in parse_triples(memoryview(data))))
+    measure('quit parse_graph', lambda: len(parse_graph(data)))
+
+
+if __name__ == '__main__':
+    main()
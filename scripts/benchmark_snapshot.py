@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Compare queries on a graph in the rdflib memory store and on snapshots of the graph.
+
+Generates a graph, builds its snapshot index and its HDT snapshot and reports the time of a full
+scan, a scan of one predicate and a join evaluated by the SPARQL engine of the QuitStore on all
+representations.
+"""
+
+import argparse
+import os
+import sys
+import time
+from tempfile import TemporaryDirectory
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rdflib import URIRef, plugin  # noqa: E402
+from rdflib.query import Processor  # noqa: E402
+from quit.graphs import InMemoryAggregatedGraph, SnapshotGraph  # noqa: E402
+from quit.hdt import HDTStore  # noqa: E402
+from quit.ntriples import parse_graph, parse_triples  # noqa: E402
+from quit.snapshot import SnapshotIndex  # noqa: E402
+
+JOIN = """SELECT ?a ?c WHERE {
+    ?a <http://example.org/knows> ?b .
+    ?b <http://example.org/name> ?c
+}"""
+
+
+def generate(triples):
+    out = []
+    for i in range(triples // 2):
+        out.append('<http://example.org/{}> <http://example.org/knows> <http://example.org/{}> .'
+                   .format(i, (i * 7) % (triples // 2)))
+        out.append('<http://example.org/{}> <http://example.org/name> "name {}" .'.format(i, i))
+    return '\n'.join(out).encode('utf-8') + b'\n'
+
+
+def measure(label, function):
+    start = time.perf_counter()
+    count = function()
+    print('{:<28} {:>10} results {:>8.2f}s'.format(label, count, time.perf_counter() - start))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--triples', type=int, default=1000000, help='number of triples')
+    args = parser.parse_args()
+
+    plugin.register('sparql', Processor, 'quit.tools.processor', 'SPARQLProcessor')
+    identifier = URIRef('http://example.org/')
+    data = generate(args.triples)
+
+    memory = parse_graph(data, identifier=identifier)
+    start = time.perf_counter()
+    snapshot = SnapshotGraph(SnapshotIndex.build(parse_triples(data)), identifier)
+    print('snapshot built in {:.2f}s, {} bytes of arrays'.format(
+        time.perf_counter() - start, snapshot.index.nbytes))
+
+    with TemporaryDirectory() as directory:
+        store = HDTStore(directory)
+        start = time.perf_counter()
+        store.set('snapshot', parse_triples(data))
+        print('hdt built in {:.2f}s, {} bytes of {} bytes N-Triples'.format(
+            time.perf_counter() - start,
+            os.path.getsize(os.path.join(directory, 'sn', 'apshot.hdt')), len(data)))
+        start = time.perf_counter()
+        hdt = SnapshotGraph(store.get('snapshot'), identifier)
+        print('hdt opened in {:.4f}s'.format(time.perf_counter() - start))
+
+        knows = URIRef('http://example.org/knows')
+        for label, graph in (('memory', memory), ('snapshot', snapshot), ('hdt', hdt)):
+            dataset = InMemoryAggregatedGraph(graphs=[graph], identifier='default')
+            measure(label + ' scan', lambda: sum(1 for _ in dataset.triples((None, None, None))))
+            measure(label + ' predicate',
+                    lambda: sum(1 for _ in dataset.triples((None, knows, None))))
+            measure(label + ' join', lambda: len(dataset.query(JOIN)))
+
+
+if __name__ == '__main__':
+    main()
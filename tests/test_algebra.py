@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+import unittest
+from context import quit
+import rdflib.plugins.sparql
+from quit.tools.algebra import translateQuery, collectGraphIris
+from rdflib import URIRef
+from rdflib.plugins.sparql.parser import parseQuery
+
+
+class CollectGraphIrisTests(unittest.TestCase):
+    """Test the collection of the graph IRIs a query reads from."""
+
+    def setUp(self):
+        self.union = rdflib.plugins.sparql.SPARQL_DEFAULT_GRAPH_UNION
+        rdflib.plugins.sparql.SPARQL_DEFAULT_GRAPH_UNION = False
+
+    def tearDown(self):
+        rdflib.plugins.sparql.SPARQL_DEFAULT_GRAPH_UNION = self.union
+
+    def collect(self, query):
+        return collectGraphIris(translateQuery(parseQuery(query)))
+
+    def testConstantGraphs(self):
+        query = """SELECT * FROM <urn:from> WHERE {
+                GRAPH <urn:a> { ?s ?p ?o }
+                OPTIONAL { GRAPH <urn:b> { ?s ?p ?x } }
+                FILTER EXISTS { GRAPH <urn:c> { ?s ?p ?o } }
+            }"""
+        self.assertEqual(
+            self.collect(query),
+            {URIRef('urn:from'), URIRef('urn:a'), URIRef('urn:b'), URIRef('urn:c')})
+
+    def testDefaultGraph(self):
+        self.assertEqual(self.collect('SELECT * WHERE { ?s ?p ?o }'), set())
+
+    def testDefaultGraphUnion(self):
+        rdflib.plugins.sparql.SPARQL_DEFAULT_GRAPH_UNION = True
+        self.assertIsNone(self.collect('SELECT * WHERE { ?s ?p ?o }'))
+        self.assertEqual(
+            self.collect('SELECT * WHERE { GRAPH <urn:a> { ?s ?p ?o } }'), {URIRef('urn:a')})
+
+    def testVariableGraph(self):
+        self.assertIsNone(self.collect('SELECT * WHERE { GRAPH ?g { ?s ?p ?o } }'))
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
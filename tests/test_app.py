@@ -11,6 +11,11 @@ from quit.web.app import create_app
 import unittest
 from helpers import TemporaryRepository, TemporaryRepositoryFactory
 import json
+import threading
+import time
+from unittest.mock import patch
+from quit.core import Quit
+from quit.provenance import ProvenanceIndexer
 from helpers import createCommit, assertResultBindingsEqual
 from tempfile import TemporaryDirectory
 from quit.utils import iri_to_name
@@ -1270,6 +1275,210 @@ class QuitAppTestCase(unittest.TestCase):
             with open(path.join(repo.workdir, 'graph_1.nt'), 'r') as f:
                 self.assertEqual('\n', f.read())
 
+    def testAsyncProvenance(self):
+        prov = 'SELECT ?s ?p ?o WHERE {?update <http://quit.aksw.org/vocab/additions> ?g . '
+        prov += 'GRAPH ?g {?s ?p ?o .}} ORDER BY ?s'
+        update = 'INSERT DATA {GRAPH <http://example.org/> {<urn:a> <urn:b> <urn:c> .}}'
+
+        content = '<urn:x> <urn:y> <urn:z> .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo:
+            args = quitApp.getDefaults()
+            args['targetdir'] = repo.workdir
+            args['features'] = Feature.Provenance
+            args['asyncprovenance'] = True
+            app = create_app(args).test_client()
+
+            response = app.post('/sparql', content_type="application/sparql-update", data=update)
+            commit = response.headers['X-CurrentCommit']
+
+            response = app.post('/provenance', data=dict(query=prov, wait='true'),
+                                headers=dict(accept="application/sparql-results+json"))
+            self.assertEqual(response.headers['X-IndexedCommit'], commit)
+            self.assertEqual(response.headers['X-PendingCommits'], '0')
+
+            changesets = json.loads(response.data.decode("utf-8"))
+            self.assertEqual([row['s']['value'] for row in changesets["results"]["bindings"]],
+                             ['urn:a', 'urn:x'])
+
+    def testAsyncProvenanceRetry(self):
+        prov = 'SELECT ?s WHERE {?update <http://quit.aksw.org/vocab/additions> ?g . '
+        prov += 'GRAPH ?g {?s ?p ?o .}} ORDER BY ?s'
+        update = 'INSERT DATA {GRAPH <http://example.org/> {<urn:a> <urn:b> <urn:c> .}}'
+
+        content = '<urn:x> <urn:y> <urn:z> .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo:
+            args = quitApp.getDefaults()
+            args['targetdir'] = repo.workdir
+            args['features'] = Feature.Provenance
+            args['asyncprovenance'] = True
+            application = create_app(args)
+            app = application.test_client()
+            quitInstance = application.config['quit']
+
+            failing = threading.Event()
+            failing.set()
+            syncSingle = Quit.syncSingle
+
+            def flakySyncSingle(quitInstance, commit, delta=None):
+                if failing.is_set():
+                    raise RuntimeError('failed')
+                syncSingle(quitInstance, commit, delta)
+
+            with patch.object(Quit, 'syncSingle', flakySyncSingle), \
+                    patch.object(ProvenanceIndexer, 'RETRY_DELAY', 0.01), \
+                    patch.object(ProvenanceIndexer, 'RETRY_MAX', 0.01):
+                response = app.post('/sparql', content_type="application/sparql-update",
+                                    data=update)
+                commit = response.headers['X-CurrentCommit']
+                self.assertFalse(quitInstance.waitForProvenance(timeout=10))
+
+                response = app.post('/provenance', data=dict(query=prov, wait='true'),
+                                    headers=dict(accept="application/sparql-results+json"))
+                self.assertEqual(response.status_code, 503)
+
+                # the watermark does not pass the failed commit
+                response = app.post('/provenance', data=dict(query=prov),
+                                    headers=dict(accept="application/sparql-results+json"))
+                self.assertNotIn('X-IndexedCommit', response.headers)
+                self.assertEqual(response.headers['X-PendingCommits'], '1')
+                self.assertEqual(response.headers['X-IndexError'], 'failed')
+
+                failing.clear()
+                # the next retry indexes the commit
+                for _ in range(1000):
+                    if not quitInstance.indexer.pending:
+                        break
+                    time.sleep(0.01)
+
+            response = app.post('/provenance', data=dict(query=prov, wait='true'),
+                                headers=dict(accept="application/sparql-results+json"))
+            self.assertEqual(response.headers['X-IndexedCommit'], commit)
+            self.assertNotIn('X-IndexError', response.headers)
+            changesets = json.loads(response.data.decode("utf-8"))
+            self.assertEqual([row['s']['value'] for row in changesets["results"]["bindings"]],
+                             ['urn:a', 'urn:x'])
+
+    def testBackgroundSync(self):
+        select = 'SELECT ?s WHERE {GRAPH <http://example.org/> {?s ?p ?o}}'
+        content = '<urn:x> <urn:y> <urn:z> .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo:
+            args = quitApp.getDefaults()
+            args['targetdir'] = repo.workdir
+            args['features'] = Feature.Provenance
+            args['backgroundsync'] = True
+
+            release = threading.Event()
+            syncAll = Quit.syncAll
+
+            def slowSyncAll(quitInstance):
+                release.wait()
+                syncAll(quitInstance)
+
+            with patch.object(Quit, 'syncAll', slowSyncAll):
+                application = create_app(args)
+                app = application.test_client()
+
+                response = app.get('/ready')
+                self.assertEqual(response.status_code, 503)
+                self.assertFalse(json.loads(response.data.decode("utf-8"))['synced'])
+                self.assertEqual(app.get('/health').status_code, 200)
+
+                # the provenance is incomplete, the request does not wait for it
+                response = app.post('/provenance', data=dict(query=select),
+                                    headers=dict(accept="application/sparql-results+json"))
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(json.loads(response.data.decode("utf-8"))['commits'],
+                                 {'done': 0, 'total': 0})
+
+                # queries on the branches do not wait for the synchronization
+                response = app.post('/sparql', data=dict(query=select),
+                                    headers=dict(accept="application/sparql-results+json"))
+                obj = json.loads(response.data.decode("utf-8"))
+                self.assertEqual(len(obj["results"]["bindings"]), 1)
+
+                release.set()
+                application.config['quit'].waitForSync()
+
+                response = app.get('/ready')
+                self.assertEqual(response.status_code, 200)
+                status = json.loads(response.data.decode("utf-8"))
+                self.assertTrue(status['synced'])
+                self.assertEqual(status['commits'], {'done': 1, 'total': 1})
+
+    def testWriteAheadLog(self):
+        update = 'INSERT DATA {GRAPH <http://example.org/> {<urn:a> <urn:b> <urn:c>}}'
+        content = '<urn:x> <urn:y> <urn:z> .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo, \
+                TemporaryDirectory() as directory:
+            args = quitApp.getDefaults()
+            args['targetdir'] = repo.workdir
+            args['wal'] = path.join(directory, 'quit.wal')
+            application = create_app(args)
+            app = application.test_client()
+
+            response = app.post('/sparql', data=dict(update=update))
+            sequence = response.headers['X-CurrentSequence']
+
+            response = app.get('/sequence/{}?wait=true'.format(sequence))
+            self.assertEqual(response.status_code, 200)
+            commit = json.loads(response.data.decode("utf-8"))['commit']
+            self.assertEqual(commit, str(repo.revparse_single('master').id))
+            self.assertEqual(app.get('/sequence/{}'.format(int(sequence) + 1)).status_code, 404)
+
+            with patch.object(application.config['quit']._committer, 'error',
+                              RuntimeError('failed')):
+                response = app.get('/health')
+                self.assertEqual(response.status_code, 500)
+                self.assertEqual(json.loads(response.data.decode("utf-8"))['commitError'],
+                                 'failed')
+                self.assertEqual(app.get('/ready').status_code, 503)
+
+    def testDebugDump(self):
+        content = '<urn:x> <urn:y> <urn:z> .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo:
+            args = quitApp.getDefaults()
+            args['targetdir'] = repo.workdir
+            args['features'] = Feature.Provenance
+            app = create_app(args).test_client()
+
+            response = app.get('/debug/dump')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers['Content-Type'], 'application/trig')
+            self.assertIn('prov:Activity', response.data.decode("utf-8"))
+
+    def testStats(self):
+        content = '<urn:x> <urn:y> <urn:z> .\n<urn:x> <urn:y> "z" .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo:
+            args = quitApp.getDefaults()
+            args['targetdir'] = repo.workdir
+            app = create_app(args).test_client()
+
+            app.post('/sparql', data=dict(update="""INSERT DATA {
+                GRAPH <http://example.org/> { <urn:a> <urn:w> <urn:z> } }"""))
+
+            response = app.get('/stats/master')
+            self.assertEqual(response.status_code, 200)
+            stats = json.loads(response.data.decode("utf-8"))
+            graph = stats['graphs']['http://example.org/']
+            self.assertEqual(graph['triples'], 3)
+            self.assertEqual(graph['subjects'], 2)
+            self.assertEqual(graph['objects'], 2)
+            self.assertEqual(graph['predicates']['urn:y'],
+                             {'triples': 2, 'subjects': 1, 'objects': 2})
+            self.assertEqual(graph['predicates']['urn:w'],
+                             {'triples': 1, 'subjects': 1, 'objects': 1})
+            self.assertEqual(graph['blob'], str(repo.revparse_single('master:graph_0.nt').id))
+            self.assertEqual(stats['total']['triples'], 3)
+
+            self.assertEqual(app.get('/stats/unknown').status_code, 404)
+
+            response = app.get('/stats')
+            self.assertEqual(response.status_code, 200)
+            caches = json.loads(response.data.decode("utf-8"))
+            self.assertEqual(set(caches['blobs']), {'hot', 'warm', 'cold'})
+            self.assertGreater(caches['blobs']['hot']['hits'], 0)
+            self.assertIn('evictions', caches['instances']['hot'])
+
     def testMultioperationalUpdateProvenance(self):
         """Test multioperational update and compare created provenance information.
 
@@ -1530,7 +1739,7 @@ class QuitAppTestCase(unittest.TestCase):
             with open(path.join(repo.workdir, 'graph_0.nt'), 'r') as f:
                 self.assertEqual('\n', f.read())
             with open(path.join(repo.workdir, 'graph_1.nt'), 'r') as f:
-                self.assertEqual('<urn:x> <urn:y> <urn:z> .\n', f.read())
+                self.assertEqual('<urn:x> <urn:y> <urn:z> .', f.read())
 
     def testDeleteWhere(self):
         """Test DELETE WHERE with two non empty graphs.
@@ -1647,7 +1856,7 @@ class QuitAppTestCase(unittest.TestCase):
             with open(path.join(repo.workdir, 'graph_0.nt'), 'r') as f:
                 self.assertEqual('\n', f.read())
             with open(path.join(repo.workdir, 'graph_1.nt'), 'r') as f:
-                self.assertEqual('<urn:x> <urn:y> <urn:z> .\n', f.read())
+                self.assertEqual('<urn:x> <urn:y> <urn:z> .', f.read())
 
     def testFeatureProvenance(self):
         """Test if feature is active or not."""
@@ -2181,7 +2390,7 @@ class QuitAppTestCase(unittest.TestCase):
             with open(path.join(repo.workdir, 'graph_0.nt'), 'r') as f:
                 self.assertEqual('<urn:x> <urn:1> "new" .\n', f.read())
             with open(path.join(repo.workdir, 'graph_1.nt'), 'r') as f:
-                self.assertEqual('<urn:x> <urn:y> <urn:z> .\n', f.read())
+                self.assertEqual('<urn:x> <urn:y> <urn:z> .', f.read())
 
     def testInsertWhereVariables(self):
         """Test INSERT WHERE with an empty and a non empty graph.
@@ -2254,7 +2463,7 @@ class QuitAppTestCase(unittest.TestCase):
                 self.assertEqual('<urn:x> <urn:1> "new" .\n', f.read())
             with open(path.join(repo.workdir, 'graph_1.nt'), 'r') as f:
                 self.assertEqual(
-                    '<urn:x> <urn:y> <urn:z1> .\n<urn:x> <urn:y> <urn:z2> .\n', f.read())
+                    '<urn:x> <urn:y> <urn:z1> .\n<urn:x> <urn:y> <urn:z2> .', f.read())
 
     def testTwoInsertWhereVariables(self):
         """Test two INSERT WHERE (; concatenated) with an empty and a non empty graph.
@@ -2328,7 +2537,7 @@ class QuitAppTestCase(unittest.TestCase):
                 self.assertEqual('<urn:x> <urn:1> "new" .\n', f.read())
             with open(path.join(repo.workdir, 'graph_1.nt'), 'r') as f:
                 self.assertEqual(
-                    '<urn:x> <urn:y> <urn:z1> .\n<urn:x> <urn:y> <urn:z2> .\n', f.read())
+                    '<urn:x> <urn:y> <urn:z1> .\n<urn:x> <urn:y> <urn:z2> .', f.read())
 
     def testInsertUsingWhere(self):
         """Test INSERT USING WHERE with an empty and a non empty graph.
@@ -2389,7 +2598,7 @@ class QuitAppTestCase(unittest.TestCase):
             with open(path.join(repo.workdir, 'graph_0.nt'), 'r') as f:
                 self.assertEqual('<urn:x> <urn:1> "new" .\n', f.read())
             with open(path.join(repo.workdir, 'graph_1.nt'), 'r') as f:
-                self.assertEqual('<urn:x> <urn:y> <urn:z> .\n', f.read())
+                self.assertEqual('<urn:x> <urn:y> <urn:z> .', f.read())
 
     def testLoadIntoGraph(self):
         """Test LOAD <resource> INTO GRAPH <http://example.org/> ."""
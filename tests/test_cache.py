@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
 
+import threading
+import time
 import unittest
 from context import quit
-from quit.cache import Cache, FileReference
+from quit.cache import BlobCache, Cache, DiskCache, FileReference, SingleFlight
 from os import path, environ
 from pygit2 import init_repository, Repository, clone_repository
 from pygit2 import GIT_SORT_TOPOLOGICAL, GIT_SORT_REVERSE, Signature
 from tempfile import TemporaryDirectory, NamedTemporaryFile
+from rdflib import BNode, Graph, Literal, URIRef
+from rdflib.compare import isomorphic
 
 
 class CacheTests(unittest.TestCase):
@@ -47,6 +51,212 @@ class CacheTests(unittest.TestCase):
         self.assertEqual(cache.get("key"), "value2")
         self.assertEqual(cache.size, 1)
 
+    def testCacheBudget(self):
+        cache = Cache(capacity=None, budget=10, sizeof=len)
+        cache.set("key1", "12345")
+        cache.set("key2", "12345")
+        self.assertEqual(cache.size, 2)
+
+        cache.set("key3", "123")
+        self.assertNotIn("key1", cache)
+        self.assertIn("key2", cache)
+        self.assertIn("key3", cache)
+        self.assertEqual(cache.volume, 8)
+        self.assertEqual(cache.statistics()['hot']['evictions'], 1)
+
+    def testRejectEntryLargerThanBudget(self):
+        cache = Cache(capacity=None, budget=10, sizeof=len)
+        cache.set("key1", "12345")
+        self.assertFalse(cache.set("key2", "12345678901"))
+        self.assertNotIn("key2", cache)
+        self.assertIn("key1", cache)
+
+    def testFrequencyAwareAdmission(self):
+        cache = Cache(capacity=1)
+        cache.set("key1", "value1")
+        cache.get("key1")
+        cache.get("key1")
+
+        self.assertFalse(cache.set("key2", "value2"))
+        self.assertEqual(cache.get("key1"), "value1")
+
+        with self.assertRaises(KeyError):
+            cache.get("key2")
+        with self.assertRaises(KeyError):
+            cache.get("key2")
+        with self.assertRaises(KeyError):
+            cache.get("key2")
+
+        self.assertTrue(cache.set("key2", "value2"))
+        self.assertNotIn("key1", cache)
+
+    def testAdmitNewEntry(self):
+        cache = Cache(capacity=1)
+        cache.set("key1", "value1")
+        cache.get("key1")
+
+        self.assertTrue(cache.set("key2", "value2", admit=True))
+        self.assertNotIn("key1", cache)
+        self.assertEqual(cache.get("key2"), "value2")
+
+    def testStatistics(self):
+        cache = Cache()
+        cache.set("key", "value")
+        cache.get("key")
+        with self.assertRaises(KeyError):
+            cache.get("other")
+
+        statistics = cache.statistics()['hot']
+        self.assertEqual(statistics['hits'], 1)
+        self.assertEqual(statistics['misses'], 1)
+        self.assertEqual(statistics['entries'], 1)
+
+
+class BlobCacheTests(unittest.TestCase):
+    content = '<urn:a> <urn:b> <urn:c> .\n<urn:a> <urn:b> <urn:d> .\n'
+
+    def blob(self, name):
+        graph = Graph(identifier=URIRef('urn:graph:' + name))
+        graph.parse(data=self.content, format='nt')
+        return FileReference(name + '.nt', self.content), graph
+
+    def testDemoteToWarmTier(self):
+        cache = BlobCache(capacity=1)
+        cache.set(('a.nt', 1), self.blob('a'))
+        cache.set(('b.nt', 2), self.blob('b'))
+
+        self.assertEqual(cache.size, 1)
+        self.assertIn(('a.nt', 1), cache)
+
+        fileReference, graph = cache.get(('a.nt', 1))
+        self.assertEqual(fileReference.path, 'a.nt')
+        self.assertEqual(fileReference.content, self.blob('a')[0].content)
+        self.assertEqual(graph.identifier, URIRef('urn:graph:a'))
+        self.assertEqual(len(graph), 2)
+
+        statistics = cache.statistics()
+        self.assertEqual(statistics['hot']['misses'], 1)
+        self.assertEqual(statistics['warm']['hits'], 1)
+        self.assertEqual(statistics['cold']['hits'], 0)
+
+    def testColdMiss(self):
+        cache = BlobCache()
+        with self.assertRaises(KeyError):
+            cache.get(('a.nt', 1))
+        self.assertEqual(cache.statistics()['cold']['hits'], 1)
+
+    def testRemoveFromAllTiers(self):
+        cache = BlobCache(capacity=1)
+        cache.set(('a.nt', 1), self.blob('a'))
+        cache.set(('b.nt', 2), self.blob('b'))
+        cache.remove(('a.nt', 1))
+        cache.remove(('b.nt', 2))
+
+        self.assertNotIn(('a.nt', 1), cache)
+        self.assertNotIn(('b.nt', 2), cache)
+        self.assertEqual(cache.warm_volume, 0)
+        self.assertEqual(cache.volume, 0)
+
+
+class DiskCacheTests(unittest.TestCase):
+    content = ('<urn:a> <urn:b> <urn:c> .\n'
+               '<urn:a> <urn:b> "text"@en .\n'
+               '<urn:a> <urn:b> "1"^^<http://www.w3.org/2001/XMLSchema#integer> .\n'
+               '_:x <urn:b> "line\\nbreak" .\n')
+
+    def graph(self, identifier='urn:graph'):
+        graph = Graph(identifier=URIRef(identifier))
+        graph.parse(data=self.content, format='nt')
+        return graph
+
+    def testLoadAfterRestart(self):
+        with TemporaryDirectory() as directory:
+            DiskCache(directory).set('abcdef', self.graph())
+
+            cache = DiskCache(directory)
+            graph = cache.get('abcdef', URIRef('urn:other'))
+
+            self.assertEqual(graph.identifier, URIRef('urn:other'))
+            self.assertTrue(isomorphic(graph, self.graph()))
+            self.assertIn((URIRef('urn:a'), URIRef('urn:b'), Literal('text', lang='en')), graph)
+            self.assertEqual(cache.statistics()['hits'], 1)
+
+    def testMiss(self):
+        with TemporaryDirectory() as directory:
+            cache = DiskCache(directory)
+            with self.assertRaises(KeyError):
+                cache.get('abcdef', URIRef('urn:graph'))
+            self.assertEqual(cache.statistics()['misses'], 1)
+
+    def testEvictLeastRecentlyUsed(self):
+        with TemporaryDirectory() as directory:
+            cache = DiskCache(directory)
+            cache.set('aaaa', self.graph())
+            size = cache.volume
+            cache = DiskCache(directory, budget=2 * size + size // 2)
+            cache.set('bbbb', self.graph())
+            cache.get('aaaa', URIRef('urn:graph'))
+            cache.set('cccc', self.graph())
+
+            self.assertEqual(cache.statistics()['entries'], 2)
+            cache.get('aaaa', URIRef('urn:graph'))
+            with self.assertRaises(KeyError):
+                cache.get('bbbb', URIRef('urn:graph'))
+            self.assertFalse(path.exists(path.join(directory, 'bb', 'bb')))
+
+    def testDropDamagedEntry(self):
+        with TemporaryDirectory() as directory:
+            cache = DiskCache(directory)
+            cache.set('abcdef', self.graph())
+            with open(path.join(directory, 'ab', 'cdef'), 'wb') as f:
+                f.write(b'garbage')
+
+            with self.assertRaises(KeyError):
+                cache.get('abcdef', URIRef('urn:graph'))
+            self.assertEqual(cache.volume, 0)
+
+
+class SingleFlightTests(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def testBuildOnlyOnce(self):
+        flight = SingleFlight()
+        calls = []
+        results = []
+
+        def build():
+            calls.append(1)
+            time.sleep(0.1)
+            return 'value'
+
+        threads = [threading.Thread(target=lambda: results.append(flight.do('key', build)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['value'] * 5)
+
+    def testBuildAgainAfterCompletion(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.do('key', lambda: 1), 1)
+        self.assertEqual(flight.do('key', lambda: 2), 2)
+
+    def testPropagateError(self):
+        flight = SingleFlight()
+
+        def build():
+            raise ValueError()
+
+        self.assertRaises(ValueError, flight.do, 'key', build)
+        self.assertEqual(flight.do('key', lambda: 1), 1)
+
 
 class FileReferenceTests(unittest.TestCase):
     def setUp(self):
@@ -55,6 +265,25 @@ class FileReferenceTests(unittest.TestCase):
     def tearDown(self):
         pass
 
+    def testSize(self):
+        fileReference = FileReference('a.nt', '<urn:a>  <urn:b> <urn:c> .\n')
+        size = fileReference.size
+        fileReference.add('<urn:a> <urn:b> <urn:c> .')
+        self.assertEqual(fileReference.size, size)
+        fileReference.add('<urn:a> <urn:b> <urn:d> .')
+        self.assertGreater(fileReference.size, size)
+        fileReference.remove('<urn:a> <urn:b> <urn:d> .')
+        self.assertEqual(fileReference.size, size)
+
+    def testCopy(self):
+        fileReference = FileReference('a.nt', '<urn:a> <urn:b> <urn:c> .\n')
+        copy = fileReference.copy()
+        copy.add('<urn:a> <urn:b> <urn:d> .')
+        fileReference.remove('<urn:a> <urn:b> <urn:c> .')
+        self.assertEqual(copy.content, '<urn:a> <urn:b> <urn:c> .\n<urn:a> <urn:b> <urn:d> .\n')
+        self.assertEqual(fileReference.content, '\n')
+        self.assertGreater(copy.size, fileReference.size)
+
 
 def main():
     unittest.main()
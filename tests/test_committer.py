@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+import unittest
+from context import quit
+from unittest import mock
+import quit.conf
+import quit.core
+import quit.git
+from quit.helpers import parse_update_type
+from quit.wal import WriteAheadLog, serializeDelta
+from helpers import TemporaryRepositoryFactory
+from rdflib import URIRef, plugin
+from rdflib.query import UpdateProcessor
+from tempfile import TemporaryDirectory
+
+
+class GroupCommitterTests(unittest.TestCase):
+    INSERT = 'INSERT DATA {{ GRAPH <http://example.org/> {{ <urn:{}> <urn:p> <urn:o> }} }}'
+
+    def setUp(self):
+        plugin.register('sparql', UpdateProcessor,
+                        'quit.tools.processor', 'SPARQLUpdateProcessor')
+
+    def tearDown(self):
+        pass
+
+    def createQuit(self, repo, window='200', limit=None):
+        conf = quit.conf.QuitStoreConfiguration(
+            features=quit.conf.Feature.Unknown, namespace='http://quit.instance/',
+            targetdir=repo.workdir, groupcommit=window, groupcommitlimit=limit)
+        return quit.core.Quit(conf, quit.git.Repository(repo.workdir), quit.core.MemoryStore())
+
+    def update(self, quitInstance, query, parsedQuery, results):
+        try:
+            results[query] = quitInstance.applyQueryOnCommit(
+                parsedQuery, 'master', 'refs/heads/master', query=query)
+        except Exception as e:
+            results[query] = e
+
+    def runConcurrently(self, quitInstance, queries):
+        results = {}
+        # the query parser is not thread-safe
+        parsedQueries = [parse_update_type(query)[1] for query in queries]
+        threads = [threading.Thread(target=self.update,
+                                    args=(quitInstance, query, parsedQuery, results))
+                   for query, parsedQuery in zip(queries, parsedQueries)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def testCoalesceUpdates(self):
+        content = '<urn:x> <urn:y> <urn:z> .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo:
+            quitInstance = self.createQuit(repo)
+            parent = repo.revparse_single('master')
+            queries = [self.INSERT.format(i) for i in range(5)]
+
+            results = self.runConcurrently(quitInstance, queries)
+
+            commit = repo.revparse_single('master')
+            self.assertEqual(commit.parents[0].id, parent.id)
+            self.assertEqual(set(results.values()), {str(commit.id)})
+            for query in queries:
+                self.assertIn(query, commit.message)
+
+            graph, _ = quitInstance.instance('master')
+            self.assertEqual(len(graph.store.get_context(URIRef('http://example.org/'))), 6)
+
+    def testLimit(self):
+        content = '<urn:x> <urn:y> <urn:z> .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo:
+            quitInstance = self.createQuit(repo, window='60000', limit='2')
+            queries = [self.INSERT.format(i) for i in range(2)]
+
+            results = self.runConcurrently(quitInstance, queries)
+
+            self.assertEqual(set(results.values()), {str(repo.revparse_single('master').id)})
+
+    def testFailingUpdateDoesNotAffectOthers(self):
+        content = '<urn:x> <urn:y> <urn:z> .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo:
+            quitInstance = self.createQuit(repo)
+            failing = 'LOAD <http://localhost:1/missing> INTO GRAPH <http://example.org/>'
+            queries = [
+                'INSERT DATA { GRAPH <http://example.org/> { <urn:1> <urn:p> <urn:o> } }',
+                failing,
+                'INSERT DATA { GRAPH <http://example.org/> { <urn:2> <urn:p> <urn:o> } }']
+
+            results = self.runConcurrently(quitInstance, queries)
+
+            self.assertIsInstance(results.pop(failing), Exception)
+            self.assertTrue(all(not isinstance(oid, Exception) for oid in results.values()))
+            graph, _ = quitInstance.instance('master')
+            self.assertEqual(len(graph.store.get_context(URIRef('http://example.org/'))), 3)
+
+
+class AsyncCommitterTests(unittest.TestCase):
+    INSERT = 'INSERT DATA {{ GRAPH <http://example.org/> {{ <urn:{}> <urn:p> <urn:o> }} }}'
+
+    def setUp(self):
+        plugin.register('sparql', UpdateProcessor,
+                        'quit.tools.processor', 'SPARQLUpdateProcessor')
+        self.directory = TemporaryDirectory()
+        self.wal = os.path.join(self.directory.name, 'quit.wal')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def createQuit(self, repo):
+        conf = quit.conf.QuitStoreConfiguration(
+            features=quit.conf.Feature.Unknown, namespace='http://quit.instance/',
+            targetdir=repo.workdir, wal=self.wal)
+        return quit.core.Quit(conf, quit.git.Repository(repo.workdir), quit.core.MemoryStore())
+
+    def update(self, quitInstance, query, target_ref='refs/heads/master'):
+        _, parsedQuery = parse_update_type(query)
+        return quitInstance.applyQueryOnCommit(parsedQuery, 'master', target_ref, query=query)
+
+    def count(self, quitInstance, branch='master'):
+        graph, _ = quitInstance.cachedInstance(branch)
+        return len(graph.store.get_context(URIRef('http://example.org/')))
+
+    def testCommitInBackground(self):
+        content = '<urn:x> <urn:y> <urn:z> .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo:
+            quitInstance = self.createQuit(repo)
+            parent = repo.revparse_single('master')
+
+            self.assertEqual(self.update(quitInstance, self.INSERT.format(1)), 1)
+            self.assertEqual(self.update(quitInstance, self.INSERT.format(2)), 2)
+            self.assertEqual(self.count(quitInstance), 3)
+
+            quitInstance.flush()
+            commit = repo.revparse_single('master')
+            self.assertEqual(commit.parents[0].parents[0].id, parent.id)
+            self.assertIn(self.INSERT.format(2), commit.message)
+            self.assertEqual(self.count(quitInstance), 3)
+            self.assertEqual(os.path.getsize(self.wal), 0)
+
+    def testSynchronousUpdateOnOtherBranch(self):
+        content = '<urn:x> <urn:y> <urn:z> .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo:
+            quitInstance = self.createQuit(repo)
+            self.update(quitInstance, self.INSERT.format(1))
+
+            oid = self.update(quitInstance, self.INSERT.format(2), target_ref='refs/heads/other')
+
+            self.assertEqual(oid, str(repo.revparse_single('other').id))
+            self.assertEqual(self.count(quitInstance, 'other'), 3)
+            self.assertEqual(self.count(quitInstance), 2)
+
+    def testReplayOnStart(self):
+        content = '<urn:x> <urn:y> <urn:z> .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo:
+            log = WriteAheadLog(self.wal)
+            delta = [{'type': 'INSERT', 'delta': {URIRef('http://example.org/'): [
+                ('additions', [(URIRef('urn:1'), URIRef('urn:p'), URIRef('urn:o'))])]}}]
+            log.append({'ref': 'refs/heads/master', 'query': self.INSERT.format(1),
+                        'default_graph': [], 'named_graph': [],
+                        'delta': serializeDelta(delta)})
+            log.close()
+
+            quitInstance = self.createQuit(repo)
+
+            self.assertIn(self.INSERT.format(1), repo.revparse_single('master').message)
+            self.assertEqual(self.count(quitInstance), 2)
+            self.assertEqual(WriteAheadLog(self.wal).entries(), [])
+
+    def testReplayCommittedUpdate(self):
+        content = '<urn:x> <urn:y> <urn:z> .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo:
+            # the process stops after the commit but before the checkpoint
+            with mock.patch.object(WriteAheadLog, 'checkpoint'):
+                quitInstance = self.createQuit(repo)
+                self.update(quitInstance, self.INSERT.format(1))
+                quitInstance.flush()
+            commit = repo.revparse_single('master')
+
+            quitInstance = self.createQuit(repo)
+
+            self.assertEqual(repo.revparse_single('master').id, commit.id)
+            self.assertEqual(quitInstance.commitOf(1), str(commit.id))
+            self.assertEqual(WriteAheadLog(self.wal).entries(), [])
+
+    def testCommitOf(self):
+        content = '<urn:x> <urn:y> <urn:z> .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo:
+            quitInstance = self.createQuit(repo)
+            sequence = self.update(quitInstance, self.INSERT.format(1))
+
+            oid = quitInstance.commitOf(sequence, timeout=10)
+
+            self.assertEqual(oid, str(repo.revparse_single('master').id))
+            graph, _ = quitInstance.cachedInstance(oid)
+            self.assertEqual(len(graph.store.get_context(URIRef('http://example.org/'))), 2)
+            self.assertRaises(KeyError, quitInstance.commitOf, sequence + 1)
+
+    def testRetryFailedCommit(self):
+        content = '<urn:x> <urn:y> <urn:z> .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo:
+            quitInstance = self.createQuit(repo)
+            parent = repo.revparse_single('master')
+            commit = quitInstance.commit
+            errors = []
+
+            def failOnce(*args, **kwargs):
+                oid = commit(*args, **kwargs)
+                if not errors:
+                    # the commit is written, but the attempt fails afterwards
+                    errors.append(RuntimeError('failed'))
+                    raise errors[0]
+                return oid
+
+            with mock.patch.object(quit.committer.AsyncCommitter, 'RETRY_DELAY', 0.01), \
+                    mock.patch.object(quitInstance, 'commit', failOnce):
+                sequence = self.update(quitInstance, self.INSERT.format(1))
+                oid = quitInstance.commitOf(sequence, timeout=10)
+
+            self.assertEqual(len(errors), 1)
+            self.assertIsNone(quitInstance.commitError)
+            self.assertEqual(quitInstance.pendingUpdates, 0)
+            self.assertEqual(oid, str(repo.revparse_single('master').id))
+            self.assertEqual(repo.revparse_single('master').parents[0].id, parent.id)
+            quitInstance.flush()
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
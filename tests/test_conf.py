@@ -40,6 +40,27 @@ class TestConfiguration(unittest.TestCase):
                 with self.assertRaises(InvalidConfigurationError):
                     QuitStoreConfiguration(targetdir=repo.workdir, namespace=uri)
 
+    def testGroupCommit(self):
+        content1 = '<urn:x> <urn:y> <urn:z> .'
+        repoContent = {'http://example.org/': content1}
+        with TemporaryRepositoryFactory().withGraphs(repoContent) as repo:
+            conf = QuitStoreConfiguration(targetdir=repo.workdir, namespace=self.ns)
+            self.assertIsNone(conf.groupcommitwindow)
+
+            conf = QuitStoreConfiguration(targetdir=repo.workdir, namespace=self.ns,
+                                          groupcommit='50', groupcommitlimit='10')
+            self.assertEqual(conf.groupcommitwindow, 0.05)
+            self.assertEqual(conf.groupcommitlimit, 10)
+
+            for window, limit in [('soon', None), ('-1', None), ('50', '0')]:
+                with self.assertRaises(InvalidConfigurationError):
+                    QuitStoreConfiguration(targetdir=repo.workdir, namespace=self.ns,
+                                           groupcommit=window, groupcommitlimit=limit)
+
+            with self.assertRaises(InvalidConfigurationError):
+                QuitStoreConfiguration(targetdir=repo.workdir, namespace=self.ns,
+                                       groupcommit='50', wal='quit.wal')
+
     def testStoreConfigurationWithDir(self):
         content1 = '<urn:x> <urn:y> <urn:z> .'
         repoContent = {'http://example.org/': content1}
@@ -3,19 +3,25 @@
 
 import os
 import stat
+import threading
 import time
 import unittest
 from context import quit
 import quit.core
 import quit.git
 import quit.conf
-from quit.graphs import InMemoryAggregatedGraph
+from quit.graphs import InMemoryAggregatedGraph, OverlayGraph
 from os import path, environ
 from pygit2 import init_repository, Repository, clone_repository
 from pygit2 import GIT_SORT_TOPOLOGICAL, GIT_SORT_REVERSE, Signature
-from rdflib import Graph, URIRef
+from rdflib import BNode, Graph, URIRef, plugin
+from rdflib.query import UpdateProcessor
 from tempfile import TemporaryDirectory, NamedTemporaryFile
 from helpers import TemporaryRepositoryFactory
+from quit.helpers import parse_update_type
+from quit.namespace import QUIT
+from quit.termstore import CompactStore
+from unittest.mock import patch
 
 
 class QueryableTests(unittest.TestCase):
@@ -117,6 +123,381 @@ class QuitTests(unittest.TestCase):
             quitInstance = quit.core.Quit(conf, quit.git.Repository(repo.path), None)
             self.assertTrue(quitInstance.getDefaultBranch() in ["main", "master"])
 
+    def testCommitKeepsUntouchedBlobs(self):
+        content1 = '<urn:x> <urn:y> <urn:z> .'
+        content2 = '<urn:a> <urn:b> <urn:c> .'
+        repoContent = {'http://example.org/': content1, 'http://aksw.org/': content2}
+        with TemporaryRepositoryFactory().withGraphs(repoContent) as repo:
+            conf = quit.conf.QuitStoreConfiguration(features=quit.conf.Feature.Unknown,
+                                                    namespace='http://quit.instance/',
+                                                    targetdir=repo.workdir)
+            quitInstance = quit.core.Quit(conf, quit.git.Repository(repo.workdir),
+                                          quit.core.MemoryStore())
+            parent = repo.revparse_single('master')
+            blobs = quitInstance.getFilesForCommit(quitInstance.repository.revision('master'))
+            self.assertEqual(len(blobs), 2)
+
+            triple = (URIRef('urn:1'), URIRef('urn:2'), URIRef('urn:3'))
+            delta = [{'type': 'INSERT',
+                      'delta': {URIRef('http://example.org/'): [('additions', [triple])]}}]
+            graph, _ = quitInstance.instance('master')
+            quitInstance.commit(graph, delta, 'New Commit', 'master', 'refs/heads/master')
+
+            commit = repo.revparse_single('master')
+            self.assertNotEqual(commit.id, parent.id)
+            changed = {name for name, _ in quitInstance.getFilesForCommit(
+                quitInstance.repository.revision(str(commit.id))) - blobs}
+            self.assertEqual(len(changed), 1)
+            diff = repo.diff(parent, commit)
+            self.assertEqual(len(diff), 1)
+            self.assertEqual(diff[0].delta.new_file.path, changed.pop())
+
+    def testCommitReusesDeltaForProvenance(self):
+        content = '<urn:x> <urn:y> <urn:z> .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo:
+            conf = quit.conf.QuitStoreConfiguration(features=quit.conf.Feature.Provenance,
+                                                    namespace='http://quit.instance/',
+                                                    targetdir=repo.workdir)
+            quitInstance = quit.core.Quit(conf, quit.git.Repository(repo.workdir),
+                                          quit.core.MemoryStore())
+            quitInstance.syncAll()
+
+            added = (URIRef('urn:1'), URIRef('urn:2'), URIRef('urn:3'))
+            cancelled = (URIRef('urn:4'), URIRef('urn:5'), URIRef('urn:6'))
+            removed = (URIRef('urn:x'), URIRef('urn:y'), URIRef('urn:z'))
+            delta = [{'type': 'INSERT', 'delta': {URIRef('http://example.org/'): [
+                         ('additions', [added, cancelled])]}},
+                     {'type': 'DELETE', 'delta': {URIRef('http://example.org/'): [
+                         ('removals', [cancelled, removed])]}}]
+            graph, _ = quitInstance.instance('master')
+
+            with patch('quit.core.graphdiff') as graphdiff:
+                oid = quitInstance.commit(graph, delta, 'New Commit', 'master',
+                                          'refs/heads/master')
+            graphdiff.assert_not_called()
+
+            store = quitInstance.store.store
+            additions = store.get_context(QUIT['additions-' + oid])
+            removals = store.get_context(QUIT['removals-' + oid])
+            self.assertEqual(set(additions), {added})
+            self.assertEqual(set(removals), {removed})
+
+    def testPersistentStoreSyncsOnlyNewCommits(self):
+        content = '<urn:x> <urn:y> <urn:z> .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo, \
+                TemporaryDirectory() as storeDir:
+            conf = quit.conf.QuitStoreConfiguration(features=quit.conf.Feature.Provenance,
+                                                    namespace='http://quit.instance/',
+                                                    targetdir=repo.workdir)
+            quitInstance = quit.core.Quit(conf, quit.git.Repository(repo.workdir),
+                                          quit.core.PersistentStore(storeDir))
+            quitInstance.syncAll()
+            triple = (URIRef('urn:1'), URIRef('urn:2'), URIRef('urn:3'))
+            delta = [{'type': 'INSERT',
+                      'delta': {URIRef('http://example.org/'): [('additions', [triple])]}}]
+            graph, _ = quitInstance.instance('master')
+            oid = quitInstance.commit(graph, delta, 'New Commit', 'master', 'refs/heads/master')
+            quads = len(quitInstance.store.store)
+
+            store = quit.core.PersistentStore(storeDir)
+            self.assertEqual(len(store.store), quads)
+            restarted = quit.core.Quit(conf, quit.git.Repository(repo.workdir), store)
+            with patch.object(restarted, 'changeset') as changeset:
+                restarted.syncAll()
+            changeset.assert_not_called()
+            self.assertEqual(store.refs, {'refs/heads/master': oid})
+
+    def testPersistentStoreRebuildsAfterHistoryRewrite(self):
+        content = '<urn:x> <urn:y> <urn:z> .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo, \
+                TemporaryDirectory() as storeDir:
+            conf = quit.conf.QuitStoreConfiguration(features=quit.conf.Feature.Provenance,
+                                                    namespace='http://quit.instance/',
+                                                    targetdir=repo.workdir)
+            quitInstance = quit.core.Quit(conf, quit.git.Repository(repo.workdir),
+                                          quit.core.PersistentStore(storeDir))
+            quitInstance.syncAll()
+            old = repo.revparse_single('master')
+
+            # replace the history of master by an unrelated commit
+            author = Signature('QuitStoreTest', 'quit@quit.aksw.org')
+            rewritten = repo.create_commit(None, author, author, 'rewritten', old.tree_id, [])
+            repo.references['refs/heads/master'].set_target(rewritten)
+
+            restarted = quit.core.Quit(conf, quit.git.Repository(repo.workdir),
+                                       quit.core.PersistentStore(storeDir))
+            self.assertFalse(restarted.isStoreConsistent())
+            restarted.syncAll()
+            self.assertTrue(restarted.isStoreConsistent())
+            self.assertFalse(restarted._exists(str(old.id)))
+            self.assertTrue(restarted._exists(str(repo.revparse_single('master').id)))
+
+    def testSyncAllMergeHistory(self):
+        content = '<urn:x> <urn:y> <urn:z> .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo:
+            # build a history where every commit merges a side branch
+            author = Signature('QuitStoreTest', 'quit@quit.aksw.org')
+            head = repo.revparse_single('master')
+            for i in range(200):
+                side = repo.create_commit(None, author, author, 'side {}'.format(i),
+                                          head.tree_id, [head.id])
+                main = repo.create_commit(None, author, author, 'main {}'.format(i),
+                                          head.tree_id, [head.id])
+                merge = repo.create_commit(None, author, author, 'merge {}'.format(i),
+                                           head.tree_id, [main, side])
+                head = repo.get(merge)
+            repo.references['refs/heads/master'].set_target(head.id)
+
+            conf = quit.conf.QuitStoreConfiguration(features=quit.conf.Feature.Unknown,
+                                                    namespace='http://quit.instance/',
+                                                    targetdir=repo.workdir)
+            quitInstance = quit.core.Quit(conf, quit.git.Repository(repo.workdir),
+                                          quit.core.MemoryStore())
+            synced = []
+            with patch.object(quitInstance, 'changeset',
+                              side_effect=lambda commit, delta=None: synced.append(commit.id)):
+                quitInstance.syncAll()
+                quitInstance.syncAll()
+
+            self.assertEqual(len(synced), 601)
+            self.assertEqual(len(set(synced)), 601)
+            position = {cid: i for i, cid in enumerate(synced)}
+            for cid in synced:
+                for parent in repo.get(cid).parent_ids:
+                    self.assertLess(position[str(parent)], position[cid])
+
+    def testSyncAllParallel(self):
+        def withoutBNodes(store):
+            return {(s, p, o, c.identifier) for s, p, o, c in store.store.quads()
+                    if not any(isinstance(t, BNode) for t in (s, p, o))}
+
+        content = '<urn:x> <urn:y> <urn:z> .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo:
+            author = Signature('QuitStoreTest', 'quit@quit.aksw.org')
+            for i in range(4):
+                with open(path.join(repo.workdir, 'graph_0.nt'), 'w') as f:
+                    f.write(''.join('<urn:{}> <urn:y> <urn:z> .\n'.format(j) for j in range(i + 1)))
+                index = repo.index
+                index.read()
+                index.add('graph_0.nt')
+                index.write()
+                repo.create_commit('HEAD', author, author, 'commit {}'.format(i),
+                                   index.write_tree(), [repo.head.target])
+
+            stores = []
+            for workers in (None, 2):
+                conf = quit.conf.QuitStoreConfiguration(
+                    features=quit.conf.Feature.Provenance | quit.conf.Feature.Persistence,
+                    namespace='http://quit.instance/', targetdir=repo.workdir,
+                    syncworkers=workers)
+                quitInstance = quit.core.Quit(conf, quit.git.Repository(repo.workdir),
+                                              quit.core.MemoryStore())
+                quitInstance.syncAll()
+                stores.append(quitInstance.store)
+
+            serial, parallel = stores
+            self.assertEqual(len(serial.store), len(parallel.store))
+            self.assertEqual(withoutBNodes(serial), withoutBNodes(parallel))
+
+    def testBlobCacheSkipsParsingAfterRestart(self):
+        content = '<urn:x> <urn:y> <urn:z> .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo, \
+                TemporaryDirectory() as cacheDir:
+            conf = quit.conf.QuitStoreConfiguration(features=quit.conf.Feature.Unknown,
+                                                    namespace='http://quit.instance/',
+                                                    targetdir=repo.workdir, blobcache=cacheDir)
+            commit = quit.git.Repository(repo.workdir).revision('master')
+            blob, = quit.core.Quit(conf, quit.git.Repository(repo.workdir),
+                                   quit.core.MemoryStore()).getFilesForCommit(commit)
+
+            first = quit.core.Quit(conf, quit.git.Repository(repo.workdir),
+                                   quit.core.MemoryStore())
+            first.getContext(blob, commit)
+
+            restarted = quit.core.Quit(conf, quit.git.Repository(repo.workdir),
+                                       quit.core.MemoryStore())
+            with patch.object(Graph, 'parse') as parse:
+                graph = restarted.getContext(blob, commit)
+            parse.assert_not_called()
+            self.assertEqual(set(graph), {(URIRef('urn:x'), URIRef('urn:y'), URIRef('urn:z'))})
+            self.assertEqual(graph.identifier, URIRef('http://example.org/'))
+
+    def testCommitProvenanceOfModify(self):
+        content = '<urn:x> <urn:y> <urn:z> .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo:
+            conf = quit.conf.QuitStoreConfiguration(features=quit.conf.Feature.Provenance,
+                                                    namespace='http://quit.instance/',
+                                                    targetdir=repo.workdir)
+            quitInstance = quit.core.Quit(conf, quit.git.Repository(repo.workdir),
+                                          quit.core.MemoryStore())
+            quitInstance.syncAll()
+
+            # the templates are filled with triples which are already or not in the graph
+            query = """DELETE { GRAPH <http://example.org/> { ?s ?p ?o . <urn:a> ?p ?o } }
+                INSERT { GRAPH <http://example.org/> { ?s ?p ?o . <urn:n> ?p ?o } }
+                WHERE { GRAPH <http://example.org/> { ?s ?p ?o } }"""
+            _, parsedQuery = parse_update_type(query)
+            plugin.register('sparql', UpdateProcessor,
+                            'quit.tools.processor', 'SPARQLUpdateProcessor')
+            quitInstance.applyQueryOnCommit(parsedQuery, 'master', 'refs/heads/master')
+            oid = str(quitInstance.repository.revision('master').id)
+
+            store = quitInstance.store.store
+            additions = store.get_context(QUIT['additions-' + oid])
+            removals = store.get_context(QUIT['removals-' + oid])
+            self.assertEqual(set(additions), {(URIRef('urn:n'), URIRef('urn:y'), URIRef('urn:z'))})
+            self.assertEqual(set(removals), set())
+
+    def testCachedInstance(self):
+        content1 = '<urn:x> <urn:y> <urn:z> .'
+        content2 = '<urn:a> <urn:b> <urn:c> .'
+        repoContent = {'http://example.org/': content1, 'http://aksw.org/': content2}
+        with TemporaryRepositoryFactory().withGraphs(repoContent) as repo:
+            conf = quit.conf.QuitStoreConfiguration(features=quit.conf.Feature.Unknown,
+                                                    namespace='http://quit.instance/',
+                                                    targetdir=repo.workdir)
+            quitInstance = quit.core.Quit(conf, quit.git.Repository(repo.workdir),
+                                          quit.core.MemoryStore())
+
+            first, commitid = quitInstance.cachedInstance('master')
+            second, _ = quitInstance.cachedInstance(commitid)
+            self.assertEqual(first.store._contexts, second.store._contexts)
+            self.assertIsNot(first.store, second.store)
+
+            restricted, _ = quitInstance.cachedInstance(
+                'master', graphs={URIRef('http://aksw.org/')})
+            self.assertEqual([c.identifier for c in restricted.store.contexts()],
+                             [URIRef('http://aksw.org/')])
+
+            query = 'INSERT DATA { GRAPH <http://example.org/> { <urn:1> <urn:2> <urn:3> } }'
+            _, parsedQuery = parse_update_type(query)
+            plugin.register('sparql', UpdateProcessor,
+                            'quit.tools.processor', 'SPARQLUpdateProcessor')
+            quitInstance.applyQueryOnCommit(parsedQuery, 'master', 'refs/heads/master')
+            parent, _ = quitInstance.cachedInstance(commitid)
+            self.assertEqual(sum(len(c) for c in parent.store.contexts()), 2)
+
+            updated, newid = quitInstance.cachedInstance('master')
+            self.assertNotEqual(newid, commitid)
+            self.assertEqual(sum(len(c) for c in updated.store.contexts()), 3)
+
+    def testCachedInstanceConcurrentLoad(self):
+        content = '<urn:x> <urn:y> <urn:z> .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo:
+            conf = quit.conf.QuitStoreConfiguration(features=quit.conf.Feature.Unknown,
+                                                    namespace='http://quit.instance/',
+                                                    targetdir=repo.workdir)
+            quitInstance = quit.core.Quit(conf, quit.git.Repository(repo.workdir),
+                                          quit.core.MemoryStore())
+            parse_graph = quit.core.parse_graph
+
+            def parse(*args, **kwargs):
+                time.sleep(0.1)
+                return parse_graph(*args, **kwargs)
+
+            sizes = []
+
+            def query():
+                graph, _ = quitInstance.cachedInstance('master')
+                sizes.append(sum(len(c) for c in graph.store.contexts()))
+
+            with patch('quit.core.parse_graph', side_effect=parse) as parsed:
+                threads = [threading.Thread(target=query) for _ in range(5)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            self.assertEqual(parsed.call_count, 1)
+            self.assertEqual(sizes, [1] * 5)
+
+            # the shared dataset does not keep the parsed graph alive
+            _, graphs = quitInstance._instances.peek(quitInstance.repository.revision('master').id)
+            self.assertFalse(any(g.loaded for g in graphs))
+
+    def testUpdateKeepsParentVersionCached(self):
+        content = '<urn:x> <urn:y> <urn:z> .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo:
+            conf = quit.conf.QuitStoreConfiguration(features=quit.conf.Feature.Unknown,
+                                                    namespace='http://quit.instance/',
+                                                    targetdir=repo.workdir)
+            quitInstance = quit.core.Quit(conf, quit.git.Repository(repo.workdir),
+                                          quit.core.MemoryStore())
+            parent = quit.git.Repository(repo.workdir).revision('master')
+            blob, = quitInstance.getFilesForCommit(parent)
+            fileReference, graph = quitInstance.getFileReferenceAndContext(blob, parent)
+
+            query = 'INSERT DATA { GRAPH <http://example.org/> { <urn:1> <urn:2> <urn:3> } }'
+            _, parsedQuery = parse_update_type(query)
+            plugin.register('sparql', UpdateProcessor,
+                            'quit.tools.processor', 'SPARQLUpdateProcessor')
+            quitInstance.applyQueryOnCommit(parsedQuery, 'master', 'refs/heads/master')
+
+            with patch.object(quit.git.Node, 'data'):
+                self.assertEqual(quitInstance.getFileReferenceAndContext(blob, parent),
+                                 (fileReference, graph))
+            self.assertEqual(fileReference.content, content + '\n')
+            self.assertEqual(len(graph), 1)
+
+            commit = quit.git.Repository(repo.workdir).revision('master')
+            newBlob, = quitInstance.getFilesForCommit(commit)
+            newReference, newGraph = quitInstance.getFileReferenceAndContext(newBlob, commit)
+            self.assertEqual(len(newGraph), 2)
+            self.assertEqual(newReference.content.count('\n'), 2)
+
+    def testUpdateFoldsOverlays(self):
+        content = '<urn:x> <urn:y> <urn:z> .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo:
+            conf = quit.conf.QuitStoreConfiguration(features=quit.conf.Feature.Unknown,
+                                                    namespace='http://quit.instance/',
+                                                    targetdir=repo.workdir)
+            quitInstance = quit.core.Quit(conf, quit.git.Repository(repo.workdir),
+                                          quit.core.MemoryStore())
+            plugin.register('sparql', UpdateProcessor,
+                            'quit.tools.processor', 'SPARQLUpdateProcessor')
+
+            def update(i):
+                query = 'INSERT DATA {{ GRAPH <http://example.org/> {{ <urn:{}> <urn:p> 1 }} }}'
+                _, parsedQuery = parse_update_type(query.format(i))
+                quitInstance.applyQueryOnCommit(parsedQuery, 'master', 'refs/heads/master')
+                commit = quitInstance.repository.revision('master')
+                blob, = quitInstance.getFilesForCommit(commit)
+                return quitInstance.getFileReferenceAndContext(blob, commit)[1]
+
+            graph = update(0)
+            self.assertIsInstance(graph, OverlayGraph)
+            self.assertIsInstance(update(1)._base, OverlayGraph)
+
+            with patch.object(quit.core, 'OVERLAY_FOLD_TRIPLES', 2):
+                graph = update(2)
+            self.assertNotIsInstance(graph, OverlayGraph)
+            self.assertEqual(len(graph), 4)
+            self.assertIs(update(3).root, graph)
+
+    def testCompactGraphs(self):
+        content = '<urn:x> <urn:y> <urn:z> .\n<urn:x> <urn:y> "z"@en .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo:
+            conf = quit.conf.QuitStoreConfiguration(features=quit.conf.Feature.Unknown,
+                                                    namespace='http://quit.instance/',
+                                                    targetdir=repo.workdir, compactgraphs=True)
+            quitInstance = quit.core.Quit(conf, quit.git.Repository(repo.workdir),
+                                          quit.core.MemoryStore())
+            commit = quit.git.Repository(repo.workdir).revision('master')
+            blob, = quitInstance.getFilesForCommit(commit)
+            graph = quitInstance.getContext(blob, commit)
+            self.assertIsInstance(graph.store, CompactStore)
+            self.assertEqual(len(graph), 2)
+
+            query = 'INSERT DATA { GRAPH <http://example.org/> { <urn:x> <urn:y> <urn:1> } }'
+            _, parsedQuery = parse_update_type(query)
+            plugin.register('sparql', UpdateProcessor,
+                            'quit.tools.processor', 'SPARQLUpdateProcessor')
+            quitInstance.applyQueryOnCommit(parsedQuery, 'master', 'refs/heads/master')
+
+            instance, _ = quitInstance.instance('master')
+            result = instance.query('SELECT ?o WHERE { GRAPH ?g { <urn:x> <urn:y> ?o } }')
+            self.assertEqual(len(result), 3)
+            self.assertEqual(len(graph), 2)
+
 
 class SeveralOldTest(unittest.TestCase):
     """Sort these test according to their corresponding classes."""
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest import mock
+from context import quit
+import quit.tools.evaluate
+from quit.tools.algebra import translateQuery
+from rdflib import Graph, Literal, URIRef
+from rdflib.plugins.sparql import algebra, evaluate
+from rdflib.plugins.sparql.parser import parseQuery
+
+
+class HashJoinTests(unittest.TestCase):
+    """Compare the hash joins with the evaluation of rdflib."""
+
+    def setUp(self):
+        self.graph = Graph()
+        for i in range(60):
+            s = URIRef('urn:s{}'.format(i))
+            self.graph.add((s, URIRef('urn:a'), Literal(i % 7)))
+            if i % 3:
+                self.graph.add((s, URIRef('urn:b'), Literal(i % 5)))
+            if i % 4 == 0:
+                self.graph.add((s, URIRef('urn:c'), URIRef('urn:s{}'.format(i // 2))))
+
+    def evaluate(self, query):
+        result = quit.tools.evaluate.evalQuery(
+            self.graph, translateQuery(parseQuery(query)), {})
+        return sorted(sorted(row.items()) for row in result['bindings'])
+
+    def expected(self, query):
+        result = evaluate.evalQuery(self.graph, algebra.translateQuery(parseQuery(query)), {})
+        return sorted(sorted(row.items()) for row in result['bindings'])
+
+    def assertQuery(self, query, reference=None):
+        """Compare with the result of rdflib, for a reference query if given."""
+        expected = self.expected(reference or query)
+        self.assertEqual(self.evaluate(query), expected)
+        with mock.patch.object(quit.tools.evaluate, 'HASH_JOIN_MEMORY_ROWS', 5), \
+                mock.patch.object(quit.tools.evaluate, 'HASH_JOIN_PARTITIONS', 3):
+            self.assertEqual(self.evaluate(query), expected)
+        return expected
+
+    def testJoin(self):
+        query = """SELECT * WHERE {
+                { SELECT DISTINCT ?s ?a WHERE { ?s <urn:a> ?a } }
+                { SELECT DISTINCT ?s ?b WHERE { ?s <urn:b> ?b } }
+            }"""
+        with mock.patch.object(quit.tools.evaluate, '_join', side_effect=AssertionError):
+            self.assertEqual(len(self.assertQuery(query)), 40)
+
+    def testJoinOptionalVariables(self):
+        # solutions of the first part without ?c are compatible with all of the second part
+        query = """SELECT * WHERE {
+                { SELECT DISTINCT ?s ?c WHERE { ?s <urn:a> 1 OPTIONAL { ?s <urn:c> ?c } } }
+                { SELECT DISTINCT ?c ?b WHERE { ?c <urn:b> ?b } }
+            }"""
+        self.assertQuery(query)
+
+    def testLeftJoin(self):
+        # rdflib pushes the bindings into the sub-select and loses ?a
+        query = """SELECT * WHERE {
+                ?s <urn:a> ?a
+                OPTIONAL { SELECT ?s ?b WHERE { ?s <urn:b> ?b } }
+            }"""
+        reference = 'SELECT * WHERE { ?s <urn:a> ?a OPTIONAL { ?s <urn:b> ?b } }'
+        self.assertEqual(len(self.assertQuery(query, reference)), 60)
+        with mock.patch.object(quit.tools.evaluate, 'evalLeftJoin',
+                               side_effect=AssertionError):
+            self.evaluate(query)
+
+    def testLeftJoinFilter(self):
+        query = """SELECT * WHERE {
+                ?s <urn:a> ?a
+                OPTIONAL { { SELECT ?s ?b WHERE { ?s <urn:b> ?b } } FILTER (?b < ?a) }
+            }"""
+        reference = """SELECT * WHERE {
+                ?s <urn:a> ?a OPTIONAL { ?s <urn:b> ?b FILTER (?b < ?a) }
+            }"""
+        self.assertQuery(query, reference)
+
+    def testMinus(self):
+        query = """SELECT * WHERE {
+                ?s <urn:a> ?a MINUS { ?s <urn:b> ?b }
+            }"""
+        self.assertEqual(len(self.assertQuery(query)), 20)
+
+    def testMinusDisjoint(self):
+        query = 'SELECT * WHERE { ?s <urn:a> ?a MINUS { ?x <urn:b> ?b } }'
+        self.assertEqual(len(self.assertQuery(query)), 60)
+
+
+class OrderByTests(unittest.TestCase):
+    """Compare the order of the solutions with the evaluation of rdflib."""
+
+    def setUp(self):
+        self.graph = Graph()
+        for i in range(60):
+            s = URIRef('urn:s{}'.format(i))
+            self.graph.add((s, URIRef('urn:a'), Literal(i % 7)))
+            if i % 3:
+                self.graph.add((s, URIRef('urn:b'), Literal(i % 5)))
+
+    def assertOrder(self, query):
+        result = quit.tools.evaluate.evalQuery(self.graph, translateQuery(parseQuery(query)), {})
+        expected = evaluate.evalQuery(self.graph, algebra.translateQuery(parseQuery(query)), {})
+        rows = [sorted(row.items()) for row in result['bindings']]
+        self.assertEqual(rows, [sorted(row.items()) for row in expected['bindings']])
+        return rows
+
+    def testOrderBy(self):
+        # unbound values of ?b are ordered first
+        for order in ('?a ?s', 'DESC(?a) DESC(?s)', 'DESC(?a) ?s', '?b DESC(?s)'):
+            query = """SELECT * WHERE {{
+                    ?s <urn:a> ?a OPTIONAL {{ ?s <urn:b> ?b }}
+                }} ORDER BY {}""".format(order)
+            self.assertEqual(len(self.assertOrder(query)), 60)
+
+    def testTopK(self):
+        for order in ('?a ?s', 'DESC(?a) DESC(?s)', 'DESC(?a) ?s'):
+            query = """SELECT ?s WHERE {{
+                    ?s <urn:a> ?a OPTIONAL {{ ?s <urn:b> ?b }}
+                }} ORDER BY {} LIMIT 5 OFFSET 7""".format(order)
+            with mock.patch.object(quit.tools.evaluate, 'sorted', create=True,
+                                   side_effect=AssertionError):
+                self.assertEqual(len(self.assertOrder(query)), 5)
+
+        query = 'SELECT ?s WHERE { ?s <urn:a> ?a } ORDER BY ?a ?s LIMIT 0'
+        self.assertEqual(self.assertOrder(query), [])
+        query = 'SELECT ?s WHERE { ?s <urn:a> ?a } ORDER BY ?a ?s LIMIT 100'
+        self.assertEqual(len(self.assertOrder(query)), 60)
+
+        # duplicates are removed before the limit applies
+        query = 'SELECT DISTINCT ?a WHERE { ?s <urn:a> ?a } ORDER BY ?a LIMIT 3'
+        self.assertEqual(len(self.assertOrder(query)), 3)
+
+    def testOffset(self):
+        query = 'SELECT ?s WHERE { ?s <urn:a> ?a } ORDER BY ?s OFFSET 55'
+        self.assertEqual(len(self.assertOrder(query)), 5)
+        query = 'SELECT ?s WHERE { ?s <urn:a> ?a } OFFSET 55'
+        self.assertEqual(len(self.assertOrder(query)), 5)
+        query = 'SELECT ?s WHERE { ?s <urn:a> ?a } OFFSET 100'
+        self.assertEqual(self.assertOrder(query), [])
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
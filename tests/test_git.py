@@ -116,6 +116,42 @@ class GitIndexTests(unittest.TestCase):
                 "test@quitstore.example.org"
             )
 
+    def testIndexCommitDetachedWorktree(self):
+        self.createcommit()
+        self.repo = quit.git.Repository(self.dir.name, worktree=False)
+
+        index = self.repo.index(self.repo.revision('HEAD').id)
+        index.add(self.filename, b'Second Line\n')
+        index.add('new.nt', b'New Line\n')
+        index.commit("Commit without checkout", "QuitTest", "test@quitstore.example.org")
+
+        with open(path.join(self.dir.name, self.filename), 'rb') as f:
+            self.assertEqual(f.read(), b'First Line\n')
+        self.assertFalse(path.exists(path.join(self.dir.name, 'new.nt')))
+
+        self.assertEqual(self.repo.sync_worktree(), [])
+
+        with open(path.join(self.dir.name, self.filename), 'rb') as f:
+            self.assertEqual(f.read(), b'Second Line\n')
+        with open(path.join(self.dir.name, 'new.nt'), 'rb') as f:
+            self.assertEqual(f.read(), b'New Line\n')
+        self.assertEqual(Repository(self.dir.name).status(), {})
+
+    def testSyncWorktreeKeepsLocalChanges(self):
+        self.createcommit()
+        self.repo = quit.git.Repository(self.dir.name, worktree=False)
+
+        index = self.repo.index(self.repo.revision('HEAD').id)
+        index.add(self.filename, b'Second Line\n')
+        index.commit("Commit without checkout", "QuitTest", "test@quitstore.example.org")
+
+        with open(path.join(self.dir.name, self.filename), 'wb') as f:
+            f.write(b'Local Line\n')
+
+        self.assertEqual(self.repo.sync_worktree(), [self.filename])
+        with open(path.join(self.dir.name, self.filename), 'rb') as f:
+            self.assertEqual(f.read(), b'Local Line\n')
+
 
 class GitRepositoryTests(unittest.TestCase):
 
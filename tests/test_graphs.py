@@ -2,7 +2,7 @@
 
 import unittest
 from context import quit
-from quit.graphs import RewriteGraph, CopyOnEditGraph
+from quit.graphs import RewriteGraph, OverlayGraph, LazyGraph
 from quit.graphs import InMemoryAggregatedGraph, InMemoryCopyOnEditAggregatedGraph
 from os import path, environ
 from pygit2 import init_repository, Repository, clone_repository
@@ -19,13 +19,129 @@ class RewriteGraphTests(unittest.TestCase):
         pass
 
 
-class CopyOnEditGraphTests(unittest.TestCase):
+class OverlayGraphTests(unittest.TestCase):
     def setUp(self):
+        self.base = Graph(identifier='urn:graph')
+        self.base.add((URIRef('urn:1'), URIRef('urn:2'), URIRef('urn:3')))
+        self.base.add((URIRef('urn:4'), URIRef('urn:5'), URIRef('urn:6')))
+
+    def tearDown(self):
         pass
 
+    def testAddDoesNotTouchBase(self):
+        g = OverlayGraph(self.base)
+        g.add((URIRef('urn:7'), URIRef('urn:8'), URIRef('urn:9')))
+        g.add((URIRef('urn:1'), URIRef('urn:2'), URIRef('urn:3')))
+
+        self.assertEqual(g.identifier, self.base.identifier)
+        self.assertEqual(len(g), 3)
+        self.assertIn((URIRef('urn:7'), URIRef('urn:8'), URIRef('urn:9')), g)
+        self.assertEqual(len(self.base), 2)
+        self.assertEqual(len(g._additions), 1)
+
+    def testRemoveDoesNotTouchBase(self):
+        g = OverlayGraph(self.base)
+        g.add((URIRef('urn:7'), URIRef('urn:8'), URIRef('urn:9')))
+        g.remove((URIRef('urn:1'), None, None))
+        g.remove((URIRef('urn:7'), URIRef('urn:8'), URIRef('urn:9')))
+
+        self.assertEqual(set(g), {(URIRef('urn:4'), URIRef('urn:5'), URIRef('urn:6'))})
+        self.assertEqual(len(g), 1)
+        self.assertEqual(len(self.base), 2)
+        self.assertTrue(g.modified)
+
+        g.add((URIRef('urn:1'), URIRef('urn:2'), URIRef('urn:3')))
+        self.assertEqual(len(g), 2)
+        self.assertFalse(g.modified)
+
+    def testOverlayOfOverlay(self):
+        g1 = OverlayGraph(self.base)
+        g1.remove((URIRef('urn:1'), URIRef('urn:2'), URIRef('urn:3')))
+        g2 = OverlayGraph(g1)
+        g2.add((URIRef('urn:7'), URIRef('urn:8'), URIRef('urn:9')))
+
+        self.assertIs(g2._base, g1)
+        self.assertIs(g2.root, self.base)
+        self.assertEqual(len(g2._additions), 1)
+        self.assertEqual(g2.modifications, 2)
+        self.assertEqual(len(g1), 1)
+        self.assertEqual(len(g2), 2)
+        self.assertEqual(set(g2), {(URIRef('urn:4'), URIRef('urn:5'), URIRef('urn:6')),
+                                   (URIRef('urn:7'), URIRef('urn:8'), URIRef('urn:9'))})
+
+    def testMergeOverlays(self):
+        graphs = [self.base]
+        for i in range(20):
+            g = OverlayGraph(graphs[-1])
+            g.add((URIRef('urn:s{}'.format(i)), URIRef('urn:p'), URIRef('urn:o')))
+            if i % 3 == 0:
+                g.remove((URIRef('urn:s{}'.format(i // 2)), None, None))
+            if i == 5:
+                g.remove((URIRef('urn:1'), None, None))
+            if i == 7:
+                g.add((URIRef('urn:1'), URIRef('urn:2'), URIRef('urn:3')))
+            self.assertLessEqual(g._depth, OverlayGraph.FOLD_DEPTH)
+            self.assertIs(g.root, self.base)
+            graphs.append(g)
+
+        expected = {(URIRef('urn:s{}'.format(i)), URIRef('urn:p'), URIRef('urn:o'))
+                    for i in range(20) if i not in (0, 1, 3, 4, 6, 7, 9)}
+        expected |= set(self.base)
+        self.assertEqual(set(graphs[-1]), expected)
+        self.assertEqual(len(graphs[-1]), len(expected))
+        self.assertEqual(len(self.base), 2)
+
+        merged = graphs[-1].merged()
+        self.assertIs(merged._base, self.base)
+        self.assertEqual(set(merged), expected)
+        self.assertEqual(merged.modifications, 13)
+
+
+class LazyGraphTests(unittest.TestCase):
+    def setUp(self):
+        self.loads = 0
+
     def tearDown(self):
         pass
 
+    def load(self):
+        self.loads += 1
+        g = Graph(identifier='urn:graph')
+        g.add((URIRef('urn:1'), URIRef('urn:2'), URIRef('urn:3')))
+        return g
+
+    def testLoadOnFirstAccess(self):
+        g = LazyGraph(URIRef('urn:graph'), self.load)
+        iGraph = InMemoryAggregatedGraph(graphs=[g])
+
+        self.assertEqual(len(iGraph.contexts()), 1)
+        self.assertEqual(iGraph.get_context('urn:graph').identifier, URIRef('urn:graph'))
+        self.assertFalse(g.loaded)
+        self.assertEqual(self.loads, 0)
+
+        self.assertEqual(len(g), 1)
+        self.assertIn((URIRef('urn:1'), URIRef('urn:2'), URIRef('urn:3')), g)
+        self.assertEqual(len(list(g.triples((None, None, None)))), 1)
+        self.assertTrue(g.loaded)
+        self.assertEqual(self.loads, 1)
+
+    def testOnlyQueriedGraphIsLoaded(self):
+        g1 = LazyGraph(URIRef('urn:graph'), self.load)
+        g2 = LazyGraph(URIRef('urn:other'), self.load)
+        iGraph = InMemoryAggregatedGraph(graphs=[g1, g2])
+
+        triples = list(iGraph.triples((None, None, None), context=URIRef('urn:graph')))
+        self.assertEqual(len(triples), 1)
+        self.assertTrue(g1.loaded)
+        self.assertFalse(g2.loaded)
+
+    def testModifyLoadedGraph(self):
+        g = LazyGraph(URIRef('urn:graph'), self.load)
+        g += [(URIRef('urn:4'), URIRef('urn:5'), URIRef('urn:6'))]
+        g.remove((URIRef('urn:1'), URIRef('urn:2'), URIRef('urn:3')))
+
+        self.assertEqual(set(g), {(URIRef('urn:4'), URIRef('urn:5'), URIRef('urn:6'))})
+
 
 class InMemoryAggregatedGraphTests(unittest.TestCase):
     def setUp(self):
@@ -81,6 +197,18 @@ class InMemoryCopyOnEditAggregatedGraphTests(unittest.TestCase):
     def tearDown(self):
         pass
 
+    def testUpdateDoesNotTouchGraphs(self):
+        g = Graph(identifier='urn:graph')
+        g.add((URIRef('urn:1'), URIRef('urn:2'), URIRef('urn:3')))
+
+        iGraph = InMemoryCopyOnEditAggregatedGraph(graphs=[g])
+        iGraph.update('INSERT DATA { GRAPH <urn:graph> { <urn:4> <urn:5> <urn:6> } }')
+        iGraph.update('DELETE DATA { GRAPH <urn:graph> { <urn:1> <urn:2> <urn:3> } }')
+
+        self.assertEqual(len(iGraph), 1)
+        self.assertIs(iGraph.get_context('urn:graph'), iGraph.get_context(URIRef('urn:graph')))
+        self.assertEqual(set(g), {(URIRef('urn:1'), URIRef('urn:2'), URIRef('urn:3'))})
+
 
 def main():
     unittest.main()
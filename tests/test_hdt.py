@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+import os
+import unittest
+from context import quit
+import quit.conf
+import quit.core
+import quit.git
+from quit.graphs import SnapshotGraph
+from quit.hdt import HDTSnapshot, HDTStore
+from quit.ntriples import parse_graph
+from helpers import TemporaryRepositoryFactory
+from rdflib import BNode, Graph, Literal, URIRef, plugin
+from rdflib.compare import isomorphic
+from rdflib.graph import ModificationException
+from rdflib.query import Processor
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+
+class HDTTests(unittest.TestCase):
+    DOCUMENT = ''.join(
+        '<urn:s{}> <urn:p{}> "{}"^^<urn:type> .\n<urn:s{}> <urn:p{}> <urn:s{}> .\n'
+        '_:b{} <urn:p0> "x\\n\\"y\\""@en .\n<urn:s{}> <urn:p1> _:b{} .\n'
+        .format(i % 13, i % 4, i % 9, i % 13, i % 3, i % 17, i % 5, i % 7, i % 3)
+        for i in range(300))
+
+    def setUp(self):
+        plugin.register('sparql', Processor, 'quit.tools.processor', 'SPARQLProcessor')
+        self.expected = parse_graph(self.DOCUMENT)
+        self.directory = TemporaryDirectory()
+        self.store = HDTStore(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def patterns(self):
+        for triple in list(self.expected)[::7]:
+            if any(isinstance(term, BNode) for term in triple):
+                continue
+            s, p, o = triple
+            for mask in range(8):
+                yield (s if mask & 1 else None, p if mask & 2 else None, o if mask & 4 else None)
+
+    def assertMatches(self, graph):
+        """Compare with the parsed graph, blank nodes get new labels in a snapshot."""
+        self.assertEqual(len(graph), len(self.expected))
+        copy = Graph()
+        for triple in graph:
+            copy.add(triple)
+        self.assertTrue(isomorphic(copy, self.expected))
+        for pattern in self.patterns():
+            result = list(graph.triples(pattern))
+            expected = list(self.expected.triples(pattern))
+            self.assertEqual(len(result), len(expected))
+            self.assertEqual(
+                set(t for t in result if not any(isinstance(term, BNode) for term in t)),
+                set(t for t in expected if not any(isinstance(term, BNode) for term in t)))
+            self.assertEqual(graph.index.count(pattern), len(expected))
+        self.assertEqual(list(graph.triples((URIRef('urn:unknown'), None, None))), [])
+
+    def testTriples(self):
+        snapshot = self.store.set('abcdef', self.expected)
+        self.assertMatches(SnapshotGraph(snapshot, URIRef('http://example.org/')))
+        self.assertMatches(SnapshotGraph(self.store.get('abcdef'),
+                                         URIRef('http://example.org/')))
+
+    def testBlankNodesAfterEviction(self):
+        graph = Graph()
+        for i in range(50):
+            node = BNode()
+            graph.add((URIRef('urn:s{}'.format(i)), URIRef('urn:p'), node))
+            graph.add((node, URIRef('urn:q'), Literal(i)))
+        graph = SnapshotGraph(self.store.set('abcdef', graph), URIRef('http://example.org/'))
+        with mock.patch.object(HDTSnapshot, 'TERM_CACHE', 10):
+            result = graph.query('SELECT ?s ?v WHERE { ?s <urn:p> ?b . ?b <urn:q> ?v }')
+            self.assertEqual(len(result), 50)
+
+    def testCompressed(self):
+        self.store.set('abcdef', self.expected)
+        size = os.path.getsize(os.path.join(self.directory.name, 'ab', 'cdef.hdt'))
+        self.assertLess(size, len(self.DOCUMENT.encode('utf-8')) // 4)
+
+    def testBlocks(self):
+        snapshot = self.store.set('abcdef', self.expected)
+        blocks = list(snapshot.blocks((None, None, None), size=100))
+        self.assertEqual([len(block) for block in blocks[:-1]], [100] * (len(blocks) - 1))
+        graph = Graph()
+        for block in blocks:
+            for triple in block:
+                graph.add(triple)
+        self.assertTrue(isomorphic(graph, self.expected))
+
+    def testEmpty(self):
+        snapshot = self.store.set('abcdef', [])
+        self.assertEqual(len(snapshot), 0)
+        self.assertEqual(list(SnapshotGraph(snapshot, URIRef('http://example.org/'))), [])
+
+    def testDamaged(self):
+        with self.assertRaises(KeyError):
+            self.store.get('abcdef')
+        self.store.set('abcdef', self.expected)
+        filename = os.path.join(self.directory.name, 'ab', 'cdef.hdt')
+        with open(filename, 'wb') as f:
+            f.write(b'damaged')
+        with self.assertRaises(KeyError):
+            self.store.get('abcdef')
+        self.assertFalse(os.path.exists(filename))
+
+    def testReadOnly(self):
+        graph = SnapshotGraph(self.store.set('abcdef', self.expected),
+                              URIRef('http://example.org/'))
+        with self.assertRaises(ModificationException):
+            graph.add((URIRef('urn:a'), URIRef('urn:b'), URIRef('urn:c')))
+
+    def testQuitUsesSidecar(self):
+        content = '<urn:x> <urn:y> <urn:z> .\n<urn:x> <urn:y> "z" .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo:
+            conf = quit.conf.QuitStoreConfiguration(
+                features=quit.conf.Feature.Unknown, namespace='http://quit.instance/',
+                targetdir=repo.workdir, hdtsidecar=self.directory.name)
+            quitInstance = quit.core.Quit(conf, quit.git.Repository(repo.workdir),
+                                          quit.core.MemoryStore())
+            commit = quit.git.Repository(repo.workdir).revision('master')
+            blob, = quitInstance.getFilesForCommit(commit)
+            graph = quitInstance.getContext(blob, commit)
+            self.assertIsInstance(graph, SnapshotGraph)
+            self.assertIsInstance(graph.index, HDTSnapshot)
+            self.assertEqual(graph.identifier, URIRef('http://example.org/'))
+            self.assertIn((URIRef('urn:x'), URIRef('urn:y'), Literal('z')), graph)
+            self.assertTrue(os.path.isfile(os.path.join(
+                self.directory.name, str(blob[1])[:2], str(blob[1])[2:] + '.hdt')))
+
+            instance, _ = quitInstance.instance('master')
+            result = instance.query('SELECT ?o WHERE { GRAPH ?g { <urn:x> <urn:y> ?o } }')
+            self.assertEqual(len(result), 2)
+
+            # a graph which has been loaded for an update is taken from the cache
+            _, context = quitInstance.getFileReferenceAndContext(blob, commit)
+            self.assertIs(quitInstance.getContext(blob, commit), context)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+import unittest
+from context import quit
+from quit.cache import FileReference
+from quit.ntriples import parse_batches, parse_graph, parse_triples
+from rdflib import BNode, Graph, Literal, URIRef
+from rdflib.compare import isomorphic
+
+
+class NTriplesTests(unittest.TestCase):
+    DOCUMENT = '\n'.join([
+        '<http://ex.org/a> <http://ex.org/p> <http://ex.org/b> .',
+        '<http://ex.org/a> <http://ex.org/p> "plain" .',
+        '<http://ex.org/a> <http://ex.org/p> "" .',
+        '<http://ex.org/a> <http://ex.org/p> "x > y" .',
+        '<http://ex.org/a> <http://ex.org/p> "line\\nbreak \\"quoted\\" \\u00E4" .',
+        '<http://ex.org/a> <http://ex.org/p> "hallo"@de .',
+        '<http://ex.org/a> <http://ex.org/p> "1"^^<http://www.w3.org/2001/XMLSchema#integer> .',
+        '_:b1 <http://ex.org/p> _:b2 .',
+        '_:b2 <http://ex.org/p> "blank" .',
+        '# a comment',
+        '<http://ex.org/a>\t<http://ex.org/p>  <http://ex.org/c>  .',
+        '<http://ex.org/\\u00E4> <http://ex.org/p> <http://ex.org/d> .',
+        '<http://ex.org/a> <http://ex.org/p> "ü" . # trailing comment',
+        ''
+    ])
+
+    def rdflibGraph(self, data):
+        return Graph().parse(data=data, format='nt')
+
+    def testIsomorphicToRdflib(self):
+        graph = parse_graph(self.DOCUMENT)
+        self.assertEqual(len(graph), 12)
+        self.assertTrue(isomorphic(graph, self.rdflibGraph(self.DOCUMENT)))
+
+    def testBytesAndMemoryview(self):
+        data = self.DOCUMENT.encode('utf-8')
+        expected = self.rdflibGraph(self.DOCUMENT)
+        self.assertTrue(isomorphic(parse_graph(data), expected))
+        self.assertTrue(isomorphic(parse_graph(memoryview(data)), expected))
+        self.assertTrue(isomorphic(parse_graph(bytearray(data)), expected))
+
+    def testTerms(self):
+        triples = list(parse_triples(
+            b'<urn:a> <urn:p> "x"@en .\n'
+            b'<urn:a> <urn:p> "1"^^<http://www.w3.org/2001/XMLSchema#integer> .\n'
+            b'_:x <urn:p> _:x .\n'))
+        self.assertEqual(triples[0], (URIRef('urn:a'), URIRef('urn:p'), Literal('x', lang='en')))
+        self.assertEqual(triples[1][2], Literal(1))
+        self.assertIsInstance(triples[2][0], BNode)
+        # a label denotes the same blank node within a document
+        self.assertEqual(triples[2][0], triples[2][2])
+
+    def testBlankNodesAreLocalToDocument(self):
+        (first,) = parse_triples(b'_:x <urn:p> <urn:o> .\n')
+        (second,) = parse_triples(b'_:x <urn:p> <urn:o> .\n')
+        self.assertNotEqual(first[0], second[0])
+
+    def testInvalidLine(self):
+        with self.assertRaises(Exception):
+            list(parse_triples(b'<urn:a> <urn:p> .\n'))
+
+    def testBatches(self):
+        data = ''.join('<urn:s{}> <urn:p> <urn:o> .\n'.format(i) for i in range(25))
+        batches = list(parse_batches(data, size=10))
+        self.assertEqual([len(batch) for batch in batches], [10, 10, 5])
+
+    def testIntoGraph(self):
+        graph = Graph(identifier=URIRef('http://ex.org/'))
+        result = parse_graph(b'<urn:a> <urn:p> <urn:o> .\n', graph=graph)
+        self.assertIs(result, graph)
+        self.assertEqual(len(graph), 1)
+
+    def testFileReferenceNormalization(self):
+        canonical = '<urn:a> <urn:p> "a b" .\n<urn:b> <urn:p> <urn:o> .\n'
+        self.assertEqual(FileReference('a.nt', canonical).content, canonical)
+        other = '<urn:b>\t<urn:p>  <urn:o> .\r\n <urn:a> <urn:p> <urn:o> .'
+        self.assertEqual(FileReference('a.nt', other).content,
+                         '<urn:a> <urn:p> <urn:o> .\n<urn:b> <urn:p> <urn:o> .\n')
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+import io
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+from context import quit
+import quit.tools.evaluate
+from quit.tools import optimizer
+from quit.tools.algebra import translateQuery
+import rdflib.plugins.sparql
+from rdflib import ConjunctiveGraph, Literal, URIRef, Variable
+from rdflib.plugins.sparql import algebra, evaluate
+from rdflib.plugins.sparql.parser import parseQuery
+
+
+class OptimizerTests(unittest.TestCase):
+    """Compare the evaluation of the rewritten algebra with the evaluation of rdflib."""
+
+    def setUp(self):
+        # the patterns outside of GRAPH match the union of the graphs
+        union = mock.patch.object(rdflib.plugins.sparql, 'SPARQL_DEFAULT_GRAPH_UNION', True)
+        union.start()
+        self.addCleanup(union.stop)
+        self.graph = ConjunctiveGraph()
+        for g in range(3):
+            graph = self.graph.get_context(URIRef('urn:g{}'.format(g)))
+            for i in range(30):
+                s = URIRef('urn:s{}'.format(i))
+                graph.add((s, URIRef('urn:type'), URIRef('urn:C{}'.format(i % 3))))
+                graph.add((s, URIRef('urn:a'), Literal(i % 7 + g)))
+                if i % 2:
+                    graph.add((s, URIRef('urn:b'), URIRef('urn:s{}'.format(i // 2))))
+
+    def translate(self, query):
+        return translateQuery(parseQuery(query))
+
+    def assertQuery(self, query):
+        result = quit.tools.evaluate.evalQuery(self.graph, self.translate(query), {})
+        expected = evaluate.evalQuery(
+            self.graph, algebra.translateQuery(parseQuery(query)), {})
+        rows = sorted(sorted(row.items()) for row in result['bindings'])
+        self.assertEqual(rows, sorted(sorted(row.items()) for row in expected['bindings']))
+        return rows
+
+    def find(self, part, name):
+        """Return all nodes with the given name."""
+        res = []
+        if isinstance(part, list):
+            for x in part:
+                res.extend(self.find(x, name))
+        elif isinstance(part, dict):
+            if getattr(part, 'name', None) == name:
+                res.append(part)
+            for k, v in part.items():
+                if k != '_vars':
+                    res.extend(self.find(v, name))
+        return res
+
+    def testFilterPushdown(self):
+        query = """SELECT * WHERE {
+                ?s <urn:a> ?a OPTIONAL { ?s <urn:b> ?b } ?b <urn:a> ?c FILTER (?a > 3 && ?c < 4)
+            }"""
+        self.assertQuery(query)
+        join = self.translate(query).algebra.p.p
+        self.assertEqual(join.name, 'Join')
+        self.assertEqual(join.p1.p1.name, 'Filter')
+        self.assertEqual(join.p2.name, 'Filter')
+
+        # the variable of the second part may be bound by the optional part
+        query = """SELECT * WHERE {
+                ?s <urn:a> ?a OPTIONAL { ?s <urn:b> ?b } ?b <urn:a> ?c FILTER (?b != <urn:s1>)
+            }"""
+        self.assertQuery(query)
+        self.assertEqual(self.translate(query).algebra.p.p.p2.name, 'Filter')
+
+    def testOptionalFilter(self):
+        query = """SELECT * WHERE {
+                ?s <urn:a> ?a OPTIONAL { ?s <urn:b> ?b . ?b <urn:a> ?c FILTER (?c > 4) }
+            }"""
+        self.assertQuery(query)
+        leftjoin = self.translate(query).algebra.p.p
+        self.assertEqual(leftjoin.p2.name, 'Filter')
+        self.assertEqual(leftjoin.expr.name, 'TrueFilter')
+
+        # the condition uses a variable of the first part
+        query = """SELECT * WHERE {
+                ?s <urn:a> ?a OPTIONAL { ?s <urn:b> ?b . ?b <urn:a> ?c FILTER (?c > ?a) }
+            }"""
+        self.assertQuery(query)
+        self.assertEqual(self.translate(query).algebra.p.p.expr.name, 'RelationalExpression')
+
+    def testEquality(self):
+        query = """SELECT * WHERE {
+                ?s <urn:type> ?c ; <urn:a> ?a FILTER (?c = <urn:C1>)
+            }"""
+        self.assertEqual(len(self.assertQuery(query)), 30)
+        bgp, = self.find(self.translate(query).algebra, 'BGP')
+        self.assertNotIn(Variable('c'), set(t for triple in bgp.triples for t in triple))
+        self.assertEqual(self.find(self.translate(query).algebra, 'Filter'), [])
+
+        # = compares literals by their value, only sameTerm can be substituted
+        query = 'SELECT * WHERE { ?s <urn:a> ?a FILTER (?a = 3.0) }'
+        self.assertEqual(len(self.assertQuery(query)), 13)
+        self.assertEqual(len(self.find(self.translate(query).algebra, 'Filter')), 1)
+        query = 'SELECT * WHERE { ?s <urn:a> ?a FILTER (sameTerm(?a, 3)) }'
+        self.assertEqual(len(self.assertQuery(query)), 13)
+        self.assertEqual(self.find(self.translate(query).algebra, 'Filter'), [])
+
+    def testEqualityBoundVariable(self):
+        # ?c is bound by the optional part before the substituted pattern is evaluated
+        query = """SELECT * WHERE {
+                ?s <urn:a> ?a OPTIONAL { ?s <urn:type> ?c } ?x <urn:type> ?c
+                FILTER (?c = <urn:C1>)
+            }"""
+        self.assertQuery(query)
+
+    def testGraph(self):
+        query = """SELECT * WHERE {
+                GRAPH ?g { ?s <urn:a> ?a } FILTER (?g = <urn:g1> && ?a > 5)
+            }"""
+        self.assertEqual(len(self.assertQuery(query)), 8)
+        graph, = self.find(self.translate(query).algebra, 'Graph')
+        self.assertEqual(graph.term, URIRef('urn:g1'))
+        self.assertEqual(graph.p.name, 'Filter')
+
+    def testGraphVariableInPattern(self):
+        graph = self.graph.get_context(URIRef('urn:g'))
+        graph.add((URIRef('urn:s1'), URIRef('urn:p'), URIRef('urn:g')))
+        graph.add((URIRef('urn:s2'), URIRef('urn:p'), URIRef('urn:g')))
+        graph.add((URIRef('urn:g'), URIRef('urn:q'), URIRef('urn:x')))
+        graph.add((URIRef('urn:x'), URIRef('urn:q'), URIRef('urn:y')))
+
+        query = """SELECT * WHERE {
+                GRAPH ?g { ?s <urn:p> ?g MINUS { ?g <urn:q> ?x } } FILTER (?g = <urn:g>)
+            }"""
+        self.assertEqual(self.assertQuery(query), [])
+
+        # the optional part may bind the variable to another graph
+        query = """SELECT * WHERE {
+                GRAPH ?g { ?s <urn:q> ?o OPTIONAL { ?o <urn:q> ?g } } FILTER (?g = <urn:g>)
+            }"""
+        self.assertEqual(len(self.assertQuery(query)), 1)
+
+    def testConstantFolding(self):
+        query = 'SELECT * WHERE { ?s <urn:a> ?a FILTER (?a > 2 * 2 && 1 < 2) }'
+        self.assertQuery(query)
+        filter, = self.find(self.translate(query).algebra, 'Filter')
+        self.assertEqual(filter.expr.other.toPython(), 4)
+
+        query = 'SELECT * WHERE { ?s <urn:a> ?a FILTER (1 > 2) }'
+        self.assertEqual(self.assertQuery(query), [])
+        self.assertEqual(self.find(self.translate(query).algebra, 'BGP'), [])
+
+        query = """SELECT * WHERE {
+                ?s <urn:a> ?a BIND (CONCAT("a", "b") AS ?c) FILTER (?c = "ab")
+            }"""
+        self.assertEqual(len(self.assertQuery(query)), 90)
+        self.assertEqual(self.translate(query).algebra.p.p.p.expr, Literal('ab'))
+
+        # random values are not folded
+        query = 'SELECT * WHERE { ?s <urn:a> ?a BIND (RAND() AS ?r) }'
+        self.assertNotIsInstance(self.translate(query).algebra.p.p.expr, Literal)
+
+    def testProjection(self):
+        query = """SELECT ?s WHERE {
+                ?s <urn:a> ?a ; <urn:b> ?b . ?b <urn:type> ?c
+            } ORDER BY ?a ?s"""
+        self.assertEqual(len(self.assertQuery(query)), 45)
+        orderby = self.translate(query).algebra.p.p
+        self.assertEqual(orderby.p.name, 'Project')
+        self.assertEqual(set(orderby.p.PV), {Variable('s'), Variable('a')})
+
+        # all variables are used
+        query = 'SELECT * WHERE { ?s <urn:a> ?a } ORDER BY ?a'
+        self.assertEqual(self.translate(query).algebra.p.p.p.name, 'BGP')
+
+    def testLimit(self):
+        query = """SELECT ?s WHERE {
+                ?s <urn:a> ?a ; <urn:b> ?b
+            } ORDER BY ?a ?s LIMIT 5 OFFSET 10"""
+        self.assertEqual(len(self.assertQuery(query)), 5)
+        orderby, = self.find(self.translate(query).algebra, 'OrderBy')
+        self.assertEqual(orderby.limit, 15)
+        # only a few solutions are kept, the projection would only cost time
+        self.assertEqual(orderby.p.name, 'BGP')
+
+        query = 'SELECT DISTINCT ?a WHERE { ?s <urn:a> ?a } ORDER BY ?a LIMIT 5'
+        orderby, = self.find(self.translate(query).algebra, 'OrderBy')
+        self.assertIsNone(orderby.limit)
+
+    def testUnion(self):
+        query = """SELECT * WHERE {
+                { ?s <urn:type> <urn:C0> } UNION { ?s <urn:type> <urn:C1> }
+                UNION { ?s <urn:b> <urn:s1> } FILTER (?s != <urn:s3>)
+            }"""
+        self.assertQuery(query)
+        union, = self.find(self.translate(query).algebra, 'Union')
+        self.assertEqual(len(union['parts']), 3)
+        self.assertTrue(all(part.name == 'Filter' for part in union['parts']))
+
+    def testExists(self):
+        query = """SELECT * WHERE {
+                ?s <urn:a> ?a OPTIONAL { ?s <urn:b> ?b }
+                FILTER (?a > 2 && NOT EXISTS { ?s <urn:type> <urn:C1> })
+            }"""
+        self.assertQuery(query)
+
+    def testSubSelect(self):
+        query = """SELECT * WHERE {
+                ?s <urn:type> ?c
+                { SELECT ?s (MAX(?a) AS ?m) WHERE { ?s <urn:a> ?a } GROUP BY ?s }
+                FILTER (?m > 5 && ?c = <urn:C2>)
+            }"""
+        self.assertQuery(query)
+
+    def testDebug(self):
+        output = io.StringIO()
+        with mock.patch.object(optimizer, 'DEBUG', True), redirect_stdout(output):
+            self.translate('SELECT * WHERE { ?s <urn:a> ?a FILTER (?a = 1 + 1) }')
+        self.assertEqual(output.getvalue().count('SelectQuery('), 2)
+        self.assertIn('op = [\'+\']', output.getvalue())
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
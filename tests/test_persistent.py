@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import random
+import unittest
+from context import quit
+from quit.persistent import PersistentSortedSet
+
+
+def nodes(node, result=None):
+    result = set() if result is None else result
+    result.add(id(node))
+    for child in node.children or []:
+        nodes(child, result)
+    return result
+
+
+class PersistentSortedSetTests(unittest.TestCase):
+    def testInit(self):
+        items = PersistentSortedSet(['c', 'a', 'b', 'a'])
+        self.assertEqual(list(items), ['a', 'b', 'c'])
+        self.assertEqual(len(items), 3)
+        self.assertIn('b', items)
+        self.assertNotIn('d', items)
+        self.assertFalse(PersistentSortedSet())
+        self.assertEqual(list(PersistentSortedSet()), [])
+
+    def testVersionsAreIndependent(self):
+        random.seed(1)
+        expected = set()
+        items = PersistentSortedSet()
+        versions = []
+        for step in range(5000):
+            item = random.randint(0, 1000)
+            if random.random() < 0.6:
+                expected.add(item)
+                items = items.add(item)
+            else:
+                expected.discard(item)
+                items = items.discard(item)
+            if step % 500 == 0:
+                versions.append((set(expected), items))
+
+        for expected, items in versions:
+            self.assertEqual(list(items), sorted(expected))
+            self.assertEqual(len(items), len(expected))
+            for item in range(-1, 1002):
+                self.assertEqual(item in items, item in expected)
+
+    def testUnchangedSetIsReturned(self):
+        items = PersistentSortedSet(range(10))
+        self.assertIs(items.add(5), items)
+        self.assertIs(items.discard(11), items)
+
+    def testModificationSharesNodes(self):
+        items = PersistentSortedSet(range(100000))
+        modified = items.add(500.5).discard(70000)
+        shared = nodes(items._root) & nodes(modified._root)
+        self.assertLess(len(nodes(modified._root) - shared), 10)
+        self.assertEqual(len(modified), 100000)
+        self.assertIn(70000, items)
+        self.assertNotIn(500.5, items)
+
+    def testRemoveAll(self):
+        items = PersistentSortedSet(range(1000))
+        for item in range(0, 1000, 2):
+            items = items.discard(item)
+        self.assertEqual(list(items), list(range(1, 1000, 2)))
+        for item in range(1, 1000, 2):
+            items = items.discard(item)
+        self.assertEqual(len(items), 0)
+        self.assertEqual(list(items.add('a')), ['a'])
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import os
+import unittest
+from context import quit
+import quit.conf
+import quit.core
+import quit.git
+from quit.graphs import InMemoryAggregatedGraph, SnapshotGraph
+from quit.ntriples import parse_graph, parse_triples
+from quit.snapshot import SnapshotIndex, SnapshotStore, numpy
+from helpers import TemporaryRepositoryFactory
+from rdflib import Literal, URIRef, plugin
+from rdflib.graph import ModificationException
+from rdflib.query import Processor
+from tempfile import TemporaryDirectory
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class SnapshotTests(unittest.TestCase):
+    DOCUMENT = ''.join(
+        '<urn:s{}> <urn:p{}> "{}" .\n<urn:s{}> <urn:p{}> <urn:s{}> .\n_:b{} <urn:p0> "x"@en .\n'
+        .format(i % 13, i % 4, i % 9, i % 13, i % 3, i % 17, i % 5) for i in range(300))
+
+    def setUp(self):
+        plugin.register('sparql', Processor, 'quit.tools.processor', 'SPARQLProcessor')
+        self.expected = parse_graph(self.DOCUMENT)
+        self.index = SnapshotIndex.build(self.expected)
+
+    def patterns(self):
+        for s, p, o in list(self.expected)[::11]:
+            for mask in range(8):
+                yield (s if mask & 1 else None, p if mask & 2 else None, o if mask & 4 else None)
+
+    def assertMatches(self, graph):
+        self.assertEqual(len(graph), len(self.expected))
+        for pattern in self.patterns():
+            self.assertEqual(set(graph.triples(pattern)), set(self.expected.triples(pattern)))
+            self.assertEqual(graph.index.count(pattern), len(set(self.expected.triples(pattern))))
+        self.assertEqual(list(graph.triples((URIRef('urn:unknown'), None, None))), [])
+
+    def testTriples(self):
+        self.assertMatches(SnapshotGraph(self.index, URIRef('http://example.org/')))
+
+    def testBlocks(self):
+        blocks = list(self.index.blocks((None, None, None), size=100))
+        self.assertEqual([len(block) for block in blocks[:-1]], [100] * (len(blocks) - 1))
+        self.assertEqual(set(t for block in blocks for t in block), set(self.expected))
+
+    def testStore(self):
+        with TemporaryDirectory() as directory:
+            store = SnapshotStore(directory)
+            with self.assertRaises(KeyError):
+                store.get('abcdef')
+            store.set('abcdef', self.index)
+            store.set('abcdef', self.index)
+            index = store.get('abcdef')
+            self.assertIsInstance(index.arrays['spo'], numpy.memmap)
+            self.assertMatches(SnapshotGraph(index, URIRef('http://example.org/')))
+
+            with open(os.path.join(directory, 'ab', 'cdef', 'terms'), 'wb') as f:
+                f.write(b'damaged')
+            with self.assertRaises(KeyError):
+                store.get('abcdef')
+            self.assertFalse(os.path.exists(os.path.join(directory, 'ab', 'cdef')))
+
+    def testReadOnly(self):
+        graph = SnapshotGraph(self.index, URIRef('http://example.org/'))
+        with self.assertRaises(ModificationException):
+            graph.add((URIRef('urn:a'), URIRef('urn:b'), URIRef('urn:c')))
+
+    def testQuery(self):
+        graph = SnapshotGraph(self.index, URIRef('http://example.org/'))
+        query = 'SELECT ?a ?b ?c ?d WHERE { ?a <urn:p1> ?b . ?b <urn:p2> ?c . ?a <urn:p0>* ?d }'
+        self.assertEqual(set(graph.query(query)), set(self.expected.query(query)))
+
+        dataset = InMemoryAggregatedGraph(graphs=[graph], identifier='default')
+        query = 'SELECT ?a ?c WHERE { GRAPH ?g { ?a <urn:p1> ?b . ?b <urn:p2> ?c } }'
+        expected = 'SELECT ?a ?c WHERE { ?a <urn:p1> ?b . ?b <urn:p2> ?c }'
+        self.assertEqual(set(dataset.query(query)), set(self.expected.query(expected)))
+
+    def testQuitUsesSnapshots(self):
+        content = '<urn:x> <urn:y> <urn:z> .\n<urn:x> <urn:y> "z" .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo, \
+                TemporaryDirectory() as directory:
+            conf = quit.conf.QuitStoreConfiguration(
+                features=quit.conf.Feature.Unknown, namespace='http://quit.instance/',
+                targetdir=repo.workdir, snapshotindex=directory)
+            quitInstance = quit.core.Quit(conf, quit.git.Repository(repo.workdir),
+                                          quit.core.MemoryStore())
+            commit = quit.git.Repository(repo.workdir).revision('master')
+            blob, = quitInstance.getFilesForCommit(commit)
+            graph = quitInstance.getContext(blob, commit)
+            self.assertIsInstance(graph, SnapshotGraph)
+            self.assertEqual(graph.identifier, URIRef('http://example.org/'))
+            self.assertIn((URIRef('urn:x'), URIRef('urn:y'), Literal('z')), graph)
+            self.assertTrue(os.path.isdir(os.path.join(directory, str(blob[1])[:2])))
+
+            instance, _ = quitInstance.instance('master')
+            result = instance.query('SELECT ?o WHERE { GRAPH ?g { <urn:x> <urn:y> ?o } }')
+            self.assertEqual(len(result), 2)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest import mock
+from context import quit
+import quit.conf
+import quit.core
+import quit.git
+import quit.statistics
+from helpers import TemporaryRepositoryFactory
+from quit.helpers import parse_update_type
+from quit.graphs import InMemoryAggregatedGraph, LazyGraph, OverlayGraph
+from quit.statistics import GraphStatistics, StatisticsCatalog, graphStatistics
+from quit.tools.algebra import reorderTriples
+from rdflib import Graph, Literal, URIRef, Variable, plugin
+from rdflib.namespace import RDF
+from rdflib.query import Processor, UpdateProcessor
+from tempfile import TemporaryDirectory
+
+
+class GraphStatisticsTests(unittest.TestCase):
+
+    def setUp(self):
+        plugin.register('sparql', Processor, 'quit.tools.processor', 'SPARQLProcessor')
+        self.graph = Graph(identifier=URIRef('urn:g'))
+        for i in range(100):
+            book = URIRef('urn:book{}'.format(i))
+            self.graph.add((book, RDF.type, URIRef('urn:Book')))
+            self.graph.add((book, URIRef('urn:title'), Literal('Title {}'.format(i % 50))))
+        self.graph.add((URIRef('urn:book7'), URIRef('urn:isbn'), Literal('3-16-148410-0')))
+
+    def testFromTriples(self):
+        statistics = GraphStatistics.fromTriples(self.graph)
+        self.assertEqual(statistics.triples, 201)
+        self.assertEqual(statistics.subjects, 100)
+        self.assertEqual(statistics.objects, 52)
+        self.assertEqual(statistics.predicates[RDF.type], [100, 100, 1])
+        self.assertEqual(statistics.predicates[URIRef('urn:title')], [100, 100, 50])
+        self.assertEqual(statistics.predicates[URIRef('urn:isbn')], [1, 1, 1])
+
+    def testApplyChanges(self):
+        statistics = GraphStatistics.fromTriples(self.graph)
+        overlay = OverlayGraph(self.graph)
+        additions = [(URIRef('urn:book1'), URIRef('urn:isbn'), Literal('0')),
+                     (URIRef('urn:new'), RDF.type, URIRef('urn:Book')),
+                     (URIRef('urn:new'), URIRef('urn:title'), Literal('Title 3'))]
+        removals = [(URIRef('urn:book7'), URIRef('urn:isbn'), Literal('3-16-148410-0')),
+                    (URIRef('urn:book3'), URIRef('urn:title'), Literal('Title 3')),
+                    (URIRef('urn:book0'), URIRef('urn:title'), Literal('Title 0')),
+                    (URIRef('urn:book50'), URIRef('urn:title'), Literal('Title 0'))]
+        overlay += additions
+        overlay -= removals
+        changesets = [[('additions', additions)], [('removals', removals)]]
+
+        result = statistics.applyChanges(self.graph, overlay, changesets)
+        expected = GraphStatistics.fromTriples(overlay)
+        self.assertEqual(result.triples, expected.triples)
+        self.assertEqual(result.subjects, expected.subjects)
+        self.assertEqual(result.objects, expected.objects)
+        self.assertEqual(result.predicates, expected.predicates)
+        self.assertEqual(statistics.triples, 201)
+
+        # a predicate without triples is dropped
+        overlay -= [(URIRef('urn:book1'), URIRef('urn:isbn'), Literal('0'))]
+        result = result.applyChanges(
+            self.graph, overlay, [[('removals', [(URIRef('urn:book1'), URIRef('urn:isbn'),
+                                                  Literal('0'))])]])
+        self.assertNotIn(URIRef('urn:isbn'), result.predicates)
+
+    def testEstimate(self):
+        statistics = GraphStatistics.fromTriples(self.graph)
+        self.assertEqual(statistics.estimate(None, None, None), 201)
+        self.assertEqual(statistics.estimate(None, RDF.type, None), 100)
+        self.assertEqual(statistics.estimate(None, RDF.type, URIRef('urn:Book')), 100)
+        self.assertEqual(statistics.estimate(True, URIRef('urn:title'), None), 1)
+        self.assertEqual(statistics.estimate(None, URIRef('urn:title'), True), 2)
+        self.assertEqual(statistics.estimate(None, URIRef('urn:unknown'), None), 0)
+        self.assertEqual(statistics.estimate(None, True, None), 67)
+
+    def testAdd(self):
+        statistics = GraphStatistics.fromTriples(self.graph)
+        other = GraphStatistics.fromTriples(
+            [(URIRef('urn:a'), RDF.type, URIRef('urn:Book')), (URIRef('urn:a'), RDF.value, None)])
+        combined = statistics + other
+        self.assertEqual(combined.triples, 203)
+        self.assertEqual(combined.predicates[RDF.type], [101, 101, 2])
+        self.assertEqual(combined.predicates[RDF.value], [1, 1, 1])
+        self.assertEqual(statistics.predicates[RDF.type], [100, 100, 1])
+
+    def testGraphStatistics(self):
+        statistics = graphStatistics(self.graph)
+        self.assertIs(graphStatistics(self.graph), statistics)
+
+        lazy = LazyGraph(URIRef('urn:g'), lambda: self.graph)
+        self.assertIs(graphStatistics(lazy), statistics)
+
+        overlay = OverlayGraph(self.graph)
+        overlay.add((URIRef('urn:a'), URIRef('urn:isbn'), Literal('0')))
+        self.assertEqual(graphStatistics(overlay).predicates[URIRef('urn:isbn')], [2, 2, 2])
+        self.assertEqual(statistics.predicates[URIRef('urn:isbn')], [1, 1, 1])
+
+        other = Graph(identifier=URIRef('urn:h'))
+        other.add((URIRef('urn:a'), RDF.type, URIRef('urn:Book')))
+        dataset = InMemoryAggregatedGraph(graphs=[self.graph, other])
+        self.assertEqual(graphStatistics(dataset).predicates[RDF.type], [101, 101, 2])
+
+    def testProvidedStatistics(self):
+        self.graph.statistics = GraphStatistics(triples=5)
+        self.assertEqual(graphStatistics(self.graph).triples, 5)
+
+    def testReorderTriples(self):
+        statistics = GraphStatistics.fromTriples(self.graph)
+        s, c, t, x = Variable('s'), Variable('c'), Variable('t'), Variable('x')
+        patterns = [(s, RDF.type, c), (s, URIRef('urn:title'), t), (s, URIRef('urn:isbn'), x)]
+        self.assertEqual(reorderTriples(patterns, statistics),
+                         [patterns[2], patterns[0], patterns[1]])
+        # without statistics all patterns look alike
+        self.assertEqual(reorderTriples(patterns)[0][1], RDF.type)
+
+        # a bound variable makes a pattern selective, the predicate of a bound variable as well
+        p = Variable('p')
+        patterns = [(s, RDF.type, c), (s, p, t)]
+        self.assertEqual(reorderTriples(patterns, statistics, {p: URIRef('urn:isbn')})[0],
+                         patterns[1])
+        self.assertEqual(reorderTriples(patterns, statistics, {c: URIRef('urn:Book')})[0],
+                         patterns[0])
+
+    def testQuery(self):
+        query = """SELECT ?s ?t WHERE {
+                ?s a ?c . ?s <urn:title> ?t . ?s <urn:isbn> "3-16-148410-0"
+            }"""
+        self.assertEqual(list(self.graph.query(query)),
+                         [(URIRef('urn:book7'), Literal('Title 7'))])
+
+
+class StatisticsCatalogTests(unittest.TestCase):
+
+    def setUp(self):
+        plugin.register('sparql', Processor, 'quit.tools.processor', 'SPARQLProcessor')
+        plugin.register('sparql', UpdateProcessor, 'quit.tools.processor', 'SPARQLUpdateProcessor')
+
+    def testCatalog(self):
+        content = '<urn:x> <urn:y> <urn:z> .\n<urn:x> <urn:y> "z" .\n<urn:z> <urn:w> "z" .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo:
+            conf = quit.conf.QuitStoreConfiguration(
+                features=quit.conf.Feature.Unknown, namespace='http://quit.instance/',
+                targetdir=repo.workdir)
+            quitInstance = quit.core.Quit(conf, quit.git.Repository(repo.workdir),
+                                          quit.core.MemoryStore())
+
+            # the statistics of a blob are computed when it is parsed
+            (iri, (oid, statistics)), = quitInstance.commitStatistics('master').items()
+            self.assertEqual(iri, URIRef('http://example.org/'))
+            self.assertIn(oid, quitInstance.statistics)
+            self.assertEqual(statistics.triples, 3)
+            self.assertEqual(statistics.predicates[URIRef('urn:y')], [2, 1, 2])
+
+            # the statistics of a commit are derived from the changes
+            update = """DELETE DATA { GRAPH <http://example.org/> { <urn:x> <urn:y> "z" } } ;
+                INSERT DATA {
+                    GRAPH <http://example.org/> { <urn:a> <urn:y> <urn:b> }
+                    GRAPH <http://example.org/new/> { <urn:a> <urn:y> <urn:b> }
+                }"""
+            _, parsedQuery = parse_update_type(update)
+            with mock.patch.object(GraphStatistics, 'fromTriples',
+                                   wraps=GraphStatistics.fromTriples) as fromTriples:
+                quitInstance.applyQueryOnCommit(parsedQuery, 'master', 'refs/heads/master')
+            # only for the new graph
+            self.assertEqual(fromTriples.call_count, 1)
+
+            with mock.patch.object(quit.statistics.GraphStatistics, 'fromTriples',
+                                   side_effect=AssertionError):
+                graphs = quitInstance.commitStatistics('master')
+                instance, _ = quitInstance.cachedInstance('master')
+                result = instance.query(
+                    'SELECT ?s WHERE { GRAPH ?g { ?s <urn:y> <urn:b> . ?s <urn:y> ?o } }')
+                self.assertEqual(len(result), 2)
+            statistics = graphs[URIRef('http://example.org/')][1]
+            self.assertEqual(statistics.triples, 3)
+            self.assertEqual(statistics.subjects, 3)
+            self.assertEqual(statistics.objects, 3)
+            self.assertEqual(statistics.predicates[URIRef('urn:y')], [2, 2, 2])
+            self.assertEqual(graphs[URIRef('http://example.org/new/')][1].triples, 1)
+
+    def testCatalogCapacity(self):
+        catalog = StatisticsCatalog(capacity=2)
+        statistics = GraphStatistics(3, 2, 2, {URIRef('urn:p'): [3, 2, 2]})
+        catalog.set('a', statistics)
+        catalog.set('b', statistics)
+        catalog.get('a')
+        catalog.set('c', statistics)
+        self.assertEqual(len(catalog), 2)
+        self.assertIn('a', catalog)
+        self.assertNotIn('b', catalog)
+        self.assertRaises(KeyError, catalog.get, 'b')
+
+    def testCatalogPath(self):
+        statistics = GraphStatistics(3, 2, 2, {URIRef('urn:p'): [2, 2, 1], RDF.type: [1, 1, 1]})
+        with TemporaryDirectory() as directory:
+            catalog = StatisticsCatalog(capacity=1, path=directory)
+            catalog.set('a', statistics)
+            catalog.set('b', GraphStatistics())
+            self.assertEqual(len(catalog), 1)
+
+            # evicted and restarted catalogs read the statistics from their files
+            for catalog in [catalog, StatisticsCatalog(path=directory)]:
+                restored = catalog.get('a')
+                self.assertEqual(restored.triples, statistics.triples)
+                self.assertEqual(restored.subjects, statistics.subjects)
+                self.assertEqual(restored.objects, statistics.objects)
+                self.assertEqual(restored.predicates, statistics.predicates)
+                self.assertNotIn('c', catalog)
+
+    def testCatalogSurvivesRestart(self):
+        content = '<urn:x> <urn:y> <urn:z> .\n<urn:x> <urn:y> "z" .\n<urn:z> <urn:w> "z" .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo, \
+                TemporaryDirectory() as directory:
+            conf = quit.conf.QuitStoreConfiguration(
+                features=quit.conf.Feature.Unknown, namespace='http://quit.instance/',
+                targetdir=repo.workdir, blobcache=directory + '/blobs')
+            quitInstance = quit.core.Quit(conf, quit.git.Repository(repo.workdir),
+                                          quit.core.MemoryStore())
+            expected = quitInstance.commitStatistics('master')
+
+            quitInstance = quit.core.Quit(conf, quit.git.Repository(repo.workdir),
+                                          quit.core.MemoryStore())
+            with mock.patch.object(quit.statistics.GraphStatistics, 'fromTriples',
+                                   side_effect=AssertionError):
+                graphs = quitInstance.commitStatistics('master')
+            (oid, statistics), = graphs.values()
+            self.assertEqual(oid, expected[URIRef('http://example.org/')][0])
+            self.assertEqual(statistics.triples, 3)
+            self.assertEqual(statistics.predicates[URIRef('urn:y')], [2, 1, 2])
+
+    def testCatalogModify(self):
+        content = '<urn:x> <urn:y> <urn:z> .\n<urn:x> <urn:y> "z" .\n<urn:z> <urn:w> "z" .'
+        with TemporaryRepositoryFactory().withGraphs({'http://example.org/': content}) as repo:
+            conf = quit.conf.QuitStoreConfiguration(
+                features=quit.conf.Feature.Unknown, namespace='http://quit.instance/',
+                targetdir=repo.workdir)
+            quitInstance = quit.core.Quit(conf, quit.git.Repository(repo.workdir),
+                                          quit.core.MemoryStore())
+            quitInstance.commitStatistics('master')
+
+            # two solutions, which insert a triple of the graph and the same new triple
+            update = """INSERT {
+                    GRAPH <http://example.org/> { <urn:x> <urn:y> <urn:z> . ?s <urn:n> "1" }
+                }
+                WHERE { GRAPH <http://example.org/> { ?s <urn:y> ?o } }"""
+            _, parsedQuery = parse_update_type(update)
+            quitInstance.applyQueryOnCommit(parsedQuery, 'master', 'refs/heads/master')
+
+            (_, statistics), = quitInstance.commitStatistics('master').values()
+            instance, _ = quitInstance.cachedInstance('master')
+            expected = GraphStatistics.fromTriples(
+                instance.store.get_context(URIRef('http://example.org/')))
+            self.assertEqual(statistics.triples, 4)
+            self.assertEqual(statistics.subjects, expected.subjects)
+            self.assertEqual(statistics.objects, expected.objects)
+            self.assertEqual(statistics.predicates, expected.predicates)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+import gc
+import unittest
+from context import quit
+from quit.termstore import CompactStore, TermDictionary, compact_graph
+from rdflib import BNode, Graph, Literal, URIRef
+from rdflib.namespace import XSD
+
+
+class TermDictionaryTests(unittest.TestCase):
+    def testEncode(self):
+        dictionary = TermDictionary()
+        a = dictionary.encode(URIRef('urn:a'))
+        self.assertEqual(dictionary.encode(URIRef('urn:a')), a)
+        self.assertNotEqual(dictionary.encode(Literal('urn:a')), a)
+        self.assertEqual(dictionary.decode(a), URIRef('urn:a'))
+        self.assertIsNone(dictionary.lookup(URIRef('urn:b')))
+        self.assertEqual(len(dictionary), 2)
+
+    def testRelease(self):
+        dictionary = TermDictionary()
+        a = dictionary.encode(URIRef('urn:a'))
+        dictionary.encode(URIRef('urn:a'))
+        dictionary.release([a])
+        self.assertEqual(dictionary.lookup(URIRef('urn:a')), a)
+        dictionary.release([a])
+        self.assertIsNone(dictionary.lookup(URIRef('urn:a')))
+        self.assertEqual(len(dictionary), 0)
+        self.assertEqual(dictionary.encode(URIRef('urn:b')), a)
+        self.assertEqual(dictionary.decode(a), URIRef('urn:b'))
+
+
+class CompactStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.triples = [
+            (URIRef('urn:s{}'.format(i % 7)), URIRef('urn:p{}'.format(i % 3)),
+             Literal(i % 11) if i % 2 else URIRef('urn:s{}'.format(i % 5)))
+            for i in range(200)]
+        self.triples.append((BNode(), URIRef('urn:p0'), Literal('x', lang='en')))
+
+    def createGraphs(self):
+        expected = Graph()
+        graph = compact_graph(identifier=URIRef('http://example.org/'))
+        for triple in self.triples[:100]:
+            expected.add(triple)
+            graph.add(triple)
+        expected.addN(t + (expected,) for t in self.triples[100:])
+        graph.addN(t + (graph,) for t in self.triples[100:])
+        return expected, graph
+
+    def patterns(self):
+        for s, p, o in self.triples[::7]:
+            for mask in range(8):
+                yield (s if mask & 1 else None, p if mask & 2 else None, o if mask & 4 else None)
+
+    def testTriples(self):
+        expected, graph = self.createGraphs()
+        self.assertIsInstance(graph.store, CompactStore)
+        self.assertEqual(graph.identifier, URIRef('http://example.org/'))
+        self.assertEqual(len(graph), len(expected))
+        for pattern in self.patterns():
+            self.assertEqual(set(graph.triples(pattern)), set(expected.triples(pattern)), pattern)
+        self.assertEqual(list(graph.triples((URIRef('urn:unknown'), None, None))), [])
+        self.assertIn(self.triples[-1], graph)
+        self.assertNotIn((URIRef('urn:s1'), URIRef('urn:p0'), URIRef('urn:s6')), graph)
+
+    def testRemove(self):
+        expected, graph = self.createGraphs()
+        for pattern in [(URIRef('urn:s1'), None, None), (None, URIRef('urn:p2'), None),
+                        (None, None, Literal(3)), self.triples[0]]:
+            expected.remove(pattern)
+            graph.remove(pattern)
+            self.assertEqual(set(graph), set(expected))
+        graph.add(self.triples[0])
+        self.assertIn(self.triples[0], graph)
+        graph.remove((None, None, None))
+        self.assertEqual(len(graph), 0)
+
+    def testDuplicates(self):
+        graph = compact_graph()
+        triple = (URIRef('urn:a'), URIRef('urn:b'), Literal('1', datatype=XSD.integer))
+        graph.add(triple)
+        graph.add(triple)
+        self.assertEqual(len(graph), 1)
+        self.assertEqual(list(graph), [triple])
+
+    def testTermsAreShared(self):
+        first = compact_graph()
+        second = compact_graph()
+        term = URIRef('urn:shared')
+        first.add((term, term, term))
+        second.add((URIRef('urn:shared'), term, term))
+        self.assertIs(next(iter(first))[0], next(iter(second))[0])
+
+    def testTermsAreReleased(self):
+        dictionary = TermDictionary()
+        first = Graph(store=CompactStore(dictionary=dictionary))
+        second = Graph(store=CompactStore(dictionary=dictionary))
+        for triple in self.triples:
+            first.add(triple)
+            first.add(triple)
+        second.add(self.triples[0])
+        first.remove((URIRef('urn:s1'), None, None))
+        self.assertEqual(set(first), {t for t in self.triples if t[0] != URIRef('urn:s1')})
+
+        del first
+        gc.collect()
+        self.assertEqual(len(dictionary), len(set(self.triples[0])))
+        self.assertEqual(set(second), {self.triples[0]})
+        second.remove(self.triples[0])
+        self.assertEqual(len(dictionary), 0)
+
+    def testQueryAndSerialize(self):
+        graph = compact_graph()
+        graph.add((URIRef('urn:a'), URIRef('urn:b'), Literal('c')))
+        result = graph.query('SELECT ?o WHERE { <urn:a> <urn:b> ?o }')
+        self.assertEqual([row[0] for row in result], [Literal('c')])
+        self.assertIn('<urn:a> <urn:b> "c" .', graph.serialize(format='nt'))
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import os
+import unittest
+from context import quit
+from quit.wal import WriteAheadLog, serializeDelta, deserializeDelta
+from rdflib import BNode, Literal, URIRef
+from tempfile import TemporaryDirectory
+
+
+class WriteAheadLogTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'quit.wal')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def testAppendAndReopen(self):
+        log = WriteAheadLog(self.path)
+        self.assertEqual(log.append({'query': 'a'}), 1)
+        self.assertEqual(log.append({'query': 'b'}), 2)
+        log.close()
+
+        log = WriteAheadLog(self.path)
+        self.assertEqual([e['query'] for e in log.entries()], ['a', 'b'])
+        self.assertEqual(log.append({'query': 'c'}), 3)
+        log.close()
+
+    def testCheckpoint(self):
+        log = WriteAheadLog(self.path)
+        log.append({'query': 'a'})
+        log.append({'query': 'b'})
+        log.checkpoint(1)
+        self.assertEqual([e['query'] for e in log.entries()], ['b'])
+
+        log.checkpoint(2)
+        self.assertEqual(log.entries(), [])
+        self.assertEqual(os.path.getsize(self.path), 0)
+        log.close()
+
+        log = WriteAheadLog(self.path)
+        self.assertEqual(log.entries(), [])
+        self.assertEqual(log.append({'query': 'c'}), 3)
+        log.close()
+
+    def testSkipIncompleteEntry(self):
+        log = WriteAheadLog(self.path)
+        log.append({'query': 'a'})
+        log.close()
+        with open(self.path, 'a') as f:
+            f.write('{"query": "b", "seq')
+
+        log = WriteAheadLog(self.path)
+        self.assertEqual([e['query'] for e in log.entries()], ['a'])
+        log.close()
+
+    def testSerializeDelta(self):
+        triples = [(URIRef('urn:s'), URIRef('urn:p'), Literal('a\n"b"', lang='en')),
+                   (BNode('b0'), URIRef('urn:p'), Literal(1))]
+        delta = [{'type': 'INSERT',
+                  'delta': {URIRef('urn:graph'): [('additions', triples)],
+                            'default': [('removals', triples[:1])]}}]
+
+        self.assertEqual(deserializeDelta(serializeDelta(delta)), delta)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()